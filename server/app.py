@@ -14,6 +14,11 @@ import ssl
 from events.event_bp import events_bp 
 from config import Config
 from models import db
+from utils.experience_summary import register_summary_listeners
+from utils.local_cache import TieredCache
+from utils.performance_config import job_stats
+from services.mpesa_token import token_manager as mpesa_token_manager
+from services.payment_gateway import gateway_health
 from flask_restful import Resource
 
 # Import your resources
@@ -21,8 +26,8 @@ from resources.auth import GoogleAuth, Login, Register, ResetPassword, RequestPa
 from resources.user_info import UserInfo
 from resources.experiences import ExperienceList, ExperienceDetail, SlotList, SlotDetail
 from resources.checkin_resource import CheckinResource
-from resources.experiences_public import PublicExperienceList, PublicExperienceDetail, TrendingExperiences
-from resources.public_reservation_resource import PublicReservationResource, GetReservationsPublic, InstallmentReservationResource
+from resources.experiences_public import PublicExperienceList, PublicExperienceDetail, TrendingExperiences, ExperienceSuggestions, ExperienceFacets
+from resources.public_reservation_resource import PublicReservationResource, GetReservationsPublic, InstallmentReservationResource, ReservationRequestStatus
 from resources.mpesa_callback import MpesaCallbackResource, MpesaB2bDisbursementCallback, MpesaB2cDisbursementCallback, PaytrackCallback
 from resources.provider_reservations import ProviderReservationsOptimized
 from resources.refund_resource import RefundRequest, RefundRequestLists, RefundInitiate
@@ -34,8 +39,7 @@ from resources.review_resource import ExperienceReviewsResource, PostReviewResou
 from checkin_devices.auth import DeviceAuthorization, CheckIn, DeviceVerification, DeauthorizeDevice, AuthorizedDevices
 import sqlalchemy.pool
 from celery_app import celery
-import json
-from decimal import Decimal
+from utils.fast_json import DecimalEncoder
 
 from celery_app import init_celery
 bcrypt = Bcrypt()
@@ -54,19 +58,16 @@ def create_app():
 
     # Extensions
     db.init_app(app)
+    register_summary_listeners()  # keep experience_summaries (and, after commit, the search indexes) in sync
     app.config.update(
         CELERY_BROKER_URL= app.config["CELERY_BROKER_URL"],
         CELERY_RESULT_BACKEND=app.config["CELERY_RESULT_BACKEND"],
         BROKER_USE_SSL={"ssl_cert_reqs": ssl.CERT_NONE},
         CELERY_REDIS_BACKEND_USE_SSL={"ssl_cert_reqs": ssl.CERT_NONE}
     )
-    class DecimalEncoder(json.JSONEncoder):
-        def default(self, obj):
-            if isinstance(obj, Decimal):
-                return float(obj)
-            return super().default(obj)
-        
     app.json_encoder = DecimalEncoder
+    # Flask-RESTful encodes resource return values itself
+    app.config.setdefault("RESTFUL_JSON", {"cls": DecimalEncoder})
 
     celery = init_celery(app)
     bcrypt.init_app(app)
@@ -100,6 +101,14 @@ def create_app():
 
         # 🔹 Assign Redis client using that pool
         app.redis = redis.Redis(connection_pool=pool)
+
+    # ---- In-process LRU tier for hot public reads, invalidated over Redis pub/sub ----
+    app.tiered_cache = TieredCache(
+        cache,
+        redis_client=getattr(app, "redis", None),
+        maxsize=app.config.get("LOCAL_CACHE_MAXSIZE", 2048),
+        ttl=app.config.get("LOCAL_CACHE_TTL", 30),
+    )
     
     # ---- Google OAuth blueprint ----
     google_bp = make_google_blueprint(
@@ -123,11 +132,13 @@ def create_app():
     # Health check endpoint for Redis
     class HealthCheck(Resource):
         def get(self):
+            cache_stats = app.tiered_cache.stats()
             try:
                 app.redis.ping()
-                return {"status": "healthy", "redis": "connected"}, 200
+                return {"status": "healthy", "redis": "connected", "cache": cache_stats, "jobs": job_stats(),
+                        "mpesa_token": mpesa_token_manager.metrics(), "gateways": gateway_health()}, 200
             except redis.ConnectionError:
-                return {"status": "healthy", "redis": "disconnected"}, 200
+                return {"status": "healthy", "redis": "disconnected", "cache": cache_stats}, 200
 
     # Register all API resources (routes)
     api.add_resource(HealthCheck, '/health')
@@ -153,11 +164,14 @@ def create_app():
     api.add_resource(PublicExperienceList, "/public/experiences")
     api.add_resource(PublicExperienceDetail, "/public/experiences/<uuid:experience_id>")
     api.add_resource(TrendingExperiences, "/public/experiences/trending")
+    api.add_resource(ExperienceSuggestions, "/public/experiences/suggest")
+    api.add_resource(ExperienceFacets, "/public/experiences/facets")
     api.add_resource(GetReservationsPublic, "/public/experiences/my", "/public/experiences/my/<uuid:reservation_id>")
     
     
     # Public reservation endpoint
     api.add_resource(PublicReservationResource, "/public/reservations_request")
+    api.add_resource(ReservationRequestStatus, "/public/reservations_request/<uuid:collection_id>")
     api.add_resource(InstallmentReservationResource, "/public/partial_payment/<uuid:reservation_id>")
 
     # M-Pesa callback endpoint
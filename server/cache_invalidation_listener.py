@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Cache invalidation listener that runs as its own process next to the web
+and Celery containers. It consumes the database's cache_invalidate
+notifications and evicts the matching Redis cache entries.
+"""
+
+import logging
+import signal
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+from app import app
+from utils.invalidation_listener import InvalidationListener
+
+logging.basicConfig(level=logging.INFO)
+
+listener = InvalidationListener(app)
+
+
+def _shutdown(signum, frame):
+    listener.stop()
+
+
+if __name__ == '__main__':
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+    listener.run()
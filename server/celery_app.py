@@ -1,4 +1,5 @@
 from celery import Celery
+from celery.schedules import crontab
 import os
 from dotenv import load_dotenv
 load_dotenv()
@@ -17,9 +18,42 @@ celery.conf.update(
     enable_utc=True,
     imports=[
         'workers.initiate_mpesa',  # <-- import your task module here
+        'workers.catalogue_index',
+        'workers.scheduled',
+        'workers.callback_inbox',
+        'workers.reconciliation',
     ]
 )
 
+# Periodic tasks (run `celery -A app.celery beat`, see docker-compose.yml)
+celery.conf.beat_schedule = {
+    # Refresh hot catalogue entries before the 5 minute trending TTL runs out
+    'warm-catalogue-caches': {
+        'task': 'workers.warm_catalogue_caches',
+        'schedule': 240.0,
+    },
+    # Give back places held by payments that never called back (utils.inventory)
+    'release-expired-holds': {
+        'task': 'workers.release_expired_holds',
+        'schedule': 60.0,
+    },
+    # Fallback sweep of gateway callbacks (new entries queue their own run)
+    'process-callback-inbox': {
+        'task': 'workers.process_callback_inbox',
+        'schedule': 30.0,
+    },
+    # Settle payments whose gateway callback was lost (workers.reconciliation)
+    'reconcile-payments': {
+        'task': 'workers.reconcile_payments',
+        'schedule': 300.0,
+    },
+    # Nightly reconciliation of experience_summaries and the Redis search indexes
+    'reconcile-catalogue': {
+        'task': 'workers.reconcile_catalogue',
+        'schedule': crontab(hour=3, minute=30),
+    },
+}
+
 def init_celery(app):
     """Initialize Celery with existing Flask app"""
     class ContextTask(celery.Task):
@@ -28,6 +28,12 @@ class Config:
     CACHE_REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
     CACHE_DEFAULT_TIMEOUT = 300
     PROFILE_CACHE_TTL = 300
+    # per-worker in-process tier in front of Redis for hot public reads
+    LOCAL_CACHE_MAXSIZE = int(os.getenv("LOCAL_CACHE_MAXSIZE", 2048))
+    LOCAL_CACHE_TTL = int(os.getenv("LOCAL_CACHE_TTL", 30))
+
+    # payments: "celery" (one task per STK push) or "async" (workers.payment_dispatcher)
+    PAYMENT_DISPATCHER = os.getenv("PAYMENT_DISPATCHER", "celery")
 
     # Google
     GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID')
@@ -0,0 +1,51 @@
+"""experience summary destination/activity arrays
+
+Revision ID: 3d7a91c5e2b8
+Revises: 9c4e1b7f2a60
+Create Date: 2026-10-16 16:02:48.517309
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '3d7a91c5e2b8'
+down_revision = '9c4e1b7f2a60'
+branch_labels = None
+depends_on = None
+
+
+def _text_array(column):
+    return (
+        f"CASE json_typeof({column}) "
+        f"WHEN 'array' THEN ARRAY(SELECT btrim(item) FROM json_array_elements_text({column}) item WHERE btrim(item) <> '') "
+        f"WHEN 'string' THEN array_remove(ARRAY[btrim({column} #>> '{{}}')], '') "
+        f"ELSE '{{}}'::text[] END"
+    )
+
+
+def upgrade():
+    with op.batch_alter_table('experience_summaries', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('destinations', postgresql.ARRAY(sa.Text()), server_default='{}', nullable=False))
+        batch_op.add_column(sa.Column('activities', postgresql.ARRAY(sa.Text()), server_default='{}', nullable=False))
+
+    op.execute(f"""
+        UPDATE experience_summaries es
+        SET destinations = {_text_array('e.destinations')},
+            activities = {_text_array('e.activities')}
+        FROM experiences e
+        WHERE e.id = es.experience_id
+    """)
+
+    with op.batch_alter_table('experience_summaries', schema=None) as batch_op:
+        batch_op.create_index('idx_experience_summaries_destinations', ['destinations'], unique=False, postgresql_using='gin')
+        batch_op.create_index('idx_experience_summaries_activities', ['activities'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    with op.batch_alter_table('experience_summaries', schema=None) as batch_op:
+        batch_op.drop_index('idx_experience_summaries_activities', postgresql_using='gin')
+        batch_op.drop_index('idx_experience_summaries_destinations', postgresql_using='gin')
+        batch_op.drop_column('activities')
+        batch_op.drop_column('destinations')
@@ -0,0 +1,44 @@
+"""experience summary keyset sort indexes
+
+Revision ID: 5f0c2a9e7d41
+Revises: b38b93713109
+Create Date: 2026-10-16 11:04:27.552910
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5f0c2a9e7d41'
+down_revision = 'b38b93713109'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('experience_summaries', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('created_at', sa.DateTime(timezone=True), nullable=True))
+
+    op.execute("""
+        UPDATE experience_summaries es
+        SET created_at = e.created_at
+        FROM experiences e
+        WHERE e.id = es.experience_id
+    """)
+
+    with op.batch_alter_table('experience_summaries', schema=None) as batch_op:
+        batch_op.alter_column('created_at', existing_type=sa.DateTime(timezone=True), nullable=False)
+        batch_op.create_index('idx_experience_summaries_price_asc', ['status', 'min_price', 'experience_id'], unique=False)
+        batch_op.create_index('idx_experience_summaries_price_desc', ['status', sa.text('max_price DESC'), 'experience_id'], unique=False)
+        batch_op.create_index('idx_experience_summaries_popularity', ['status', sa.text('total_booked DESC'), sa.text('created_at DESC'), 'experience_id'], unique=False)
+        batch_op.create_index('idx_experience_summaries_availability', ['status', sa.text('available_slots DESC'), 'experience_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('experience_summaries', schema=None) as batch_op:
+        batch_op.drop_index('idx_experience_summaries_availability')
+        batch_op.drop_index('idx_experience_summaries_popularity')
+        batch_op.drop_index('idx_experience_summaries_price_desc')
+        batch_op.drop_index('idx_experience_summaries_price_asc')
+        batch_op.drop_column('created_at')
@@ -0,0 +1,79 @@
+"""cache invalidation notify triggers
+
+Revision ID: 7a2f5c9e1d04
+Revises: e61b0d4a8c37
+Create Date: 2026-10-16 18:41:27.604118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a2f5c9e1d04'
+down_revision = 'e61b0d4a8c37'
+branch_labels = None
+depends_on = None
+
+
+# Payloads are cache tags (utils.cache_tags); NOTIFY is only delivered on
+# commit and identical payloads within one transaction are collapsed.
+NOTIFY_FUNCTION = """
+    CREATE OR REPLACE FUNCTION notify_cache_invalidation()
+    RETURNS TRIGGER AS $$
+    DECLARE
+        row_data RECORD;
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            row_data := OLD;
+        ELSE
+            row_data := NEW;
+        END IF;
+
+        IF TG_TABLE_NAME = 'experiences' THEN
+            PERFORM pg_notify('cache_invalidate', 'experience:' || row_data.id::text);
+            PERFORM pg_notify('cache_invalidate', 'catalogue');
+        ELSIF TG_TABLE_NAME = 'users' THEN
+            PERFORM pg_notify('cache_invalidate', 'provider:' || row_data.id::text);
+        ELSE
+            -- slots / reviews belong to an experience
+            PERFORM pg_notify('cache_invalidate', 'experience:' || row_data.experience_id::text);
+            IF TG_OP = 'UPDATE' AND OLD.experience_id IS DISTINCT FROM NEW.experience_id THEN
+                PERFORM pg_notify('cache_invalidate', 'experience:' || OLD.experience_id::text);
+            END IF;
+            -- A new or removed slot can change which experiences are upcoming
+            IF TG_TABLE_NAME = 'slots' AND TG_OP <> 'UPDATE' THEN
+                PERFORM pg_notify('cache_invalidate', 'catalogue');
+            END IF;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+
+def upgrade():
+    op.execute(NOTIFY_FUNCTION)
+    for table in ('experiences', 'slots', 'reviews'):
+        op.execute(f"DROP TRIGGER IF EXISTS {table.rstrip('s')}_cache_invalidate ON {table}")
+        op.execute(f"""
+            CREATE TRIGGER {table.rstrip('s')}_cache_invalidate
+            AFTER INSERT OR UPDATE OR DELETE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION notify_cache_invalidation()
+        """)
+    # Only the provider fields shown on public pages
+    op.execute("DROP TRIGGER IF EXISTS user_cache_invalidate ON users")
+    op.execute("""
+        CREATE TRIGGER user_cache_invalidate
+        AFTER UPDATE OF name, avatar_url ON users
+        FOR EACH ROW
+        WHEN (OLD.name IS DISTINCT FROM NEW.name OR OLD.avatar_url IS DISTINCT FROM NEW.avatar_url)
+        EXECUTE FUNCTION notify_cache_invalidation()
+    """)
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS user_cache_invalidate ON users")
+    for table in ('experiences', 'slots', 'reviews'):
+        op.execute(f"DROP TRIGGER IF EXISTS {table.rstrip('s')}_cache_invalidate ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS notify_cache_invalidation()")
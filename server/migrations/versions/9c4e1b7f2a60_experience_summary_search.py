@@ -0,0 +1,56 @@
+"""experience summary search columns
+
+Revision ID: 9c4e1b7f2a60
+Revises: 5f0c2a9e7d41
+Create Date: 2026-10-16 14:37:05.201733
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '9c4e1b7f2a60'
+down_revision = '5f0c2a9e7d41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    with op.batch_alter_table('experience_summaries', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('search_document', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+
+    op.execute("""
+        UPDATE experience_summaries es
+        SET search_document = lower(concat_ws(' ', e.title, e.meeting_point->>'name', e.meeting_point->>'address', d.places)),
+            search_vector = setweight(to_tsvector('english', coalesce(e.title, '')), 'A')
+                || setweight(to_tsvector('english', concat_ws(' ', e.meeting_point->>'name', e.meeting_point->>'address', d.places)), 'B')
+                || setweight(to_tsvector('english', coalesce(e.description, '')), 'D')
+        FROM experiences e
+        CROSS JOIN LATERAL (
+            SELECT translate(concat_ws(' ', e.destinations::text, e.activities::text), '[]{}",:', '        ') AS places
+        ) d
+        WHERE e.id = es.experience_id
+    """)
+
+    with op.batch_alter_table('experience_summaries', schema=None) as batch_op:
+        batch_op.create_index('idx_experience_summaries_search_trgm', ['search_document'], unique=False, postgresql_using='gin', postgresql_ops={'search_document': 'gin_trgm_ops'})
+        batch_op.create_index('idx_experience_summaries_search_vector', ['search_vector'], unique=False, postgresql_using='gin')
+
+    # Superseded by the summary indexes; no query could use it
+    with op.batch_alter_table('experiences', schema=None) as batch_op:
+        batch_op.drop_index('idx_experiences_search', postgresql_using='gin')
+
+
+def downgrade():
+    with op.batch_alter_table('experiences', schema=None) as batch_op:
+        batch_op.create_index('idx_experiences_search', [sa.text("to_tsvector('english', title || ' ' || description)")], unique=False, postgresql_using='gin')
+
+    with op.batch_alter_table('experience_summaries', schema=None) as batch_op:
+        batch_op.drop_index('idx_experience_summaries_search_vector', postgresql_using='gin')
+        batch_op.drop_index('idx_experience_summaries_search_trgm', postgresql_using='gin', postgresql_ops={'search_document': 'gin_trgm_ops'})
+        batch_op.drop_column('search_vector')
+        batch_op.drop_column('search_document')
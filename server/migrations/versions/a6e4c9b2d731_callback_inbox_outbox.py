@@ -0,0 +1,28 @@
+"""callback inbox outbox
+
+Revision ID: a6e4c9b2d731
+Revises: f3c8d2a7b914
+Create Date: 2026-10-17 09:12:44.807215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'a6e4c9b2d731'
+down_revision = 'f3c8d2a7b914'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('callback_inbox', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('tasks', postgresql.JSON(astext_type=sa.Text()), nullable=True))
+        batch_op.create_index('idx_callback_inbox_dispatching', ['processed_at'], unique=False, postgresql_where=sa.text("status = 'dispatching'"))
+
+
+def downgrade():
+    with op.batch_alter_table('callback_inbox', schema=None) as batch_op:
+        batch_op.drop_index('idx_callback_inbox_dispatching', postgresql_where=sa.text("status = 'dispatching'"))
+        batch_op.drop_column('tasks')
@@ -0,0 +1,81 @@
+"""add experience summaries read model
+
+Revision ID: b38b93713109
+Revises: ecd4efc63cf1
+Create Date: 2026-10-16 09:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b38b93713109'
+down_revision = 'ecd4efc63cf1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('experience_summaries',
+    sa.Column('experience_id', sa.UUID(), nullable=False),
+    sa.Column('provider_id', sa.UUID(), nullable=False),
+    sa.Column('status', sa.String(length=255), nullable=False),
+    sa.Column('provider_name', sa.Text(), nullable=True),
+    sa.Column('provider_avatar', sa.Text(), nullable=True),
+    sa.Column('min_price', sa.Numeric(precision=8, scale=2), nullable=False),
+    sa.Column('max_price', sa.Numeric(precision=8, scale=2), nullable=False),
+    sa.Column('total_capacity', sa.Integer(), nullable=False),
+    sa.Column('total_booked', sa.Integer(), nullable=False),
+    sa.Column('available_slots', sa.Integer(), nullable=False),
+    sa.Column('slot_count', sa.Integer(), nullable=False),
+    sa.Column('last_slot_date', sa.Date(), nullable=True),
+    sa.Column('avg_rating', sa.Float(), nullable=True),
+    sa.Column('reviews_count', sa.Integer(), nullable=True),
+    sa.Column('refreshed_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['experience_id'], ['experiences.id'], name=op.f('fk_experience_summaries_experience_id_experiences'), ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('experience_id', name=op.f('pk_experience_summaries'))
+    )
+    with op.batch_alter_table('experience_summaries', schema=None) as batch_op:
+        batch_op.create_index('idx_experience_summaries_status_upcoming', ['status', 'last_slot_date'], unique=False)
+        batch_op.create_index(batch_op.f('ix_experience_summaries_provider_id'), ['provider_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_experience_summaries_status'), ['status'], unique=False)
+
+    # Backfill one row per existing experience
+    op.execute("""
+        INSERT INTO experience_summaries (
+            experience_id, provider_id, status, provider_name, provider_avatar,
+            min_price, max_price, total_capacity, total_booked, available_slots,
+            slot_count, last_slot_date, avg_rating, reviews_count, refreshed_at
+        )
+        SELECT
+            e.id, e.provider_id, e.status, u.name, u.avatar_url,
+            COALESCE(s.min_price, 0), COALESCE(s.max_price, 0),
+            COALESCE(s.total_capacity, 0), COALESCE(s.total_booked, 0),
+            COALESCE(s.total_capacity - s.total_booked, 0),
+            COALESCE(s.slot_count, 0), s.last_slot_date,
+            COALESCE(e.avg_rating, 0), COALESCE(e.reviews_count, 0), NOW()
+        FROM experiences e
+        LEFT JOIN users u ON u.id = e.provider_id
+        LEFT JOIN (
+            SELECT
+                experience_id,
+                MIN(price) FILTER (WHERE price > 0) AS min_price,
+                MAX(price) FILTER (WHERE price > 0) AS max_price,
+                SUM(capacity) AS total_capacity,
+                SUM(booked) AS total_booked,
+                COUNT(*) AS slot_count,
+                MAX(date) AS last_slot_date
+            FROM slots
+            GROUP BY experience_id
+        ) s ON s.experience_id = e.id
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('experience_summaries', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_experience_summaries_status'))
+        batch_op.drop_index(batch_op.f('ix_experience_summaries_provider_id'))
+        batch_op.drop_index('idx_experience_summaries_status_upcoming')
+
+    op.drop_table('experience_summaries')
@@ -0,0 +1,48 @@
+"""slot bookings no longer invalidate cached pages
+
+Revision ID: b4e8d2a6f913
+Revises: 7a2f5c9e1d04
+Create Date: 2026-10-16 19:27:05.381942
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4e8d2a6f913'
+down_revision = '7a2f5c9e1d04'
+branch_labels = None
+depends_on = None
+
+
+# Changes to slots.booked alone are served from the live availability
+# counters (utils.availability), so they must not evict the cached pages.
+
+
+def upgrade():
+    op.execute("DROP TRIGGER IF EXISTS slot_cache_invalidate ON slots")
+    op.execute("""
+        CREATE TRIGGER slot_cache_invalidate
+        AFTER INSERT OR DELETE ON slots
+        FOR EACH ROW EXECUTE FUNCTION notify_cache_invalidation()
+    """)
+    op.execute("""
+        CREATE TRIGGER slot_cache_invalidate_update
+        AFTER UPDATE ON slots
+        FOR EACH ROW
+        WHEN ((OLD.name, OLD.capacity, OLD.price, OLD.date, OLD.start_time, OLD.end_time, OLD.timezone, OLD.experience_id)
+              IS DISTINCT FROM
+              (NEW.name, NEW.capacity, NEW.price, NEW.date, NEW.start_time, NEW.end_time, NEW.timezone, NEW.experience_id))
+        EXECUTE FUNCTION notify_cache_invalidation()
+    """)
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS slot_cache_invalidate_update ON slots")
+    op.execute("DROP TRIGGER IF EXISTS slot_cache_invalidate ON slots")
+    op.execute("""
+        CREATE TRIGGER slot_cache_invalidate
+        AFTER INSERT OR UPDATE OR DELETE ON slots
+        FOR EACH ROW EXECUTE FUNCTION notify_cache_invalidation()
+    """)
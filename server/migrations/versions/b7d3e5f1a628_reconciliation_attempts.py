@@ -0,0 +1,48 @@
+"""reconciliation attempts
+
+Revision ID: b7d3e5f1a628
+Revises: a6e4c9b2d731
+Create Date: 2026-10-17 10:03:27.114590
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d3e5f1a628'
+down_revision = 'a6e4c9b2d731'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('api_collections', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('reconcile_attempts', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('next_reconcile_at', sa.DateTime(timezone=True), nullable=True))
+        batch_op.add_column(sa.Column('needs_review', sa.Boolean(), server_default=sa.false(), nullable=False))
+        batch_op.drop_index('idx_api_collections_unsettled', postgresql_where=sa.text("status IN ('PENDING', 'initiated', 'expired')"))
+        batch_op.create_index('idx_api_collections_unsettled', ['created_at', 'id'], unique=False, postgresql_where=sa.text("status IN ('PENDING', 'initiated', 'expired') AND NOT needs_review"))
+
+    with op.batch_alter_table('api_disbursements', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('reconcile_attempts', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('next_reconcile_at', sa.DateTime(timezone=True), nullable=True))
+        batch_op.add_column(sa.Column('needs_review', sa.Boolean(), server_default=sa.false(), nullable=False))
+        batch_op.drop_index('idx_api_disbursements_unsettled', postgresql_where=sa.text("status IN ('posted', 'pending', 'initiated')"))
+        batch_op.create_index('idx_api_disbursements_unsettled', ['created_at', 'id'], unique=False, postgresql_where=sa.text("status IN ('posted', 'pending', 'initiated') AND NOT needs_review"))
+
+
+def downgrade():
+    with op.batch_alter_table('api_disbursements', schema=None) as batch_op:
+        batch_op.drop_index('idx_api_disbursements_unsettled', postgresql_where=sa.text("status IN ('posted', 'pending', 'initiated') AND NOT needs_review"))
+        batch_op.create_index('idx_api_disbursements_unsettled', ['created_at', 'id'], unique=False, postgresql_where=sa.text("status IN ('posted', 'pending', 'initiated')"))
+        batch_op.drop_column('needs_review')
+        batch_op.drop_column('next_reconcile_at')
+        batch_op.drop_column('reconcile_attempts')
+
+    with op.batch_alter_table('api_collections', schema=None) as batch_op:
+        batch_op.drop_index('idx_api_collections_unsettled', postgresql_where=sa.text("status IN ('PENDING', 'initiated', 'expired') AND NOT needs_review"))
+        batch_op.create_index('idx_api_collections_unsettled', ['created_at', 'id'], unique=False, postgresql_where=sa.text("status IN ('PENDING', 'initiated', 'expired')"))
+        batch_op.drop_column('needs_review')
+        batch_op.drop_column('next_reconcile_at')
+        batch_op.drop_column('reconcile_attempts')
@@ -0,0 +1,30 @@
+"""api collection inventory holds
+
+Revision ID: c91f3e7b5a28
+Revises: b4e8d2a6f913
+Create Date: 2026-10-16 20:05:43.118290
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c91f3e7b5a28'
+down_revision = 'b4e8d2a6f913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('api_collections', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('hold_status', sa.String(length=20), nullable=True))
+        batch_op.add_column(sa.Column('hold_expires_at', sa.DateTime(timezone=True), nullable=True))
+        batch_op.create_index('idx_api_collections_hold_expiry', ['hold_expires_at'], unique=False, postgresql_where=sa.text("hold_status = 'held'"))
+
+
+def downgrade():
+    with op.batch_alter_table('api_collections', schema=None) as batch_op:
+        batch_op.drop_index('idx_api_collections_hold_expiry', postgresql_where=sa.text("hold_status = 'held'"))
+        batch_op.drop_column('hold_expires_at')
+        batch_op.drop_column('hold_status')
@@ -0,0 +1,42 @@
+"""callback inbox
+
+Revision ID: d5a7c3f18e62
+Revises: c91f3e7b5a28
+Create Date: 2026-10-16 22:41:09.520871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'd5a7c3f18e62'
+down_revision = 'c91f3e7b5a28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('callback_inbox',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('source', sa.String(length=20), nullable=False),
+    sa.Column('idempotency_key', sa.Text(), nullable=False),
+    sa.Column('target_id', sa.UUID(), nullable=True),
+    sa.Column('payload', postgresql.JSON(astext_type=sa.Text()), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('received_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('processed_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_callback_inbox')),
+    sa.UniqueConstraint('source', 'idempotency_key', name='uq_callback_inbox_source_key')
+    )
+    with op.batch_alter_table('callback_inbox', schema=None) as batch_op:
+        batch_op.create_index('idx_callback_inbox_pending', ['received_at'], unique=False, postgresql_where=sa.text("status = 'pending'"))
+
+
+def downgrade():
+    with op.batch_alter_table('callback_inbox', schema=None) as batch_op:
+        batch_op.drop_index('idx_callback_inbox_pending', postgresql_where=sa.text("status = 'pending'"))
+
+    op.drop_table('callback_inbox')
@@ -0,0 +1,32 @@
+"""unsettled payment indexes
+
+Revision ID: e2b6f4a91c37
+Revises: d5a7c3f18e62
+Create Date: 2026-10-16 23:52:17.604113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b6f4a91c37'
+down_revision = 'd5a7c3f18e62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('api_collections', schema=None) as batch_op:
+        batch_op.create_index('idx_api_collections_unsettled', ['created_at', 'id'], unique=False, postgresql_where=sa.text("status IN ('PENDING', 'initiated')"))
+
+    with op.batch_alter_table('api_disbursements', schema=None) as batch_op:
+        batch_op.create_index('idx_api_disbursements_unsettled', ['created_at', 'id'], unique=False, postgresql_where=sa.text("status IN ('posted', 'pending', 'initiated')"))
+
+
+def downgrade():
+    with op.batch_alter_table('api_disbursements', schema=None) as batch_op:
+        batch_op.drop_index('idx_api_disbursements_unsettled', postgresql_where=sa.text("status IN ('posted', 'pending', 'initiated')"))
+
+    with op.batch_alter_table('api_collections', schema=None) as batch_op:
+        batch_op.drop_index('idx_api_collections_unsettled', postgresql_where=sa.text("status IN ('PENDING', 'initiated')"))
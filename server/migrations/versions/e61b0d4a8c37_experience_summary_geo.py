@@ -0,0 +1,45 @@
+"""experience summary meeting point coordinates
+
+Revision ID: e61b0d4a8c37
+Revises: 3d7a91c5e2b8
+Create Date: 2026-10-16 17:20:11.934862
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e61b0d4a8c37'
+down_revision = '3d7a91c5e2b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS cube")
+    op.execute("CREATE EXTENSION IF NOT EXISTS earthdistance")
+
+    with op.batch_alter_table('experience_summaries', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('latitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('longitude', sa.Float(), nullable=True))
+
+    op.execute("""
+        UPDATE experience_summaries es
+        SET latitude = (c->>'latitude')::float8,
+            longitude = (c->>'longitude')::float8
+        FROM (SELECT id, meeting_point->'coordinates' AS c FROM experiences) e
+        WHERE e.id = es.experience_id
+          AND json_typeof(c->'latitude') = 'number' AND json_typeof(c->'longitude') = 'number'
+          AND abs((c->>'latitude')::float8) <= 90 AND abs((c->>'longitude')::float8) <= 180
+    """)
+
+    with op.batch_alter_table('experience_summaries', schema=None) as batch_op:
+        batch_op.create_index('idx_experience_summaries_geo', [sa.text('ll_to_earth(latitude, longitude)')], unique=False, postgresql_using='gist', postgresql_where=sa.text('latitude IS NOT NULL'))
+
+
+def downgrade():
+    with op.batch_alter_table('experience_summaries', schema=None) as batch_op:
+        batch_op.drop_index('idx_experience_summaries_geo', postgresql_using='gist', postgresql_where=sa.text('latitude IS NOT NULL'))
+        batch_op.drop_column('longitude')
+        batch_op.drop_column('latitude')
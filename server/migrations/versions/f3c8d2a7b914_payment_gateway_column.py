@@ -0,0 +1,39 @@
+"""payment gateway column
+
+Revision ID: f3c8d2a7b914
+Revises: e2b6f4a91c37
+Create Date: 2026-10-17 00:41:09.318264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c8d2a7b914'
+down_revision = 'e2b6f4a91c37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('api_collections', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('gateway', sa.String(length=20), server_default='mpesa', nullable=False))
+        batch_op.drop_index('idx_api_collections_unsettled', postgresql_where=sa.text("status IN ('PENDING', 'initiated')"))
+        batch_op.create_index('idx_api_collections_unsettled', ['created_at', 'id'], unique=False, postgresql_where=sa.text("status IN ('PENDING', 'initiated', 'expired')"))
+
+    with op.batch_alter_table('api_disbursements', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('gateway', sa.String(length=20), server_default='mpesa', nullable=False))
+
+    # Settlement payouts go through Paytrack
+    op.execute("UPDATE api_disbursements SET gateway = 'paytrack' WHERE disbursement_type = 'settlement'")
+
+
+def downgrade():
+    with op.batch_alter_table('api_disbursements', schema=None) as batch_op:
+        batch_op.drop_column('gateway')
+
+    with op.batch_alter_table('api_collections', schema=None) as batch_op:
+        batch_op.drop_index('idx_api_collections_unsettled', postgresql_where=sa.text("status IN ('PENDING', 'initiated', 'expired')"))
+        batch_op.create_index('idx_api_collections_unsettled', ['created_at', 'id'], unique=False, postgresql_where=sa.text("status IN ('PENDING', 'initiated')"))
+        batch_op.drop_column('gateway')
@@ -1,5 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.dialects.postgresql import UUID, JSON
+from sqlalchemy.dialects.postgresql import UUID, JSON, TSVECTOR, ARRAY
 from datetime import datetime
 from sqlalchemy import CheckConstraint, Index, func
 from models import db
@@ -24,6 +24,19 @@ class ReservationStatus:
     COMPLETED = "completed"
     
 
+class CollectionStatus:
+    """ApiCollection.status values; transitions are enforced in utils.payment_state"""
+    PENDING = "PENDING"
+    INITIATED = "initiated"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    EXPIRED = "expired"
+
+class PaymentGateway:
+    """Gateway a collection/disbursement was sent through (reconciled against the same one)"""
+    MPESA = "mpesa"
+    PAYTRACK = "paytrack"
+
 class PaymentType:
     CARD = "card"
     MPESA = "mpesa"
@@ -134,8 +147,6 @@ class Experience(db.Model):
         Index('idx_experiences_provider_status', 'provider_id', 'status'),
         Index('idx_experiences_status_dates', 'status', 'start_date', 'end_date'),
         Index('idx_experiences_date_range', 'start_date', 'end_date'),
-        Index('idx_experiences_search', db.text("to_tsvector('english', title || ' ' || description)"), 
-              postgresql_using='gin'),
         Index('idx_experiences_published', 'id', 'start_date', postgresql_where=db.text("status = 'published'")),
     )
 
@@ -199,6 +210,72 @@ class Slot(db.Model):
         return f"<Slot {self.name} - {self.date} {self.start_time}-{self.end_time} {self.timezone}>"
 
 
+class ExperienceSummary(db.Model):
+    """
+    Read model with one row per experience, holding the slot, provider and
+    review aggregates the public catalogue needs. Maintained incrementally by
+    utils.experience_summary whenever experiences, slots, reviews or
+    providers change, so listing never has to aggregate the slots table.
+    """
+    __tablename__ = "experience_summaries"
+
+    experience_id = db.Column(UUID(as_uuid=True), db.ForeignKey("experiences.id", ondelete="CASCADE"), primary_key=True)
+    provider_id = db.Column(UUID(as_uuid=True), nullable=False, index=True)
+    status = db.Column(db.String(255), nullable=False, index=True)
+
+    provider_name = db.Column(db.Text, nullable=True)
+    provider_avatar = db.Column(db.Text, nullable=True)
+
+    min_price = db.Column(db.Numeric(8, 2), nullable=False, default=0)
+    max_price = db.Column(db.Numeric(8, 2), nullable=False, default=0)
+    total_capacity = db.Column(db.Integer, nullable=False, default=0)
+    total_booked = db.Column(db.Integer, nullable=False, default=0)
+    available_slots = db.Column(db.Integer, nullable=False, default=0)
+    slot_count = db.Column(db.Integer, nullable=False, default=0)
+    last_slot_date = db.Column(db.Date, nullable=True)  # upcoming while >= today
+
+    avg_rating = db.Column(db.Float, nullable=True, default=0.0)
+    reviews_count = db.Column(db.Integer, nullable=True, default=0)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False)  # mirrors experiences.created_at
+
+    # experiences.destinations/activities (JSON) as trimmed text arrays so list
+    # filters are GIN-indexed overlap (&&) lookups
+    destinations = db.Column(ARRAY(db.Text), nullable=False, server_default='{}')
+    activities = db.Column(ARRAY(db.Text), nullable=False, server_default='{}')
+
+    # meeting_point.coordinates (NULL when missing/invalid) for proximity queries
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
+
+    # Search: lower-cased title/meeting point/destinations/activities for trigram
+    # matching, and a weighted tsvector (title A, places B, description D)
+    search_document = db.Column(db.Text, nullable=True)
+    search_vector = db.Column(TSVECTOR, nullable=True)
+    refreshed_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        Index('idx_experience_summaries_status_upcoming', 'status', 'last_slot_date'),
+        # Keyset pagination indexes: one per catalogue sort, ending in the id tie-breaker
+        Index('idx_experience_summaries_price_asc', 'status', 'min_price', 'experience_id'),
+        Index('idx_experience_summaries_price_desc', 'status', max_price.desc(), 'experience_id'),
+        Index('idx_experience_summaries_popularity', 'status', total_booked.desc(), created_at.desc(), 'experience_id'),
+        Index('idx_experience_summaries_availability', 'status', available_slots.desc(), 'experience_id'),
+        Index('idx_experience_summaries_search_trgm', 'search_document', postgresql_using='gin',
+              postgresql_ops={'search_document': 'gin_trgm_ops'}),
+        Index('idx_experience_summaries_search_vector', 'search_vector', postgresql_using='gin'),
+        Index('idx_experience_summaries_destinations', 'destinations', postgresql_using='gin'),
+        Index('idx_experience_summaries_activities', 'activities', postgresql_using='gin'),
+        # earth_box(...) @> ll_to_earth(...) lookups (cube + earthdistance extensions)
+        Index('idx_experience_summaries_geo', func.ll_to_earth(latitude, longitude), postgresql_using='gist',
+              postgresql_where=latitude.isnot(None)),
+    )
+
+    experience = db.relationship("Experience", backref=db.backref("summary", uselist=False, passive_deletes=True))
+
+    def __repr__(self):
+        return f"<ExperienceSummary {self.experience_id} ({self.status})>"
+
+
 class Reservation(db.Model):
     __tablename__ = "reservations"
 
@@ -271,9 +348,25 @@ class ApiCollection(db.Model):
     status = db.Column(db.String(255), nullable=False, index=True)
     mpesa_number = db.Column(db.Text, nullable=False, index=True)
     description = db.Column(db.Text, nullable=True)
+    gateway = db.Column(db.String(20), nullable=False, default=PaymentGateway.MPESA, server_default=PaymentGateway.MPESA)
+    # Inventory hold on the slot while payment is pending (utils.inventory)
+    hold_status = db.Column(db.String(20), nullable=True)
+    hold_expires_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    # Gateway status queries for a missing callback (workers.reconciliation)
+    reconcile_attempts = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    next_reconcile_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    needs_review = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
     created_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
+    __table_args__ = (
+        Index('idx_api_collections_hold_expiry', 'hold_expires_at',
+              postgresql_where=db.text("hold_status = 'held'")),
+        # Keyset scans of unsettled payments (workers.reconciliation)
+        Index('idx_api_collections_unsettled', 'created_at', 'id',
+              postgresql_where=db.text("status IN ('PENDING', 'initiated', 'expired') AND NOT needs_review")),
+    )
+
     def __repr__(self):
         return f"<ApiCollection {self.name}>"
     
@@ -293,12 +386,49 @@ class ApiDisbursement(db.Model):
     mpesa_number = db.Column(db.Text, nullable=True, index=True)
     disbursement_type = db.Column(db.String(255), nullable=False, index=True) # e.g., "payout", "refund", "settlement"
     description = db.Column(db.Text, nullable=True)
+    gateway = db.Column(db.String(20), nullable=False, default=PaymentGateway.MPESA, server_default=PaymentGateway.MPESA)
+    # Gateway status queries for a missing callback (workers.reconciliation)
+    reconcile_attempts = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    next_reconcile_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    needs_review = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
     created_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
+    __table_args__ = (
+        # Keyset scans of unsettled payouts (workers.reconciliation)
+        Index('idx_api_disbursements_unsettled', 'created_at', 'id',
+              postgresql_where=db.text("status IN ('posted', 'pending', 'initiated') AND NOT needs_review")),
+    )
+
     def __repr__(self):
         return f"<ApiDisbursement {self.name}>"
 
+class CallbackInbox(db.Model):
+    """Raw gateway callbacks, stored once per idempotency key and applied by workers.callback_inbox"""
+    __tablename__ = "callback_inbox"
+
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    source = db.Column(db.String(20), nullable=False)  # mpesa_stk, mpesa_b2c, mpesa_b2b, paytrack
+    idempotency_key = db.Column(db.Text, nullable=False)  # CheckoutRequestID / ConversationID / request_id
+    target_id = db.Column(UUID(as_uuid=True), nullable=True)  # ApiCollection or ApiDisbursement
+    payload = db.Column(JSON, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default="pending")  # pending, dispatching, processed, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    # Follow-up Celery tasks ([{"task": name, "kwargs": {...}}]), committed with the entry's changes
+    tasks = db.Column(JSON, nullable=True)
+    received_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow, nullable=False)
+    processed_at = db.Column(db.DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('source', 'idempotency_key', name='uq_callback_inbox_source_key'),
+        Index('idx_callback_inbox_pending', 'received_at', postgresql_where=db.text("status = 'pending'")),
+        Index('idx_callback_inbox_dispatching', 'processed_at', postgresql_where=db.text("status = 'dispatching'")),
+    )
+
+    def __repr__(self):
+        return f"<CallbackInbox {self.source}:{self.idempotency_key} {self.status}>"
+
 class ReservationTxn(db.Model):
     __tablename__ = "reservation_txn"
 
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Payment dispatcher that runs as its own process next to the Celery workers
+when PAYMENT_DISPATCHER=async. It initiates queued STK / Paytrack payments
+concurrently on one event loop (workers.payment_dispatcher).
+"""
+
+import logging
+import os
+import signal
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+from app import app
+from workers.payment_dispatcher import PaymentDispatcher
+
+logging.basicConfig(level=logging.INFO)
+
+dispatcher = PaymentDispatcher(
+    app,
+    concurrency=int(os.getenv("PAYMENT_DISPATCH_CONCURRENCY", 200)),
+    batch_size=int(os.getenv("PAYMENT_DISPATCH_BATCH", 100)),
+)
+
+
+def _shutdown(signum, frame):
+    dispatcher.stop()
+
+
+if __name__ == '__main__':
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+    dispatcher.run()
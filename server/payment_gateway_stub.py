@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Safaricom and Paytrack APIs, for exercising the
+payment workers (services.payment_gateway) without real money or sandbox
+rate limits. Point the clients at it with
+
+    MPESA_API_BASE=http://localhost:5050 PAYTRACK_API_BASE=http://localhost:5050
+
+Behaviour is set through the environment:
+    STUB_PORT            port to listen on (5050)
+    STUB_LATENCY_MS      delay added to every response (0)
+    STUB_FAILURE_RATE    share of requests answered with a 503 (0.0)
+    STUB_CALLBACK_DELAY  seconds before the result callback is sent; 0 disables callbacks (2)
+    STUB_RESULT          "success" or "failed" outcome reported by callbacks (success)
+    STUB_PAYTRACK_CALLBACK_URL  where Paytrack events are posted
+
+The STK push query and Paytrack request status endpoints answer from the
+requests this process has seen, for workers.reconciliation.
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import requests
+from flask import Flask, jsonify, request
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("payment_gateway_stub")
+
+LATENCY = int(os.getenv("STUB_LATENCY_MS", "0")) / 1000
+FAILURE_RATE = float(os.getenv("STUB_FAILURE_RATE", "0"))
+CALLBACK_DELAY = float(os.getenv("STUB_CALLBACK_DELAY", "2"))
+SUCCEED = os.getenv("STUB_RESULT", "success") == "success"
+PAYTRACK_CALLBACK_URL = os.getenv("STUB_PAYTRACK_CALLBACK_URL", "http://localhost:5000/payment/mpesa/paytrack/call_back")
+
+app = Flask(__name__)
+
+# Outcomes by CheckoutRequestID / request_ref, for the status endpoints
+stk_results = {}
+paytrack_events = {}
+
+
+@app.before_request
+def _simulate_network():
+    if LATENCY:
+        time.sleep(LATENCY)
+    if random.random() < FAILURE_RATE:
+        return jsonify({"errorMessage": "Service unavailable (stub)"}), 503
+
+
+def _send_later(url, payload):
+    if not CALLBACK_DELAY or not url:
+        return
+
+    def send():
+        try:
+            response = requests.post(url, json=payload, timeout=10)
+            logger.info(f"Callback to {url} answered {response.status_code}")
+        except Exception as e:
+            logger.warning(f"Callback to {url} failed: {e}")
+
+    threading.Timer(CALLBACK_DELAY, send).start()
+
+
+def _receipt():
+    return uuid.uuid4().hex[:10].upper()
+
+
+@app.route("/oauth/v1/generate", methods=["GET"])
+def oauth():
+    return jsonify({"access_token": uuid.uuid4().hex, "expires_in": "3599"})
+
+
+@app.route("/mpesa/stkpush/v1/processrequest", methods=["POST"])
+def stk_push():
+    data = request.get_json(force=True)
+    checkout_request_id = f"ws_CO_{uuid.uuid4().hex[:20]}"
+    merchant_request_id = uuid.uuid4().hex[:12]
+    callback = {"MerchantRequestID": merchant_request_id, "CheckoutRequestID": checkout_request_id}
+    if SUCCEED:
+        callback.update(ResultCode=0, ResultDesc="The service request is processed successfully.", CallbackMetadata={"Item": [
+            {"Name": "Amount", "Value": float(data.get("Amount", 0))},
+            {"Name": "MpesaReceiptNumber", "Value": _receipt()},
+            {"Name": "TransactionDate", "Value": int(datetime.now().strftime("%Y%m%d%H%M%S"))},
+            {"Name": "PhoneNumber", "Value": int(data.get("PhoneNumber") or 0)},
+        ]})
+    else:
+        callback.update(ResultCode=1032, ResultDesc="Request cancelled by user")
+    stk_results[checkout_request_id] = callback
+    _send_later(data.get("CallBackURL"), {"Body": {"stkCallback": callback}})
+    return jsonify({
+        "MerchantRequestID": merchant_request_id,
+        "CheckoutRequestID": checkout_request_id,
+        "ResponseCode": "0",
+        "ResponseDescription": "Success. Request accepted for processing",
+        "CustomerMessage": "Success. Request accepted for processing",
+    })
+
+
+@app.route("/mpesa/stkpushquery/v1/query", methods=["POST"])
+def stk_query():
+    checkout_request_id = request.get_json(force=True).get("CheckoutRequestID")
+    result = stk_results.get(checkout_request_id)
+    if result is None:
+        return jsonify({"errorCode": "400.002.02", "errorMessage": "Bad Request - Invalid CheckoutRequestID"}), 400
+    return jsonify({
+        "ResponseCode": "0",
+        "ResponseDescription": "The service request has been accepted successsfully",
+        "MerchantRequestID": result["MerchantRequestID"],
+        "CheckoutRequestID": checkout_request_id,
+        "ResultCode": str(result["ResultCode"]),
+        "ResultDesc": result["ResultDesc"],
+    })
+
+
+@app.route("/mpesa/b2c/v3/paymentrequest", methods=["POST"])
+@app.route("/mpesa/b2b/v1/paymentrequest", methods=["POST"])
+def disbursement():
+    data = request.get_json(force=True)
+    conversation_id = f"AG_{uuid.uuid4().hex[:16]}"
+    originator_conversation_id = data.get("OriginatorConversationID") or uuid.uuid4().hex[:12]
+    result = {"ConversationID": conversation_id, "OriginatorConversationID": originator_conversation_id,
+              "TransactionID": _receipt()}
+    if SUCCEED:
+        result.update(ResultCode=0, ResultDesc="The service request is processed successfully.")
+    else:
+        result.update(ResultCode=2001, ResultDesc="The initiator information is invalid.")
+    _send_later(data.get("ResultURL"), {"Result": result})
+    return jsonify({
+        "ConversationID": conversation_id,
+        "OriginatorConversationID": originator_conversation_id,
+        "ResponseCode": "0",
+        "ResponseDescription": "Accept the service request successfully.",
+    })
+
+
+def _paytrack_event(event_type, data):
+    request_id = str(uuid.uuid4())
+    event = paytrack_events[str(data.get("request_ref"))] = {
+        "event_type": event_type,
+        "tenant_id": str(uuid.UUID(int=0)),
+        "request_id": request_id,
+        "status": "success" if SUCCEED else "failed",
+        "amount": data.get("amount"),
+        "request_ref": data.get("request_ref"),
+        "currency": data.get("currency", "KES"),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "transaction_ref": _receipt() if SUCCEED else None,
+        "remarks": None if SUCCEED else "Declined (stub)",
+        "mpesa_number": data.get("mpesa_number"),
+    }
+    _send_later(PAYTRACK_CALLBACK_URL, event)
+    return request_id
+
+
+@app.route("/api/payment_request", methods=["POST"])
+def paytrack_collection():
+    request_id = _paytrack_event("COLLECTION", request.get_json(force=True))
+    return jsonify({"request_id": request_id, "checkout_request_id": f"ws_CO_{uuid.uuid4().hex[:20]}",
+                    "status": "pending"}), 202
+
+
+@app.route("/api/disburse_request", methods=["POST"])
+def paytrack_disbursement():
+    request_id = _paytrack_event("DISBURSEMENT", request.get_json(force=True))
+    return jsonify({"request_id": request_id, "status": "pending"}), 202
+
+
+@app.route("/api/request_status", methods=["GET"])
+def paytrack_status():
+    event = paytrack_events.get(request.args.get("request_ref"))
+    if event is None:
+        return jsonify({"error": "Request not found"}), 404
+    return jsonify(event)
+
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=int(os.getenv("STUB_PORT", "5050")), threaded=True)
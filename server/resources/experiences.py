@@ -2,6 +2,9 @@ from flask_restful import Resource
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from flask_caching import Cache
 from models import db, User, Experience, Slot
+from utils.experience_summary import refresh_experience_summaries
+from workers.catalogue_index import reindex_catalogue
+from utils.cache_tags import cache_set_tagged, invalidate_tags, experience_tag, provider_tag, CATALOGUE_TAG
 from datetime import datetime, date
 from flask import request, current_app
 from marshmallow import Schema, fields, ValidationError, validate, validates_schema, post_dump
@@ -235,12 +238,15 @@ def cache_key_experience(experience_id):
     """Generate cache key for single experience"""
     return f"experience:{experience_id}"
 
-def invalidate_experience_cache(user_id, experience_id=None):
+def invalidate_experience_cache(user_id, experience_id=None, experience_ids=()):
     cache = current_app.cache
-    """Invalidate experience-related cache"""
+    """Invalidate experience-related cache, including every tagged public/review entry"""
+    experience_ids = [experience_id, *experience_ids] if experience_id else list(experience_ids)
     cache.delete(cache_key_experience_list(user_id))
-    if experience_id:
-        cache.delete(cache_key_experience(experience_id))
+    for exp_id in experience_ids:
+        cache.delete(cache_key_experience(exp_id))
+    # Provider writes can change list membership and order, so the catalogue goes too
+    invalidate_tags(provider_tag(user_id), CATALOGUE_TAG, *(experience_tag(exp_id) for exp_id in experience_ids))
 
 # --- Experience Management ---
 class ExperienceList(Resource):
@@ -292,7 +298,7 @@ class ExperienceList(Resource):
                          .order_by(Experience.created_at.desc())
                          .all())
             experiences_data = experience_list_schema.dump(experiences)
-            cache.set(cache_key, experiences_data, timeout=600)  # Cache for 10 minutes
+            cache_set_tagged(cache_key, experiences_data, 3600, [provider_tag(user.id)])
         
         return {
             "experiences": experiences_data,
@@ -320,7 +326,7 @@ class ExperienceDetail(Resource):
                 return {"error": "Experience not found"}, 404
             
             experience_data = experience_schema.dump(experience)
-            current_app.cache.set(cache_key, experience_data, timeout=600)
+            cache_set_tagged(cache_key, experience_data, 3600, [experience_tag(experience_id)])
         
         return {"experience": experience_data}, 200
 
@@ -612,10 +618,13 @@ class ExperienceBulkOperations(Resource):
                         .update({Experience.status: new_status}, 
                                synchronize_session=False))
         
+        # Bulk updates bypass the ORM flush hooks, refresh the read model explicitly
+        refresh_experience_summaries(db.session.connection(), experience_ids)
         db.session.commit()
         
         # Invalidate cache
-        invalidate_experience_cache(user.id)
+        invalidate_experience_cache(user.id, experience_ids=experience_ids)
+        reindex_catalogue.delay([str(experience_id) for experience_id in experience_ids])
         
         logger.info(f"Bulk status update by provider {user.id}: {updated_count} experiences")
         
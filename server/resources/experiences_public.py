@@ -2,15 +2,25 @@ from flask_restful import Resource
 from sqlalchemy.sql import func
 from flask import request, current_app
 from flask_caching import Cache
-from models import db, Experience, User, Slot
+from models import db, Experience, ExperienceSummary, User, Slot
+from utils.cache_tags import cache_set_tagged, cache_set_many_tagged, invalidate_tags, experience_tag, provider_tag, CATALOGUE_TAG
+from utils.single_flight import get_or_fill, refresh
+from utils.fast_json import dumps_bytes, json_response
+from utils.etags import make_etag, ensure_versions, not_modified_response, etag_headers
+from utils.search_suggest import suggest
+from utils.facet_index import facet_counts, MAX_VALUES as MAX_FACET_VALUES
+from utils.trending import top_experience_ids
+from utils.availability import experience_availability, slot_availability
 from marshmallow import Schema, fields, validate, ValidationError
-from sqlalchemy import and_, or_, func, desc, asc, cast, String, select
+from sqlalchemy import and_, or_, func, desc, asc, cast, String, Float, select, literal
 from sqlalchemy.orm import joinedload, selectinload, aliased
 from datetime import datetime, date, timedelta
 from decimal import Decimal
 from functools import wraps
 import json
 import base64
+import re
+import uuid
 import logging 
 from typing import Optional, List, Dict, Any
 from dataclasses import dataclass, asdict
@@ -19,11 +29,19 @@ import hashlib
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Availability as rendered into cached bodies: an experience's count follows
+# its id, and a slot's capacity/booked/available follow the slot id. Quotes
+# inside JSON strings are escaped, so user text can't match these.
+_EXPERIENCE_AVAILABILITY = re.compile(rb'\{"id":"([0-9a-f-]{36})","available_slots":-?\d+')
+_SLOT_AVAILABILITY = re.compile(rb'\{"id":"([0-9a-f-]{36})","capacity":(\d+),"booked":-?\d+,"available":-?\d+')
+
 # --- Data Classes for Caching ---
 @dataclass
 class CachedExperience:
     """Optimized experience data for caching"""
     id: str
+    # Rendered right after `id` so cached bodies can be overlaid in place (ExperienceCache)
+    available_slots: int
     title: str
     description: str
     destinations: List[str]
@@ -41,7 +59,6 @@ class CachedExperience:
     min_price: float
     max_price: float
     total_slots: int
-    available_slots: int
     avg_rating: int
     created_at: str
     updated_at: str
@@ -77,16 +94,60 @@ class CachedExperience:
             avg_rating = experience.avg_rating if experience.avg_rating else 0
         )
 
+    @classmethod
+    def from_summary(cls, experience, summary):
+        """Create from Experience model plus its precomputed ExperienceSummary row"""
+        return cls(
+            id=str(experience.id),
+            title=experience.title,
+            description=experience.description or "",
+            destinations=experience.destinations or [],
+            inclusions=experience.inclusions or [],
+            exclusions=experience.exclusions or [],
+            activities=experience.activities or [],
+            poster_image_url=experience.poster_image_url,
+            start_date=experience.start_date.isoformat() if experience.start_date else None,
+            end_date=experience.end_date.isoformat() if experience.end_date else None,
+            status=experience.status,
+            images=experience.images if experience.images else None,
+            meeting_point=experience.meeting_point or {},
+            provider_name=summary.provider_name or '',
+            provider_avatar=summary.provider_avatar,
+            min_price=float(summary.min_price or 0),
+            max_price=float(summary.max_price or 0),
+            total_slots=summary.total_capacity or 0,
+            available_slots=summary.available_slots or 0,
+            created_at=experience.created_at.isoformat() if experience.created_at else None,
+            updated_at=experience.updated_at.isoformat() if experience.updated_at else None,
+            avg_rating=summary.avg_rating if summary.avg_rating else 0
+        )
+
 @dataclass
 class CacheConfig:
     """Cache configuration for different data types"""
-    EXPERIENCE_LIST_TTL = 300  # 5 minutes
-    EXPERIENCE_DETAIL_TTL = 600  # 10 minutes
-    HOT_EXPERIENCES_TTL = 1800  # 30 minutes
-    PROVIDER_DATA_TTL = 900  # 15 minutes
+    # Entries are tag-invalidated on writes, both by the resources and by the
+    # database triggers (utils.invalidation_listener), so TTLs only bound how
+    # long an entry lives unused; keep them under cache_tags.TAG_SET_TTL
+    EXPERIENCE_LIST_TTL = 3600  # 1 hour
+    EXPERIENCE_DETAIL_TTL = 6 * 3600  # 6 hours
+    HOT_EXPERIENCES_TTL = 300  # 5 minutes; trending moves with bookings and is cheap to rebuild
+    PROVIDER_DATA_TTL = 3600  # 1 hour
     TRENDING_TTL = 3600  # 1 hour
+    LIST_MAX_CACHED_PAGES = 5  # cursor pages cached per filter combination
 
 # --- Schemas ---
+class LatLngField(fields.Field):
+    """Parses a "lat,lng" query value to (lat, lng), rounded to ~10 m so nearby requests share cache entries"""
+
+    def _deserialize(self, value, attr, data, **kwargs):
+        try:
+            latitude, longitude = (float(part) for part in str(value).split(','))
+        except ValueError:
+            raise ValidationError('Expected "latitude,longitude"')
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValidationError("Coordinates out of range")
+        return (round(latitude, 4), round(longitude, 4))
+
 class ExperienceFilterSchema(Schema):
     """Schema for filtering experiences"""
     destinations = fields.List(fields.Str(), missing=[])
@@ -103,6 +164,9 @@ class ExperienceFilterSchema(Schema):
         "created_at", "start_date", "price_asc", "price_desc", "popularity", "availability"
     ]))
     test = fields.Bool(missing=False)
+    # Proximity filter; results are then ordered by distance from `near`
+    near = LatLngField(missing=None)
+    radius = fields.Float(missing=10, validate=validate.Range(min=0.1, max=100))  # km
 
 class PublicExperienceSchema(Schema):
     """Public experience schema for API responses"""
@@ -138,8 +202,11 @@ public_experience_schema = PublicExperienceSchema()
 class ExperienceCache:
     """High-performance caching utility for experiences"""
     
-    def __init__(self, cache: Cache):
+    def __init__(self, cache: Cache, hot_cache=None):
         self.cache = cache
+        # Hot single-key reads (trending, detail, provider data) go through the
+        # in-process tier when the app has one (utils.local_cache.TieredCache)
+        self.hot_cache = hot_cache or cache
         self.config = CacheConfig()
     
     def _generate_cache_key(self, prefix: str, **kwargs) -> str:
@@ -156,56 +223,274 @@ class ExperienceCache:
         key_string = "|".join(key_parts)
         return f"exp:{hashlib.md5(key_string.encode()).hexdigest()}"
     
-    def get_experience_list(self, **filters) -> Optional[List[Dict]]:
-        """Get cached experience list"""
-        cache_key = self._generate_cache_key("list", **filters)
-        return self.cache.get(cache_key)
+    @staticmethod
+    def normalize_filters(filters: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Canonical form of the list filters used for cache keys: list values
+        stripped, de-duplicated and sorted, search whitespace/case folded,
+        and anything equal to its schema default dropped so that
+        `min_price=0` and an omitted `min_price` share one entry.
+        """
+        canonical = {}
+        for key, value in filters.items():
+            if key in ('cursor', 'test'):
+                continue
+            if isinstance(value, list):
+                value = sorted({str(item).strip() for item in value if str(item).strip()})
+            elif isinstance(value, str):
+                value = " ".join(value.split())
+                if key == 'search':
+                    value = value.lower()
+            elif isinstance(value, float) and value.is_integer():
+                value = int(value)
+            elif isinstance(value, (date, datetime)):
+                value = value.isoformat()
+
+            default = filter_schema.fields[key].load_default if key in filter_schema.fields else None
+            if value in (None, "", []) or value == default:
+                continue
+            canonical[key] = value
+        return canonical
+
+    def list_cache_key(self, filters: Dict[str, Any]) -> str:
+        """Cache key (and ETag variant) of one list page: canonical filters + cursor"""
+        canonical = self.normalize_filters(filters)
+        if filters.get('cursor'):
+            canonical['cursor'] = filters['cursor']
+        return self._generate_cache_key("list", **canonical)
+
+    def get_experience_list(self, **filters) -> Optional[bytes]:
+        """Get cached experience list page (pre-serialized JSON body)"""
+        body = self.cache.get(self.list_cache_key(filters))
+        return body if isinstance(body, bytes) else None
+    
+    def set_experience_list(self, body: bytes, tags=(), **filters) -> None:
+        """Cache experience list page body under the catalogue tag plus the given tags"""
+        cache_set_tagged(self.list_cache_key(filters), body, self.config.EXPERIENCE_LIST_TTL,
+                         [CATALOGUE_TAG, *tags], cache=self.cache)
+    
+    def fill_hot_experiences(self, compute):
+        """
+        Get the hot/trending response body, recomputing through a single flight
+        on expiry. `compute()` returns (body, tags); result is (body, cached).
+        """
+        return get_or_fill(self.hot_cache, "exp:hot:all", self._with_catalogue_tag(compute), self.config.HOT_EXPERIENCES_TTL)
+    
+    def refresh_hot_experiences(self, compute) -> bool:
+        """Recompute the hot/trending body ahead of expiry (cache warming)"""
+        return refresh(self.hot_cache, "exp:hot:all", self._with_catalogue_tag(compute), self.config.HOT_EXPERIENCES_TTL)
+    
+    @staticmethod
+    def _with_catalogue_tag(compute):
+        def compute_tagged():
+            experiences, tags = compute()
+            return experiences, [CATALOGUE_TAG, *tags]
+        return compute_tagged
     
-    def set_experience_list(self, experiences: List[Dict], **filters) -> None:
-        """Cache experience list"""
-        cache_key = self._generate_cache_key("list", **filters)
-        self.cache.set(cache_key, experiences, timeout=self.config.EXPERIENCE_LIST_TTL)
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """Multi-get in one round trip (Redis MGET); misses are left out of the result"""
+        if not keys:
+            return {}
+        values = self.hot_cache.get_many(*keys)
+        return {key: value for key, value in zip(keys, values) if value is not None}
     
-    def get_hot_experiences(self) -> Optional[List[Dict]]:
-        """Get hot/trending experiences"""
-        return self.cache.get("exp:hot:all")
+    def set_many(self, mapping: Dict[str, Any], timeout: int, tags_by_key: Optional[Dict[str, List[str]]] = None) -> None:
+        """Multi-set in one pipelined round trip (SET ... EX per key), plus tag registration"""
+        cache_set_many_tagged(mapping, timeout, tags_by_key or {}, cache=self.hot_cache)
     
-    def set_hot_experiences(self, experiences: List[Dict]) -> None:
-        """Cache hot experiences"""
-        self.cache.set("exp:hot:all", experiences, timeout=self.config.HOT_EXPERIENCES_TTL)
+    def get_provider_data_many(self, provider_ids) -> Dict[str, Dict]:
+        """Get cached provider data for several providers, keyed by provider id"""
+        provider_ids = list(dict.fromkeys(str(provider_id) for provider_id in provider_ids))
+        cached = self.get_many([f"provider:{provider_id}" for provider_id in provider_ids])
+        return {provider_id: cached[f"provider:{provider_id}"]
+                for provider_id in provider_ids if f"provider:{provider_id}" in cached}
     
-    def get_provider_data(self, provider_id: str) -> Optional[Dict]:
-        """Get cached provider data"""
-        return self.cache.get(f"provider:{provider_id}")
+    def set_provider_data_many(self, provider_data: Dict[str, Dict]) -> None:
+        """Cache provider data for several providers"""
+        self.set_many(
+            {f"provider:{provider_id}": data for provider_id, data in provider_data.items()},
+            self.config.PROVIDER_DATA_TTL,
+            {f"provider:{provider_id}": [provider_tag(provider_id)] for provider_id in provider_data},
+        )
     
-    def set_provider_data(self, provider_id: str, data: Dict) -> None:
-        """Cache provider data"""
-        self.cache.set(f"provider:{provider_id}", data, timeout=self.config.PROVIDER_DATA_TTL)
+    def load_provider_data(self, provider_ids) -> Dict[str, Dict]:
+        """
+        Hydrate public provider data: one cache MGET, one `User.id.in_` query
+        for the misses, one pipelined cache write.
+        """
+        provider_data = self.get_provider_data_many(provider_ids)
+        missing = [provider_id for provider_id in dict.fromkeys(str(p) for p in provider_ids)
+                   if provider_id not in provider_data]
+        if missing:
+            rows = (db.session.query(User.id, User.name, User.avatar_url, User.bio)
+                    .filter(User.id.in_(missing))
+                    .all())
+            loaded = {
+                str(row.id): {
+                    'id': str(row.id),
+                    'name': row.name,
+                    'avatar_url': row.avatar_url,
+                    'bio': row.bio,
+                }
+                for row in rows
+            }
+            self.set_provider_data_many(loaded)
+            provider_data.update(loaded)
+        return provider_data
     
-    def invalidate_pattern(self, pattern: str) -> None:
-        """Invalidate cache keys matching pattern"""
-        # Note: This requires Redis and python-redis with scan support
+    def fill_experience_detail(self, experience_id: str, compute):
+        """
+        Get the public experience detail body through a single flight. `compute()`
+        returns (body, tags), with body None when the experience isn't public.
+        """
+        return get_or_fill(self.hot_cache, f"exp:detail:{experience_id}", compute, self.config.EXPERIENCE_DETAIL_TTL)
+    
+    def refresh_experience_detail(self, experience_id: str, compute) -> bool:
+        """Recompute one detail body ahead of expiry (cache warming)"""
+        return refresh(self.hot_cache, f"exp:detail:{experience_id}", compute, self.config.EXPERIENCE_DETAIL_TTL)
+    
+    def overlay_availability(self, body: bytes) -> bytes:
+        """
+        Cached list/trending body with each experience's `available_slots`
+        replaced by its live counter (utils.availability), in one MGET.
+        The counts are spliced into the cached bytes, which are not decoded.
+        Falls back to the cached values when Redis can't answer.
+        """
         try:
-            if hasattr(self.cache.cache, 'scan_iter'):
-                for key in self.cache.cache.scan_iter(match=pattern):
-                    self.cache.delete(key.decode() if isinstance(key, bytes) else key)
+            ids = [experience_id.decode() for experience_id in _EXPERIENCE_AVAILABILITY.findall(body)]
+            if not ids:
+                return body
+            live = experience_availability(ids)
+            if not live:
+                return body
+            
+            def splice(match):
+                available = live.get(match.group(1).decode())
+                if available is None:
+                    return match.group(0)
+                return b'{"id":"%s","available_slots":%d' % (match.group(1), max(available, 0))
+            
+            return _EXPERIENCE_AVAILABILITY.sub(splice, body)
         except Exception as e:
-            logger.warning(f"Cache invalidation failed: {e}")
+            logger.warning(f"Live availability overlay failed: {e}")
+            return body
+    
+    def overlay_slot_availability(self, body: bytes) -> bytes:
+        """Cached detail body with the experience total and per-slot counts made live, spliced in place"""
+        try:
+            experience = _EXPERIENCE_AVAILABILITY.search(body)
+            if experience is None:
+                return body
+            slot_ids = [slot_id.decode() for slot_id, _ in _SLOT_AVAILABILITY.findall(body)]
+            total, live = slot_availability(experience.group(1).decode(), slot_ids)
+            
+            def splice_slot(match):
+                available = live.get(match.group(1).decode())
+                if available is None:
+                    return match.group(0)
+                capacity = int(match.group(2))
+                return b'{"id":"%s","capacity":%d,"booked":%d,"available":%d' % (
+                    match.group(1), capacity, capacity - available, max(available, 0))
+            
+            body = (body[:experience.start()]
+                    + b'{"id":"%s","available_slots":%d' % (experience.group(1), max(total, 0))
+                    + body[experience.end():])
+            return _SLOT_AVAILABILITY.sub(splice_slot, body)
+        except Exception as e:
+            logger.warning(f"Live slot availability overlay failed: {e}")
+            return body
+    
+    @staticmethod
+    def row_tags(rows) -> List[str]:
+        """Experience and provider tags for a page of (Experience, ExperienceSummary) rows"""
+        tags = set()
+        for experience, _ in rows:
+            tags.add(experience_tag(experience.id))
+            tags.add(provider_tag(experience.provider_id))
+        return sorted(tags)
+    
+    def invalidate(self, *tags) -> int:
+        """Drop every entry registered under the given tags"""
+        return invalidate_tags(*tags, cache=self.cache)
 
 # --- Cursor Utilities ---
 class CursorPagination:
-    """Cursor-based pagination for high performance"""
-    
+    """
+    Keyset (seek) pagination. The cursor carries the full composite sort key
+    of the last row, so every page is an index range scan that starts where
+    the previous one stopped, whatever the page depth.
+    """
+
+    # sort_by -> ((column, direction, value type), ...) followed by the id tie-breaker.
+    # Summary sorts tie-break on experience_summaries.experience_id so the whole
+    # ORDER BY is served by one idx_experience_summaries_* index.
+    SORT_KEYS = {
+        "created_at": (((Experience.created_at, "desc", "datetime"),), Experience.id),
+        "start_date": (((Experience.start_date, "asc", "date"),), Experience.id),
+        "price_asc": (((ExperienceSummary.min_price, "asc", "decimal"),), ExperienceSummary.experience_id),
+        "price_desc": (((ExperienceSummary.max_price, "desc", "decimal"),), ExperienceSummary.experience_id),
+        "popularity": (
+            (
+                (ExperienceSummary.total_booked, "desc", "int"),
+                (ExperienceSummary.created_at, "desc", "datetime"),
+            ),
+            ExperienceSummary.experience_id,
+        ),
+        "availability": (((ExperienceSummary.available_slots, "desc", "int"),), ExperienceSummary.experience_id),
+    }
+
+    _PARSERS = {
+        "float": float,
+        "datetime": datetime.fromisoformat,
+        "date": date.fromisoformat,
+        "decimal": Decimal,
+        "int": int,
+    }
+
+    @classmethod
+    def sort_spec(cls, sort_by: str):
+        return cls.SORT_KEYS.get(sort_by, cls.SORT_KEYS["created_at"])
+
+    @staticmethod
+    def relevance_spec(score):
+        """Sort spec for search results: the relevance score, then the summary id"""
+        return ((score, "desc", "float"),), ExperienceSummary.experience_id
+
     @staticmethod
-    def encode_cursor(experience_id: str, sort_value: Any) -> str:
-        """Encode cursor for pagination"""
+    def distance_spec(distance):
+        """Sort spec for proximity results: metres from the origin, then the summary id"""
+        return ((distance, "asc", "float"),), ExperienceSummary.experience_id
+
+    @classmethod
+    def order_by_clauses(cls, sort_by: str, spec=None) -> list:
+        """ORDER BY matching the cursor key exactly"""
+        keys, id_column = spec or cls.sort_spec(sort_by)
+        clauses = [desc(column) if direction == "desc" else asc(column) for column, direction, _ in keys]
+        clauses.append(asc(id_column))
+        return clauses
+
+    @classmethod
+    def sort_values(cls, experience, summary, sort_by: str) -> list:
+        """Read the sort key of a result row from the ORM objects (not the serialized dict)"""
+        keys, _ = cls.sort_spec(sort_by)
+        values = []
+        for column, _, _ in keys:
+            source = summary if column.class_ is ExperienceSummary else experience
+            values.append(getattr(source, column.key))
+        return values
+
+    @staticmethod
+    def encode_cursor(experience_id: str, sort_values: list, sort_by: str, page: int = 2) -> str:
+        """Encode cursor for pagination (page is the depth of the page it points to)"""
         cursor_data = {
-            'id': experience_id,
-            'sort_value': str(sort_value) if sort_value is not None else None
+            'id': str(experience_id),
+            'sort_by': sort_by,
+            'values': [value.isoformat() if isinstance(value, (datetime, date)) else str(value) for value in sort_values],
+            'p': page,
         }
         cursor_json = json.dumps(cursor_data)
         return base64.b64encode(cursor_json.encode()).decode()
-    
+
     @staticmethod
     def decode_cursor(cursor: str) -> Dict[str, Any]:
         """Decode cursor for pagination"""
@@ -214,33 +499,39 @@ class CursorPagination:
             return json.loads(cursor_json)
         except Exception:
             return {}
-    
-    @staticmethod
-    def build_query_conditions(cursor_data: Dict, sort_by: str):
-        """Build SQLAlchemy conditions for cursor pagination"""
-        if not cursor_data or not cursor_data.get('id'):
-            return None
-        
-        experience_id = cursor_data['id']
-        sort_value = cursor_data.get('sort_value')
-        
-        if sort_by == "created_at":
-            if sort_value:
-                return or_(
-                    Experience.created_at < datetime.fromisoformat(sort_value),
-                    and_(Experience.created_at == datetime.fromisoformat(sort_value), Experience.id > experience_id)
-                )
-        elif sort_by == "start_date":
-            if sort_value:
-                return or_(
-                    Experience.start_date > datetime.fromisoformat(sort_value).date(),
-                    and_(Experience.start_date == datetime.fromisoformat(sort_value).date(), Experience.id > experience_id)
-                )
-        elif sort_by in ["price_asc", "price_desc"]:
-            # For price sorting, we'll need to join with slots
-            return Experience.id > experience_id  # Simplified for now
-        
-        return Experience.id > experience_id
+
+    @classmethod
+    def build_query_conditions(cls, cursor_data: Dict, sort_by: str, spec=None):
+        """
+        Build the seek predicate (k1, ..., kn, id) > (v1, ..., vn, last_id),
+        expanded per column so mixed ASC/DESC keys compare correctly.
+        Raises ValueError for cursors that don't belong to this sort.
+        """
+        if not cursor_data:
+            raise ValueError("Malformed cursor")
+
+        keys, id_column = spec or cls.sort_spec(sort_by)
+        raw_values = cursor_data.get('values')
+        if cursor_data.get('sort_by') != sort_by or not isinstance(raw_values, list) or len(raw_values) != len(keys):
+            raise ValueError("Cursor does not match the requested sort order")
+
+        values = [cls._PARSERS[value_type](raw) for (_, _, value_type), raw in zip(keys, raw_values)]
+        last_id = uuid.UUID(cursor_data['id'])
+
+        branches = []
+        for position in range(len(keys) + 1):
+            equalities = [keys[i][0] == values[i] for i in range(position)]
+            if position < len(keys):
+                column, direction, _ = keys[position]
+                step = column < values[position] if direction == "desc" else column > values[position]
+            else:
+                step = id_column > last_id
+            branches.append(and_(*equalities, step))
+
+        # Redundant bound on the leading column gives the planner a plain index range
+        leading, leading_direction, _ = keys[0]
+        bound = leading <= values[0] if leading_direction == "desc" else leading >= values[0]
+        return and_(bound, or_(*branches))
 
 # --- Performance Decorators ---
 def with_caching(cache_func=None):
@@ -282,7 +573,7 @@ class PublicExperienceList(Resource):
     """High-performance public experience listing with caching and cursor pagination"""
     
     def __init__(self):
-        self.cache_util = ExperienceCache(current_app.cache)
+        self.cache_util = ExperienceCache(current_app.cache, getattr(current_app, "tiered_cache", None))
         self.pagination = CursorPagination()
     
     @handle_db_errors
@@ -291,7 +582,13 @@ class PublicExperienceList(Resource):
         
         # Validate and parse request parameters
         try:
-            filters = filter_schema.load(request.args.to_dict(flat=True))
+            args = request.args.to_dict(flat=True)
+            # List filters may be repeated (?destinations=a&destinations=b) or comma separated
+            for key in ('destinations', 'activities'):
+                values = [part for value in request.args.getlist(key) for part in value.split(',')]
+                if values:
+                    args[key] = values
+            filters = filter_schema.load(args)
             # Convert single-item lists back to strings for certain fields
             for key in ['status', 'search', 'sort_by', 'cursor', 'test']:
                 if key in filters and isinstance(filters[key], list):
@@ -299,61 +596,106 @@ class PublicExperienceList(Resource):
         except ValidationError as e:
             return {"error": "Invalid parameters", "details": e.messages}, 400
         
-        # Check cache first (skip for real-time data requests)
-        if not filters.get('search'):  # Don't cache search results
-            cached_result = self.cache_util.get_experience_list(**filters)
-            if cached_result:
-                return {
-                    "experiences": cached_result["experiences"],
-                    "pagination": cached_result["pagination"],
-                    "cached": True
-                }, 200
+        # Query with the canonical list values so equivalent requests return identical pages
+        canonical = self.cache_util.normalize_filters(filters)
+        filters['destinations'] = canonical.get('destinations', [])
+        filters['activities'] = canonical.get('activities', [])
+        
+        cursor_data = self.pagination.decode_cursor(filters['cursor']) if filters.get('cursor') else {}
+        page = cursor_data.get('p', 1) if isinstance(cursor_data.get('p', 1), int) else 1
+        cacheable = page <= CacheConfig.LIST_MAX_CACHED_PAGES
+        
+        # Conditional GET: answer from the catalogue version alone (the date is part of
+        # the variant because "upcoming" filtering moves with it)
+        etag = make_etag([CATALOGUE_TAG], variant=f"{self.cache_util.list_cache_key(filters)}|{date.today()}")
+        not_modified = not_modified_response(etag)
+        if not_modified:
+            return not_modified
+        
+        # Check cache first (search pages are cached per normalized query; deep pages are not cached)
+        if cacheable:
+            cached_body = self.cache_util.get_experience_list(**filters)
+            if cached_body:
+                cached_body = self.cache_util.overlay_availability(cached_body)
+                return json_response(cached_body, cached=True, headers=etag_headers(etag))
         
+        try:
+            body, tags = self.render_page(filters, cursor_data, page)
+        except ValueError as e:
+            logger.info(f"Rejected cursor: {e}")
+            return {"error": "Invalid cursor"}, 400
+        
+        # Cache the first LIST_MAX_CACHED_PAGES pages of each filter combination
+        if cacheable:
+            self.cache_util.set_experience_list(body, tags=tags, **filters)
+        ensure_versions([CATALOGUE_TAG])
+        
+        return json_response(body, headers=etag_headers(etag))
+    
+    def render_page(self, filters, cursor_data=None, page=1):
+        """
+        Query and serialize one page for parsed, canonical filters; returns
+        (JSON body, cache tags). Raises ValueError for a cursor that doesn't
+        fit the filters. Also used by the cache warmer.
+        """
         # Build base query with optimized loading
-        query = self._build_optimized_query(filters)
+        # Proximity results are ordered by distance, search results by relevance,
+        # everything else by sort_by; the computed rank is then the cursor key
+        if filters.get('near'):
+            rank = self._distance(filters['near'])
+            sort_by, spec = "distance", self.pagination.distance_spec(rank)
+        elif filters.get('search'):
+            rank = self._search_score(filters['search'])
+            sort_by, spec = "relevance", self.pagination.relevance_spec(rank)
+        else:
+            rank, sort_by, spec = None, filters['sort_by'], None
+        
+        query = self._build_optimized_query(filters, rank=rank)
         
-        # Apply cursor pagination
-        cursor_data = {}
+        # Apply cursor pagination (seek past the last row of the previous page)
         if filters.get('cursor'):
-            cursor_data = self.pagination.decode_cursor(filters['cursor'])
-            cursor_conditions = self.pagination.build_query_conditions(cursor_data, filters['sort_by'])
-            if cursor_conditions is not None:
-                query = query.filter(cursor_conditions)
+            try:
+                cursor_conditions = self.pagination.build_query_conditions(cursor_data, sort_by, spec=spec)
+            except (ValueError, KeyError, TypeError, ArithmeticError) as e:
+                raise ValueError(str(e)) from e
+            query = query.filter(cursor_conditions)
         
-        # Apply sorting (skip for search queries as they have their own ordering)
-        if not filters.get('search'):
-            query = self._apply_sorting(query, filters['sort_by'])
+        query = query.order_by(*self.pagination.order_by_clauses(sort_by, spec=spec))
         
         # Execute query with limit + 1 for next cursor detection
         limit = filters['limit']
-        experiences_raw = query.limit(limit + 1).all()
+        rows = query.limit(limit + 1).all()
         
-        # Handle search results differently (they return tuples)
-        if filters.get('search'):
-            experiences_raw = [exp for exp, score in experiences_raw]
+        # Search/proximity rows also carry their rank, which is their sort key
+        if rank is not None:
+            experiences_raw = [(exp, summary) for exp, summary, _ in rows]
+        else:
+            experiences_raw = rows
         
         # Check if there are more results
         has_next = len(experiences_raw) > limit
         if has_next:
             experiences_raw = experiences_raw[:-1]  # Remove the extra record
         
-        # Batch load provider data for better performance
-        provider_data = self._batch_load_provider_data([exp.provider_id for exp in experiences_raw])
-        
-        # Transform to cached format
+        # Transform to cached format (provider and slot aggregates come from the summary)
         experiences = []
         next_cursor = None
         
-        for exp in experiences_raw:
-            provider_info = provider_data.get(str(exp.provider_id), {})
-            cached_exp = CachedExperience.from_experience(exp, provider_info)
-            experiences.append(asdict(cached_exp))
-        
-        # Generate next cursor
-        if has_next and experiences:
-            last_exp = experiences[-1]
-            sort_value = self._get_sort_value(last_exp, filters['sort_by'])
-            next_cursor = self.pagination.encode_cursor(last_exp['id'], sort_value)
+        for index, (exp, summary) in enumerate(experiences_raw):
+            cached_exp = CachedExperience.from_summary(exp, summary)
+            item = asdict(cached_exp)
+            if filters.get('near'):
+                item['distance_km'] = round(rows[index][2] / 1000, 3)
+            experiences.append(item)
+        
+        # Generate next cursor from the last row's full sort key
+        if has_next and experiences_raw:
+            last_exp, last_summary = experiences_raw[-1]
+            if rank is not None:
+                sort_values = [rows[len(experiences_raw) - 1][2]]
+            else:
+                sort_values = self.pagination.sort_values(last_exp, last_summary, sort_by)
+            next_cursor = self.pagination.encode_cursor(last_exp.id, sort_values, sort_by, page + 1)
         
         # Prepare response
         result = {
@@ -366,334 +708,308 @@ class PublicExperienceList(Resource):
             }
         }
         
-        # Cache the result (skip search queries and first page only)
-        if not filters.get('search') and not filters.get('cursor'):
-            self.cache_util.set_experience_list(result, **filters)
-        
-        return result, 200
+        return dumps_bytes(result), self.cache_util.row_tags(experiences_raw)
     
-    def _build_optimized_query(self, filters):
-        """Build optimized SQLAlchemy query with eager loading"""
+    def _build_optimized_query(self, filters, rank=None):
+        """
+        Build the list query over experiences joined to their summary rows.
+        Searches are restricted to indexed full-text/trigram matches and
+        proximity filters to the indexed radius; rows also carry `rank`
+        (search score or distance) when one is given.
+        """
+        columns = [Experience, ExperienceSummary] + ([rank] if rank is not None else [])
+        query = (db.session.query(*columns)
+                .join(ExperienceSummary, ExperienceSummary.experience_id == Experience.id)
+                .filter(ExperienceSummary.status == filters['status']))
         
-        # Search functionality (fuzzy + ILIKE)
         if filters.get('search'):
-            raw_search = filters['search']
-
-            # Create the score subquery
-            score_subq = (
-                db.session.query(
-                    Experience.id.label("exp_id"),
-                    func.greatest(
-                        func.similarity(Experience.title, raw_search),
-                        func.similarity(cast(Experience.meeting_point["address"], String), raw_search),
-                        func.similarity(cast(Experience.meeting_point["name"], String), raw_search)
-                    ).label("score")
-                )
-                .subquery()
-            )
+            query = query.filter(self._search_condition(filters['search']))
+        
+        if filters.get('near'):
+            query = query.filter(self._near_condition(filters['near'], filters['radius']))
+        
+        # Apply filters: overlap on the summary's text[] mirrors (GIN indexed)
+        if filters.get('destinations'):
+            query = query.filter(ExperienceSummary.destinations.overlap(filters['destinations']))
+        
+        if filters.get('activities'):
+            query = query.filter(ExperienceSummary.activities.overlap(filters['activities']))
+        
+        if filters.get('start_date_from'):
+            query = query.filter(Experience.start_date >= filters['start_date_from'])
+        
+        if filters.get('start_date_to'):
+            query = query.filter(Experience.start_date <= filters['start_date_to'])
+        
+        # Price filtering and upcoming-slot check against the summary
+        return self._apply_summary_filters(query, filters)
+    
+    @staticmethod
+    def _search_terms(search):
+        return " ".join(search.split()).lower()
+    
+    def _search_condition(self, search):
+        """
+        Index-friendly match: tsvector @@ (idx_experience_summaries_search_vector)
+        OR word-trigram similarity (idx_experience_summaries_search_trgm), so
+        typos and partial words still match. Postgres combines both with a BitmapOr.
+        """
+        terms = self._search_terms(search)
+        tsquery = func.websearch_to_tsquery('english', terms)
+        return or_(
+            ExperienceSummary.search_vector.op('@@')(tsquery),
+            literal(terms).op('<%')(ExperienceSummary.search_document),
+        )
+    
+    def _search_score(self, search):
+        """
+        Relevance of a matched row: best of full-text rank and word similarity.
+        Both are real; as double precision the score's text in the cursor
+        parses back to exactly the same value, so ties seek correctly.
+        """
+        terms = self._search_terms(search)
+        tsquery = func.websearch_to_tsquery('english', terms)
+        return cast(func.greatest(
+            func.ts_rank_cd(ExperienceSummary.search_vector, tsquery),
+            func.word_similarity(terms, ExperienceSummary.search_document),
+        ), Float(precision=53))
+    
+    @staticmethod
+    def _summary_location():
+        return func.ll_to_earth(ExperienceSummary.latitude, ExperienceSummary.longitude)
+    
+    def _distance(self, near):
+        """Great-circle distance in metres from `near` to the meeting point"""
+        latitude, longitude = near
+        return func.earth_distance(func.ll_to_earth(latitude, longitude), self._summary_location())
+    
+    def _near_condition(self, near, radius_km):
+        """
+        Meeting points within `radius_km` of `near`: the earth_box containment
+        is answered by idx_experience_summaries_geo (GiST), the exact distance
+        check then trims the box corners.
+        """
+        latitude, longitude = near
+        radius = radius_km * 1000
+        return and_(
+            ExperienceSummary.latitude.isnot(None),
+            func.earth_box(func.ll_to_earth(latitude, longitude), radius).op('@>')(self._summary_location()),
+            self._distance(near) <= radius,
+        )
+    
+    def _apply_summary_filters(self, query, filters):
+        """Filter on precomputed slot aggregates instead of probing the slots table"""
+        
+        # An experience matches a price range when its slot price range overlaps it
+        if filters.get('min_price'):
+            query = query.filter(ExperienceSummary.max_price >= filters['min_price'])
+        
+        if filters.get('max_price'):
+            query = query.filter(ExperienceSummary.min_price <= filters['max_price'])
+        
+        # Filter out past experiences (no slot on or after today)
+        return query.filter(ExperienceSummary.last_slot_date >= date.today())
+    
 
-            # Create aliased Experience for the main query
-            scored_exp = aliased(Experience)
-
-            # Build the query with the aliased table
-            query = (
-                db.session.query(scored_exp, score_subq.c.score)
-                .join(score_subq, scored_exp.id == score_subq.c.exp_id)
-                .options(
-                    joinedload(scored_exp.provider),
-                    selectinload(scored_exp.slots)
-                )
-                .filter(score_subq.c.score > 0.14)
-                .filter(scored_exp.status == filters['status'])
-            )
+class ExperienceSuggestions(Resource):
+    """Typeahead suggestions served from the Redis prefix index (no database access)"""
+    
+    MAX_LIMIT = 20
+    
+    def get(self):
+        """Suggest titles, destinations, activities and places for a typed prefix"""
+        prefix = request.args.get('q', '', type=str)[:100]
+        limit = min(max(request.args.get('limit', 8, type=int), 1), self.MAX_LIMIT)
+        
+        try:
+            suggestions = suggest(prefix, limit=limit)
+        except Exception as e:
+            # Typeahead is best effort; the search endpoint still works
+            logger.warning(f"Suggestion lookup failed: {e}")
+            suggestions = []
+        
+        return json_response(
+            dumps_bytes({"query": prefix, "suggestions": suggestions}),
+            headers={"Cache-Control": "public, max-age=60"},
+        )
 
-            # Apply filters using the aliased table
-            if filters.get('destinations'):
-                query = query.filter(scored_exp.destinations.op('&&')(filters['destinations']))
-            
-            if filters.get('activities'):
-                query = query.filter(scored_exp.activities.op('&&')(filters['activities']))
-            
-            if filters.get('start_date_from'):
-                query = query.filter(scored_exp.start_date >= filters['start_date_from'])
-            
-            if filters.get('start_date_to'):
-                query = query.filter(scored_exp.start_date <= filters['start_date_to'])
-
-            # Price filtering for search queries
-            if filters.get('min_price') or filters.get('max_price'):
-                price_subquery = (db.session.query(Slot.experience_id)
-                                .filter(Slot.experience_id == scored_exp.id))
-                
-                if filters.get('min_price'):
-                    price_subquery = price_subquery.filter(Slot.price >= filters['min_price'])
-                
-                if filters.get('max_price'):
-                    price_subquery = price_subquery.filter(Slot.price <= filters['max_price'])
-                
-                query = query.filter(price_subquery.exists())
-
-            # Filter out past experiences - use the aliased table
-            upcoming_slot_exists = (
-                db.session.query(Slot.id)
-                .filter(
-                    Slot.experience_id == scored_exp.id,
-                    Slot.date >= date.today()
-                )
-                .exists()
-            )
-            query = query.filter(upcoming_slot_exists)
 
-            # Order by score, then created_at, then id - all using the aliased table
-            query = query.order_by(score_subq.c.score.desc(), scored_exp.created_at.desc(), scored_exp.id.asc())
-            
-            return query
+class ExperienceFacets(Resource):
+    """Filter chip counts served from the Redis facet index (no database access)"""
 
-        else:
-            # Non-search query path
-            query = (db.session.query(Experience)
-                    .options(
-                        joinedload(Experience.provider),
-                        selectinload(Experience.slots)
-                    )
-                    .filter(Experience.status == filters['status']))
-            
-            # Apply filters
-            if filters.get('destinations'):
-                query = query.filter(Experience.destinations.op('&&')(filters['destinations']))
-            
-            if filters.get('activities'):
-                query = query.filter(Experience.activities.op('&&')(filters['activities']))
-            
-            if filters.get('start_date_from'):
-                query = query.filter(Experience.start_date >= filters['start_date_from'])
-            
-            if filters.get('start_date_to'):
-                query = query.filter(Experience.start_date <= filters['start_date_to'])
-            
-            # Price filtering (requires subquery for slot prices)
-            if filters.get('min_price') or filters.get('max_price'):
-                price_subquery = (db.session.query(Slot.experience_id)
-                                .filter(Slot.experience_id == Experience.id))
-                
-                if filters.get('min_price'):
-                    price_subquery = price_subquery.filter(Slot.price >= filters['min_price'])
-                
-                if filters.get('max_price'):
-                    price_subquery = price_subquery.filter(Slot.price <= filters['max_price'])
-                
-                query = query.filter(price_subquery.exists())
-            
-            # Filter out past experiences
-            upcoming_slot_exists = (
-                db.session.query(Slot.id)
-                .filter(
-                    Slot.experience_id == Experience.id,
-                    Slot.date >= date.today()
-                )
-                .exists()
+    def get(self):
+        """Counts per destination, activity and price bucket for the current filter set"""
+        selection = {}
+        # Same list syntax as the listing: repeated or comma separated
+        for key in ('destinations', 'activities'):
+            values = [part.strip() for value in request.args.getlist(key) for part in value.split(',')]
+            selection[key] = sorted({value for value in values if value})
+        min_price = request.args.get('min_price', type=float)
+        max_price = request.args.get('max_price', type=float)
+        limit = min(max(request.args.get('limit', 20, type=int), 1), MAX_FACET_VALUES)
+
+        try:
+            facets = facet_counts(
+                destinations=selection['destinations'],
+                activities=selection['activities'],
+                min_price=min_price or None,  # min_price=0 means no lower bound, as in the list
+                max_price=max_price,
+                limit=limit,
             )
-            query = query.filter(upcoming_slot_exists)
-
-        return query
-    
-    def _apply_sorting(self, query, sort_by):
-        """Apply sorting to the query"""
-        
-        if sort_by == "created_at":
-            return query.order_by(desc(Experience.created_at), asc(Experience.id))
-        
-        elif sort_by == "start_date":
-            return query.order_by(asc(Experience.start_date), asc(Experience.id))
-        
-        elif sort_by == "price_asc":
-            # Join with slots and order by minimum price
-            min_price = func.min(Slot.price).label('min_price')
-            return (query.join(Slot)
-                   .group_by(Experience.id)
-                   .order_by(asc(min_price), asc(Experience.id)))
-        
-        elif sort_by == "price_desc":
-            # Join with slots and order by maximum price
-            max_price = func.max(Slot.price).label('max_price')
-            return (query.join(Slot)
-                   .group_by(Experience.id)
-                   .order_by(desc(max_price), asc(Experience.id)))
-        
-        elif sort_by == "popularity":
-            # Order by total bookings (sum of booked slots)
-            total_bookings = func.sum(Slot.booked).label('total_bookings')
-            return (query.outerjoin(Slot)
-                   .group_by(Experience.id)
-                   .order_by(desc(total_bookings), desc(Experience.created_at), asc(Experience.id)))
-        
-        elif sort_by == "availability":
-            # Order by available slots (capacity - booked)
-            available_slots = func.sum(Slot.capacity - Slot.booked).label('available_slots')
-            return (query.outerjoin(Slot)
-                   .group_by(Experience.id)
-                   .order_by(desc(available_slots), asc(Experience.id)))
-        
-        else:
-            # Default to created_at
-            return query.order_by(desc(Experience.created_at), asc(Experience.id))
-    
-    def _batch_load_provider_data(self, provider_ids):
-        """Batch load provider data with caching"""
-        provider_data = {}
-        uncached_ids = []
-        
-        # Check cache first
-        for provider_id in set(provider_ids):
-            cached = self.cache_util.get_provider_data(str(provider_id))
-            if cached:
-                provider_data[str(provider_id)] = cached
-            else:
-                uncached_ids.append(provider_id)
-        
-        # Load uncached provider data - FIXED: Use proper query without load_only
-        if uncached_ids:
-            providers = (User.query
-                        .filter(User.id.in_(uncached_ids))
-                        .all())
-            
-            for provider in providers:
-                data = {
-                    'id': str(provider.id),
-                    'name': provider.name,
-                    'avatar_url': provider.avatar_url
-                }
-                provider_data[str(provider.id)] = data
-                self.cache_util.set_provider_data(str(provider.id), data)
-        
-        return provider_data
-    
-    def _get_sort_value(self, experience_dict, sort_by):
-        """Get the sort value for cursor generation"""
-        if sort_by == "created_at":
-            return experience_dict.get('created_at')
-        elif sort_by == "start_date":
-            return experience_dict.get('start_date')
-        elif sort_by in ["price_asc", "price_desc"]:
-            return experience_dict.get('min_price' if sort_by == "price_asc" else 'max_price')
-        elif sort_by == "popularity":
-            # This would need to be calculated from bookings
-            return experience_dict.get('created_at')  # Fallback
-        elif sort_by == "availability":
-            return experience_dict.get('available_slots')
-        else:
-            return experience_dict.get('created_at')
+        except Exception as e:
+            logger.error(f"Facet lookup failed: {e}")
+            return {"error": "Facets temporarily unavailable"}, 503
+
+        return json_response(
+            dumps_bytes({"filters": {**selection, "min_price": min_price, "max_price": max_price}, **facets}),
+            headers={"Cache-Control": "public, max-age=60"},
+        )
 
 
 class TrendingExperiences(Resource):
     """Get trending/hot experiences with aggressive caching"""
     
     def __init__(self):
-        self.cache_util = ExperienceCache(current_app.cache)
+        self.cache_util = ExperienceCache(current_app.cache, getattr(current_app, "tiered_cache", None))
     
     @handle_db_errors
     def get(self):
-        """Get trending experiences (highly cached)"""
-        
-        # Check cache first
-        cached_result = self.cache_util.get_hot_experiences()
-        if cached_result:
-            return {"experiences": cached_result, "cached": True}, 200
-        
-        # Query for trending experiences (last 30 days, high bookings)
-        thirty_days_ago = date.today() - timedelta(days=30)
-        
-        trending_query = (db.session.query(Experience)
-                         .options(
-                             joinedload(Experience.provider),  # Load full provider data
-                             selectinload(Experience.slots)    # Load full slot data
-                         )
-                         .join(Slot)
-                         .filter(
-                             Experience.status == 'published',
-                             Experience.start_date >= date.today(),
-                             Experience.created_at >= thirty_days_ago
-                         )
-                         .group_by(Experience.id)
-                         .order_by(desc(func.sum(Slot.booked)), desc(Experience.created_at))
-                         .limit(20))
-        
-        experiences_raw = trending_query.all()
+        """Get trending experiences (cached, one cheap recompute per expiry)"""
+        
+        etag = make_etag([CATALOGUE_TAG], variant=f"trending|{date.today()}")
+        not_modified = not_modified_response(etag)
+        if not_modified:
+            return not_modified
+        
+        body, cached = self.cache_util.fill_hot_experiences(self._load_trending)
+        if cached:
+            body = self.cache_util.overlay_availability(body)
+        return json_response(body, cached=cached, headers=etag_headers(etag))
+    
+    TRENDING_LIMIT = 20
+    
+    def _load_trending(self):
+        """
+        Rank by booking velocity from the Redis trending scores (utils.trending),
+        then load only those rows by primary key; returns (JSON body, cache tags)
+        """
+        limit = self.TRENDING_LIMIT
+        rows = []
+        try:
+            # Headroom for ranked experiences that are no longer listed
+            ranked_ids = top_experience_ids(limit * 2)
+        except Exception as e:
+            logger.warning(f"Trending scores unavailable: {e}")
+            ranked_ids = []
+        
+        if ranked_ids:
+            by_id = {
+                str(exp.id): (exp, summary)
+                for exp, summary in self._listed_query().filter(Experience.id.in_(ranked_ids)).all()
+            }
+            rows = [by_id[experience_id] for experience_id in ranked_ids if experience_id in by_id][:limit]
+        
+        # Cold start / quiet periods: top up with recent, well-booked experiences
+        if len(rows) < limit:
+            thirty_days_ago = date.today() - timedelta(days=30)
+            fallback = (self._listed_query()
+                        .filter(Experience.created_at >= thirty_days_ago)
+                        .order_by(desc(ExperienceSummary.total_booked), desc(Experience.created_at)))
+            if rows:
+                fallback = fallback.filter(Experience.id.notin_([exp.id for exp, _ in rows]))
+            rows += fallback.limit(limit - len(rows)).all()
         
         # Transform to cached format
         experiences = []
-        for exp in experiences_raw:
-            cached_exp = CachedExperience.from_experience(exp)
+        for exp, summary in rows:
+            cached_exp = CachedExperience.from_summary(exp, summary)
             experiences.append(asdict(cached_exp))
         
-        # Cache the result
-        self.cache_util.set_hot_experiences(experiences)
-        
-        return {"experiences": experiences}, 200
+        ensure_versions([CATALOGUE_TAG])
+        return dumps_bytes({"experiences": experiences}), self.cache_util.row_tags(rows)
+    
+    @staticmethod
+    def _listed_query():
+        """Published experiences with upcoming slots, joined to their summaries"""
+        return (db.session.query(Experience, ExperienceSummary)
+                .join(ExperienceSummary, ExperienceSummary.experience_id == Experience.id)
+                .filter(
+                    ExperienceSummary.status == 'published',
+                    ExperienceSummary.slot_count > 0,
+                    ExperienceSummary.last_slot_date >= date.today(),
+                ))
 
 
 class PublicExperienceDetail(Resource):
     """Get single experience details with caching"""
     
     def __init__(self):
-        self.cache_util = ExperienceCache(current_app.cache)
+        self.cache_util = ExperienceCache(current_app.cache, getattr(current_app, "tiered_cache", None))
     
     @handle_db_errors
     def get(self, experience_id):
         """Get single experience with full details"""
         
-        # Check cache
-        cache_key = f"exp:detail:{experience_id}"
-        cached_result = current_app.cache.get(cache_key)
-        if cached_result:
-            return {"experience": cached_result, "cached": True}, 200
-        
-        # Query with full loading - FIXED: Remove load_only usage
-        experience = (Experience.query
-                     .options(
-                         joinedload(Experience.provider),  # Load full provider data
-                         selectinload(Experience.slots)    # Load full slot data
-                     )
-                     .filter(
-                         Experience.id == experience_id,
-                         Experience.status == 'published'
-                     )
-                     .first())
-        
-        if not experience:
+        etag = make_etag([experience_tag(experience_id)], variant="detail")
+        not_modified = not_modified_response(etag)
+        if not_modified:
+            return not_modified
+        
+        body, cached = self.cache_util.fill_experience_detail(
+            experience_id, lambda: self._load_detail(experience_id)
+        )
+        if body is None:
             return {"error": "Experience not found"}, 404
+        if cached:
+            body = self.cache_util.overlay_slot_availability(body)
+        return json_response(body, cached=cached, headers=etag_headers(etag))
+    
+    def _load_detail(self, experience_id):
+        """Query one published experience; returns (JSON body or None, cache tags)"""
+        
+        # Aggregates come from the summary; slots are only loaded for the slot list
+        row = (db.session.query(Experience, ExperienceSummary)
+               .join(ExperienceSummary, ExperienceSummary.experience_id == Experience.id)
+               .options(
+                   selectinload(Experience.slots)    # Load full slot data
+               )
+               .filter(
+                   Experience.id == experience_id,
+                   ExperienceSummary.status == 'published'
+               )
+               .first())
+        
+        if not row:
+            return None, ()
+        experience, summary = row
         
         # Transform to detailed format
-        cached_exp = CachedExperience.from_experience(experience)
+        cached_exp = CachedExperience.from_summary(experience, summary)
         experience_data = asdict(cached_exp)
         
-        # Add provider details
-        if experience.provider:
-            experience_data['provider'] = {
-                'id': str(experience.provider.id),
-                'name': experience.provider.name,
-                'avatar_url': experience.provider.avatar_url,
-                'bio': getattr(experience.provider, 'bio', None)  # Safe access to bio
-            }
+        # Add provider details (shared provider cache instead of joining users)
+        provider = self.cache_util.load_provider_data([experience.provider_id]).get(str(experience.provider_id))
+        if provider:
+            experience_data['provider'] = provider
         
         # Add slot details
         experience_data['slots'] = [
             {
+                # Counts follow the id so overlay_slot_availability can splice them
                 'id': str(slot.id),
-                'name': slot.name,
-                'date': slot.date.isoformat(),
                 'capacity': slot.capacity,
                 'booked': slot.booked,
+                'available': slot.capacity - slot.booked,
+                'name': slot.name,
+                'date': slot.date.isoformat(),
                 'start_time': slot.start_time.isoformat(),
                 'end_time': slot.end_time.isoformat(),
                 'timezone': slot.timezone,
-                'available': slot.capacity - slot.booked,
                 'price': float(slot.price)
             }
             for slot in experience.slots
         ]
         
-        # Cache the detailed result
-        current_app.cache.set(cache_key, experience_data, timeout=600)
-        
-        return {"experience": experience_data}, 200
\ No newline at end of file
+        body = dumps_bytes({"experience": experience_data})
+        ensure_versions([experience_tag(experience.id)])
+        return body, [experience_tag(experience.id), provider_tag(experience.provider_id)]
\ No newline at end of file
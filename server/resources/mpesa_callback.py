@@ -1,17 +1,12 @@
-from models import db, ApiCollection, ApiDisbursement
+from models import db
 from flask_restful import Resource
-from flask import request, current_app, jsonify
-from utils.tarrifs import get_b2b_business_charge, get_b2c_business_charge
-from decimal import Decimal
+from flask import request, current_app
 import logging
-from workers.wallet_logger import logg_wallet, wallet_settlement, refund_settlement  # Celery task
-from workers.email_worker import send_payout_confirmation
-import pytz
-# from workers.send_webhook import send_webhook
+from workers.callback_inbox import record_callback, MPESA_STK, MPESA_B2C, MPESA_B2B, PAYTRACK
 logger = logging.getLogger(__name__)
-from utils.subscribe_manager import push_to_queue
-from datetime import datetime
-from typing import Optional
+
+# Callbacks are stored in the inbox and acknowledged straight away;
+# workers.callback_inbox applies them exactly once.
 
 class MpesaCallbackResource(Resource):
     def post(self, experience_id, slot_id, api_collection_id):
@@ -19,75 +14,16 @@ class MpesaCallbackResource(Resource):
         Handle M-Pesa STK callback.
         
         """
-        data = request.get_json()
+        data = request.get_json(force=True, silent=True) or {}
 
         try:
-            stk = data.get('Body', {}).get('stkCallback', {})
-            merchant_request_id = stk.get('MerchantRequestID')
-            checkout_request_id = stk.get('CheckoutRequestID')
-            result_code = stk.get('ResultCode')
-            result_desc = stk.get('ResultDesc')
-
-            if not experience_id or not slot_id or not api_collection_id:
-                logger.warning("Experience ID or ApiCollection ID missing in callback")
-                return {"ResultCode": 1, "ResultDesc": "Missing data"}, 400
-
-            api_collection = ApiCollection.query.get(api_collection_id)
-            if not api_collection:
-                logger.warning(f"ApiCollection {api_collection_id} not found")
-                return {"ResultCode": 1, "ResultDesc": "Collection not found"}, 404
-
-            if result_code == 0:
-                # Successful payment
-                metadata = stk.get('CallbackMetadata', {}).get('Item', [])
-                parsed_metadata = {item['Name']: item.get('Value') for item in metadata}
-
-                amount = Decimal(str(parsed_metadata.get("Amount")))
-                transaction_id = parsed_metadata.get("MpesaReceiptNumber")
-                phone_number = parsed_metadata.get("PhoneNumber")
-                transaction_date = parsed_metadata.get("TransactionDate")
-
-                # Update status immediately
-                api_collection.status = "completed"
-                api_collection.mpesa_checkout_request_id = checkout_request_id
-                api_collection.mpesa_transaction_id = transaction_id
-                db.session.commit()
-
-                push_to_queue(api_collection.user_id, {
-                    "state": "success",
-                    "transaction_id": transaction_id,
-                })
-                
-                logg_wallet.delay(
-                    slot_id=slot_id,
-                    user_id=api_collection.user_id,
-                    quantity=api_collection.quantity,
-                    amount_paid=float(amount),
-                    status="completed",
-                    transaction_ref=transaction_id,
-                    reservation_id=None if api_collection.reservation_id is None else api_collection.reservation_id
-                )
-
-                logger.info(f"STK Callback successful for collection {api_collection_id}")
-                # Safaricom expects a JSON response immediately
-                return {"ResultCode": 0, "ResultDesc": "Accepted"}, 200
-
-            else:
-                # Failed payment
-                push_to_queue(api_collection.user_id, {
-                    "state": "failed",
-                    "error": "Transaction declined"
-                })
-                api_collection.status = "failed"
-                api_collection.desctription = result_desc
-                db.session.commit()
-                logger.info(f"STK Callback failed for collection {api_collection_id}: {result_desc}")
-                return {"ResultCode": 0, "ResultDesc": "Accepted"}, 200  # still 0 so Safaricom stops retrying
-
+            record_callback(MPESA_STK, data, target_id=api_collection_id)
         except Exception as e:
             db.session.rollback()
             current_app.logger.exception(f"M-Pesa callback error: {e}")
             return {"ResultCode": 1, "ResultDesc": "Internal server error"}, 500
+        # Safaricom expects a JSON response immediately
+        return {"ResultCode": 0, "ResultDesc": "Accepted"}, 200
 
 
 class MpesaB2cDisbursementCallback(Resource):
@@ -96,155 +32,31 @@ class MpesaB2cDisbursementCallback(Resource):
         Handle M-Pesa B2C disbursement callback.
 
         """
-        data = request.get_json()
+        data = request.get_json(force=True, silent=True) or {}
 
         try:
-            result = data.get('Result', {})
-            conversation_id = result.get('ConversationID')
-            originator_conversation_id = result.get('OriginatorConversationID')
-            result_code = result.get('ResultCode')
-            result_desc = result.get('ResultDesc')
-            transaction_id = result.get('TransactionID')
-
-            if not user_id or not api_disbursement_id:
-                logger.warning("Tenant ID or ApiDisbursement ID missing in callback")
-                return {"ResultCode": 1, "ResultDesc": "Missing data"}, 400
-            api_disbursement = ApiDisbursement.query.get(api_disbursement_id)
-            if not api_disbursement:
-                logger.warning(f"ApiDisbursement {api_disbursement_id} not found")
-                return {"ResultCode": 1, "ResultDesc": "Disbursement not found"}, 404
-
-            if result_code == 0:
-                # Successful disbursement
-                api_disbursement.status = "completed"
-                api_disbursement.transaction_reference = transaction_id
-                service_fee = get_b2c_business_charge(float(api_disbursement.amount))
-                db.session.commit()
-                if api_disbursement.disbursement_type == "settlement":
-                    nairobi_tz = pytz.timezone("Africa/Nairobi")
-                    push_to_queue(api_disbursement.user_id, {
-                        "state": "success",
-                        "transaction_id": transaction_id,
-                    })
-                    # Current time in Nairobi
-                    timestamp = datetime.now(nairobi_tz).isoformat()
-
-                    send_payout_confirmation.delay(
-                        user_id=user_id,
-                        amount=api_disbursement.amount,
-                        transaction_id=transaction_id,
-                        timestamp=timestamp
-                    )
-                    
-                    wallet_settlement.delay(
-                        user_id=user_id,
-                        amount=float(api_disbursement.amount),
-                        checkout_id=conversation_id,
-                        transaction_ref=transaction_id,
-                        service_fee=service_fee
-                    )
-                elif api_disbursement.disbursement_type == "refund":
-                    refund_settlement.delay(
-                        user_id=user_id,
-                        amount=float(api_disbursement.amount),
-                        refund_id=api_disbursement.refund_id,
-                        transaction_ref=transaction_id,
-                        service_fee=service_fee
-                    )
-        
-
-                logger.info(f"Disbursement Callback successful for disbursement {api_disbursement_id}")
-                return {"ResultCode": 0, "ResultDesc": "Accepted"}, 200
-
-            else:
-                # Failed disbursement
-                push_to_queue(api_disbursement.user_id, {
-                    "state": "failed",
-                    "description": result_desc,
-                })
-                api_disbursement.status = "failed"
-                db.session.commit()
-
-                logger.info(f"Disbursement Callback failed for disbursement {api_disbursement_id}: {result_desc}")
-                return {"ResultCode": 0, "ResultDesc": "Accepted"}, 200  # still 0 so Safaricom stops retrying
-    
+            record_callback(MPESA_B2C, data, target_id=api_disbursement_id)
         except Exception as e:
             db.session.rollback()
             current_app.logger.exception(f"M-Pesa disbursement callback error: {e}")
             return {"ResultCode": 1, "ResultDesc": "Internal server error"}, 500
+        return {"ResultCode": 0, "ResultDesc": "Accepted"}, 200
 
 class MpesaB2bDisbursementCallback(Resource):
     def post(self, user_id, api_disbursement_id):
         """
-        Handle M-Pesa B2C disbursement callback.
+        Handle M-Pesa B2B disbursement callback.
 
         """
-        data = request.get_json()
+        data = request.get_json(force=True, silent=True) or {}
 
         try:
-            result = data.get('Result', {})
-            conversation_id = result.get('ConversationID')
-            originator_conversation_id = result.get('OriginatorConversationID')
-            result_code = result.get('ResultCode')
-            result_desc = result.get('ResultDesc')
-            transaction_id = result.get('TransactionID')
-            print(result)
-            if not user_id or not api_disbursement_id:
-                logger.warning("Tenant ID or ApiDisbursement ID missing in callback")
-                return {"ResultCode": 1, "ResultDesc": "Missing data"}, 400
-            api_disbursement = ApiDisbursement.query.get(api_disbursement_id)
-            if not api_disbursement:
-                logger.warning(f"ApiDisbursement {api_disbursement_id} not found")
-                return {"ResultCode": 1, "ResultDesc": "Disbursement not found"}, 404
-
-            if result_code == 0:
-                # Successful disbursement
-                api_disbursement.status = "completed"
-                api_disbursement.transaction_reference = transaction_id
-                service_fee = get_b2c_business_charge(float(api_disbursement.amount))
-                db.session.commit()
-                push_to_queue(api_disbursement.user_id, {
-                    "state": "success",
-                    "transaction_id": transaction_id,
-                })
-                
-                send_payout_confirmation.delay(
-                    user_id=user_id,
-                    amount=api_disbursement.amount,
-                    transaction_id=transaction_id,
-                    timestamp=datetime.utcnow().isoformat()  # current UTC timestamp
-                )
-                
-                
-                wallet_settlement.delay(
-                    user_id=user_id,
-                    amount=float(api_disbursement.amount),
-                    checkout_id=api_disbursement.checkout_id,
-                    transaction_ref=transaction_id,
-                    service_fee=service_fee
-                )
-
-                logger.info(f"Disbursement Callback successful for disbursement {api_disbursement_id}")
-                return {"ResultCode": 0, "ResultDesc": "Accepted"}, 200
-
-            else:
-                # Failed disbursement
-                push_to_queue(api_disbursement.user_id, {
-                    "state": "failed",
-                    "description": result_desc,
-                })
-                api_disbursement.status = "failed"
-                api_disbursement.description = result_desc
-                db.session.commit()
-
-
-                logger.info(f"Disbursement Callback failed for disbursement {api_disbursement_id}: {result_desc}")
-                return {"ResultCode": 0, "ResultDesc": "Accepted"}, 200  # still 0 so Safaricom stops retrying
-    
+            record_callback(MPESA_B2B, data, target_id=api_disbursement_id)
         except Exception as e:
             db.session.rollback()
             current_app.logger.exception(f"M-Pesa disbursement callback error: {e}")
             return {"ResultCode": 1, "ResultDesc": "Internal server error"}, 500
+        return {"ResultCode": 0, "ResultDesc": "Accepted"}, 200
 
 
 class PaytrackCallback(Resource):
@@ -255,163 +67,20 @@ class PaytrackCallback(Resource):
         """
 
         # Parse JSON payload
-        data = request.get_json(force=True)
-        print(data)
-        current_app.logger.info(f"Paytrack callback received: {data}")
-
-        # --- Extract data safely ---
+        data = request.get_json(force=True, silent=True) or {}
         event_type = data.get("event_type")                  # COLLECTION or DISBURSEMENT
-        tenant_id = data.get("tenant_id")                    # Tenant UUID
-        request_id = data.get("request_id")                  # Request or transaction ID
-        status = data.get("status")                          # SUCCESS / FAILED
-        amount = data.get("amount")                          # Amount string or float
-        request_ref = data.get("request_ref")                # Client-side reference
-        currency = data.get("currency")                      # e.g. KES
-        created_at = data.get("created_at")                  # ISO timestamp string
-
-        transaction_ref = data.get("transaction_ref", None)        # M-Pesa or bank ref (optional)
-        remarks = data.get("remarks", None)    
-        mpesa_number = data.get("mpesa_number", None)              # M-Pesa number (optional)
-        mpesa_account_number = data.get("mpesa_account_number", None)  # M-Pesa account number (optional)
-        b2c_account = data.get("b2c_account", None)                  # B2C account details (optional)
-                            # Reason if failed (optional)
-
-        # --- Optional: Log each field clearly ---
         current_app.logger.info(
-            f"""
-            Event Type: {event_type}
-            Tenant ID: {tenant_id}
-            Request ID: {request_id}
-            Status: {status}
-            Amount: {amount}
-            Request Ref: {request_ref}
-            Currency: {currency}
-            Created At: {created_at}
-            Transaction Ref: {transaction_ref}
-            Remarks: {remarks}
-            """
+            f"Paytrack callback received: {event_type} {data.get('status')} "
+            f"request_id={data.get('request_id')} request_ref={data.get('request_ref')}"
         )
 
-        # --- Example handling logic ---
-        if event_type == "COLLECTION":
-            if status == "success":
-                api_collection = ApiCollection.query.get(request_ref)
-                if not api_collection:
-                    logger.warning(f"ApiDisbursement {request_ref} not found")
-                    return {"ResultCode": 1, "ResultDesc": "Collection not found"}, 404
-                
-                slot_id = api_collection.slot_id
-                amount = Decimal(str(amount))
-                transaction_id = transaction_ref
-                api_collection.status = "completed"
-                api_collection.transaction_reference = transaction_ref
-                api_collection.mpesa_checkout_request_id = request_id
-                api_collection.mpesa_transaction_id = transaction_ref
-                db.session.commit()
-
-                push_to_queue(api_collection.user_id, {
-                    "state": "success",
-                    "transaction_id": transaction_id,
-                })
-                
-                logg_wallet.delay(
-                    slot_id=slot_id,
-                    user_id=api_collection.user_id,
-                    quantity=api_collection.quantity,
-                    amount_paid=float(amount),
-                    status="completed",
-                    mpesa_number=mpesa_number,
-                    transaction_ref=transaction_id,
-                    reservation_id=None if api_collection.reservation_id is None else api_collection.reservation_id
-                )
-                db.session.commit()
-                # e.g. credit tenant wallet, mark invoice paid
-                pass
-            elif status == "failed":
-                api_collection = ApiCollection.query.get(request_ref)
-                if not api_collection:
-                    logger.warning(f"ApiDisbursement {request_ref} not found")
-                    return {"ResultCode": 1, "ResultDesc": "Collection not found"}, 404
-                # Failed payment
-                push_to_queue(api_collection.user_id, {
-                    "state": "failed",
-                    "error": "Transaction declined"
-                })
-                api_collection.status = "failed"
-                api_collection.desctription = remarks
-                db.session.commit()
-                logger.info(f"STK Callback failed for collection {str(api_collection.id)}: {remarks}")
-                # e.g. mark payment as failed
-                pass
-        
-
-        elif event_type == "DISBURSEMENT":
-            if status == "success":
-                transaction_id = transaction_ref
-                api_disbursement = ApiDisbursement.query.get(request_ref)
-                if not api_disbursement:
-                    logger.warning(f"ApiDisbursement {request_ref} not found")
-                    return {"ResultCode": 1, "ResultDesc": "Disbursement not found"}, 404
-                api_disbursement.status = "completed"
-                api_disbursement.transaction_reference = transaction_id
-                service_fee = get_b2c_business_charge(float(api_disbursement.amount))
-                db.session.commit()
-                if api_disbursement.disbursement_type == "settlement":
-                    nairobi_tz = pytz.timezone("Africa/Nairobi")
-                    push_to_queue(api_disbursement.user_id, {
-                        "state": "success",
-                        "transaction_id": transaction_id,
-                    })
-                    # Current time in Nairobi
-                    timestamp = datetime.now(nairobi_tz).isoformat()
-
-                    send_payout_confirmation.delay(
-                        user_id=api_disbursement.user_id,
-                        amount=api_disbursement.amount,
-                        transaction_id=transaction_id,
-                        timestamp=timestamp
-                    )
-                    
-                    wallet_settlement.delay(
-                        user_id=api_disbursement.user_id,
-                        amount=float(api_disbursement.amount),
-                        checkout_id=request_id,
-                        b2c_account=b2c_account,
-                        mpesa_account_number = mpesa_account_number,
-                        transaction_ref=transaction_id,
-                        service_fee=service_fee
-                    )
-                elif api_disbursement.disbursement_type == "refund":
-                    refund_settlement.delay(
-                        user_id=api_disbursement.user_id,
-                        amount=float(api_disbursement.amount),
-                        refund_id=api_disbursement.refund_id,
-                        transaction_ref=transaction_id,
-                        service_fee=service_fee
-                    )
-        
-
-                logger.info(f"Disbursement Callback successful for disbursement {str(api_disbursement.id)}")
-                
-                # e.g. mark payout completed
-                pass
-            else:
-                api_disbursement = ApiDisbursement.query.get(request_ref)
-                if not api_disbursement:
-                    logger.warning(f"ApiDisbursement {request_ref} not found")
-                    return {"ResultCode": 1, "ResultDesc": "Collection not found"}, 404
-                
-                # e.g. alert or retry disbursement
-                # Failed disbursement
-                push_to_queue(api_disbursement.user_id, {
-                    "state": "failed",
-                    "description": remarks,
-                })
-                api_disbursement.status = "failed"
-                db.session.commit()
-
-                logger.info(f"Disbursement Callback failed for disbursement {api_disbursement.id}: {remarks}")
-                pass
+        try:
+            # request_ref is our ApiCollection / ApiDisbursement id
+            record_callback(PAYTRACK, data, target_id=data.get("request_ref"))
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.exception(f"Paytrack callback error: {e}")
+            return {"status": "error", "received_event": event_type}, 500
 
         # Return acknowledgment to Paytrack
-        return {"status": "success", "received_event": event_type}, 200
\ No newline at end of file
+        return {"status": "success", "received_event": event_type}, 200
@@ -1,4 +1,4 @@
-from models import db, Experience, Slot, User, ApiCollection, Reservation
+from models import db, Experience, Slot, User, ApiCollection, Reservation, CollectionStatus
 from flask import current_app, request
 from flask_restful import Resource
 from sqlalchemy import func, desc
@@ -7,18 +7,40 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from sqlalchemy import func, desc, and_, update
 from sqlalchemy.orm import joinedload, selectinload, contains_eager
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
-from utils.subscribe_manager import push_to_queue
 from sqlalchemy.dialects.postgresql import JSONB
 from workers.initiate_mpesa import initiate_payment
+from workers.payment_dispatcher import enqueue_payment
+from utils.inventory import place_hold
+from utils.payment_state import publish_status
 import json
 from decimal import Decimal 
 from datetime import datetime, timedelta
 import logging
-import time
 
 # Configure logging for performance monitoring
 logger = logging.getLogger(__name__)
 
+def accepted_response(api_collection, message):
+    """202 for a queued payment: the client follows it on its event stream or the status URL"""
+    return {
+        "message": message,
+        "collection_id": str(api_collection.id),
+        "status": api_collection.status,
+        "status_url": f"/public/reservations_request/{api_collection.id}",
+    }, 202
+
+
+def dispatch_payment(api_collection):
+    """Start the STK push on the async dispatcher when enabled, else on a Celery worker"""
+    if current_app.config.get("PAYMENT_DISPATCHER") == "async":
+        try:
+            enqueue_payment(current_app.redis, api_collection.id)
+            return
+        except Exception as e:
+            logger.warning(f"Payment queue unavailable, falling back to Celery: {e}")
+    initiate_payment.delay(api_collection.id)
+
+
 class PublicReservationResource(Resource):
     @jwt_required()
     def post(self):
@@ -37,27 +59,9 @@ class PublicReservationResource(Resource):
         if not slot:
             return {"error": "Slot not found"}, 404
 
+        # Cheap early rejection; the hold below is the authoritative check
         if int(slot.capacity - slot.booked) < int(num_people):
             return {"error": "Not enough available spots"}, 400
-        
-        # Step 2: Simulate processing
-        time.sleep(2)
-        push_to_queue(user_id, {"state": "pending_confirmation"})
-
-        # Step 3: Imagine M-Pesa or Paystack callback here...
-        time.sleep(3)
-        success = True  # or False if failed
-
-        # if success:
-        #     push_to_queue(user_id, {
-        #         "state": "success",
-        #         "transaction_id": "ABC123XYZ"
-        #     })
-        # else:
-        #     push_to_queue(user_id, {
-        #         "state": "failed",
-        #         "error": "Transaction declined"
-        #     })
 
         api_collection = ApiCollection(
             user_id=user_id,
@@ -66,28 +70,27 @@ class PublicReservationResource(Resource):
             quantity=num_people,
             mpesa_number=mpesa_number,
             amount=Decimal(amount) * Decimal(num_people),
-            status="PENDING"
+            status=CollectionStatus.PENDING
         )
         try:
             db.session.add(api_collection)
+            # Hold the places until the payment callback confirms or releases them
+            if not place_hold(db.session, api_collection):
+                db.session.rollback()
+                return {"error": "Not enough available spots"}, 400
             db.session.commit()
         except Exception as e:
             db.session.rollback()
             return {"error": "Failed to create payment request: " + str(e)}, 500
 
         # -----------------------
-        # Initiate payment asynchronously
+        # Initiate payment asynchronously; progress is pushed to the user's
+        # event stream (utils.payment_state)
         # -----------------------
-        
-        # initiate_payment.delay(api_collection.id)
-        initiate_payment.delay(api_collection.id)
-        
-        
-
-        # Here you would create a Reservation model instance and save it to the database
-        # For simplicity, we'll just simulate this action
+        publish_status(api_collection)
+        dispatch_payment(api_collection)
 
-        return {"message": "Reservation request was successfull, initiating mpesa"}, 201
+        return accepted_response(api_collection, "Reservation request received, initiating mpesa")
    
 class InstallmentReservationResource(Resource):
     @jwt_required()
@@ -117,8 +120,6 @@ class InstallmentReservationResource(Resource):
         if Decimal(amount)  > remaining:
             return {"error": f"The amount entered is more than the required, to finish the installment please pay KES{str(remaining)} "}
         
-        push_to_queue(user_id, {"state": "pending_confirmation"})
-        
         api_collection = ApiCollection(
             user_id=user_id,
             slot_id=reservation.slot_id,
@@ -127,7 +128,7 @@ class InstallmentReservationResource(Resource):
             mpesa_number=mpesa_number,
             reservation_id=reservation_id,
             amount=Decimal(amount) * num_people,
-            status="PENDING"
+            status=CollectionStatus.PENDING
         )
         try:
             db.session.add(api_collection)
@@ -139,17 +140,31 @@ class InstallmentReservationResource(Resource):
         # -----------------------
         # Initiate payment asynchronously
         # -----------------------
-        
-        # initiate_payment.delay(api_collection.id)
-        initiate_payment.delay(api_collection.id)
-        
-        
+        publish_status(api_collection)
+        dispatch_payment(api_collection)
 
-        # Here you would create a Reservation model instance and save it to the database
-        # For simplicity, we'll just simulate this action
-
-        return {"message": "partial reservation request was successfull, initiating mpesa"}, 201
+        return accepted_response(api_collection, "Partial reservation request received, initiating mpesa")
     
+class ReservationRequestStatus(Resource):
+    @jwt_required()
+    def get(self, collection_id):
+        """Current state of one of the user's reservation requests (for clients without the event stream)"""
+        user_id = get_jwt_identity()
+        api_collection = ApiCollection.query.filter_by(id=collection_id, user_id=user_id).first()
+        if not api_collection:
+            return {"error": "Reservation request not found"}, 404
+
+        return {
+            "collection_id": str(api_collection.id),
+            "status": api_collection.status,
+            "hold_status": api_collection.hold_status,
+            "hold_expires_at": api_collection.hold_expires_at.isoformat() if api_collection.hold_expires_at else None,
+            "reservation_id": str(api_collection.reservation_id) if api_collection.reservation_id else None,
+            "quantity": api_collection.quantity,
+            "amount": float(api_collection.amount),
+        }, 200
+
+
 class GetReservationsPublic(Resource):
     @jwt_required()
     def get(self, reservation_id=None):
@@ -4,6 +4,8 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from sqlalchemy import func, select
 from sqlalchemy.orm import joinedload, load_only
 from models import db, Review, Experience, Reservation, User
+from utils.cache_tags import cache_set_tagged, invalidate_tags, experience_tag
+from utils.etags import make_etag, ensure_versions, not_modified_response, etag_headers
 import json
 import hashlib
 from datetime import datetime, timedelta
@@ -26,10 +28,16 @@ class ExperienceReviewsResource(Resource):
         cache_key = f"reviews:{experience_id}:{page}:{per_page}:{sort_by}:{order}:{min_rating or 0}"
         cache_key_hash = f"reviews:{hashlib.md5(cache_key.encode()).hexdigest()}"
 
+        # Conditional GET: posting a review bumps the experience version
+        etag = make_etag([experience_tag(experience_id)], variant=cache_key)
+        not_modified = not_modified_response(etag)
+        if not_modified:
+            return not_modified
+
         # Try to get from cache first
         cached_result = cache.get(cache_key_hash)
         if cached_result:
-            return cached_result, 200
+            return cached_result, 200, etag_headers(etag)
 
         try:
             # Optimized query with selective column loading
@@ -121,9 +129,11 @@ class ExperienceReviewsResource(Resource):
                 }
             }
 
-            # Cache for 5 minutes
-            cache.set(cache_key_hash, result, timeout=300)
-            return result, 200
+            # Cache for 30 minutes (dropped via the experience tag when a review is posted)
+            cache_set_tagged(cache_key_hash, result, 1800, [experience_tag(experience_id)])
+            if total_count:
+                ensure_versions([experience_tag(experience_id)])
+            return result, 200, etag_headers(etag)
 
         except Exception as e:
             current_app.logger.error(f"Error fetching reviews for experience {experience_id}: {str(e)}")
@@ -168,8 +178,8 @@ class ExperienceReviewStatsResource(Resource):
                 }
             }
             
-            # Cache for 10 minutes (stats change less frequently)
-            cache.set(cache_key, result, timeout=600)
+            # Cache for 1 hour (stats change less frequently)
+            cache_set_tagged(cache_key, result, 3600, [experience_tag(experience_id)])
             return result, 200
             
         except Exception as e:
@@ -280,10 +290,9 @@ class PostReviewResource(Resource):
     def _invalidate_review_caches(self, experience_id, cache):
         """Invalidate all cached reviews for this experience"""
         try:
-            # Since we can't easily enumerate all cache keys, we'll use a timestamp approach
-            # Set a cache invalidation timestamp for this experience
-            invalidation_key = f"reviews_invalidated:{experience_id}"
-            cache.set(invalidation_key, datetime.utcnow().timestamp(), timeout=3600)
+            # Review pages, review stats and the public list/detail entries showing
+            # this experience's rating are all registered under its tag
+            invalidate_tags(experience_tag(experience_id), cache=cache)
             
             # Also invalidate the experience cache
             experience_cache_key = f"experience:{experience_id}"
@@ -338,8 +347,8 @@ class ExperienceStatsResource(Resource):
                 }
             }
             
-            # Cache for 10 minutes
-            cache.set(cache_key, stats, timeout=600)
+            # Cache for 1 hour
+            cache_set_tagged(cache_key, stats, 3600, [experience_tag(experience_id)])
             
             return stats, 200
             
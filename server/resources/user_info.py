@@ -1,7 +1,8 @@
 from flask import Flask, current_app, request
 from flask_restful import Resource
-from models import db, User
+from models import db, User, Experience
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from utils.cache_tags import invalidate_tags, provider_tag, experience_tag
 import json
 
 class UserInfo(Resource):
@@ -56,15 +57,16 @@ class UserInfo(Resource):
         args = request.get_json()
         updated = False
 
+        provider_details_changed = False
         if "name" in args and args["name"] != user.name:
             user.name = args["name"]
-            updated = True
+            updated = provider_details_changed = True
         if "avatar_url" in args and args["avatar_url"] != user.avatar_url:
             user.avatar_url = args["avatar_url"]
-            updated = True
+            updated = provider_details_changed = True
         if "bio" in args and args["bio"] != user.bio:
             user.bio = args["bio"]
-            updated = True
+            updated = provider_details_changed = True
         if "role" in args and args["role"] != user.role:
             user.role = args["role"]
             updated = True
@@ -72,6 +74,11 @@ class UserInfo(Resource):
         if updated:
             db.session.commit()
             self._invalidate_user_cache(user_id)
+            if provider_details_changed:
+                # Public catalogue entries show the provider's name, avatar and bio;
+                # their experiences' tags carry the detail ETag versions
+                experience_ids = [row.id for row in Experience.query.with_entities(Experience.id).filter_by(provider_id=user.id)]
+                invalidate_tags(provider_tag(user_id), *(experience_tag(exp_id) for exp_id in experience_ids))
             self._get_user_from_cache(user_id)
 
         return {"message": "User info updated successfully"}, 200
\ No newline at end of file
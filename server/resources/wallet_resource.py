@@ -1,8 +1,8 @@
-from models import db, SettlementTxn, ApiDisbursement, UserWallet, ReservationRefund, UsersLedger, User, PaymentMethod
+from models import db, SettlementTxn, ApiDisbursement, UserWallet, ReservationRefund, UsersLedger, User, PaymentMethod, PaymentGateway
 from flask import current_app, request
 from flask_jwt_extended import get_jwt_identity, jwt_required
 from flask_restful import Resource
-from workers.initiate_mpesa import initiate_disbursement as pay_track_disbursment_initiate
+from workers.initiate_mpesa import pay_track_disbursment_initiate
 from decimal import Decimal, InvalidOperation
 from utils.tarrifs import get_b2b_business_charge, get_b2c_business_charge
 from utils.email_templates import payout_authorization_mail
@@ -210,6 +210,7 @@ class DisbursementInitResource(Resource):
             status="awaiting_authorization",
             description="User settlement withdrawal",
             disbursement_type="settlement",
+            gateway=PaymentGateway.PAYTRACK,  # sent by pay_track_disbursment_initiate once authorized
             authorization_token=token,
             expires_at=expires_at
         )
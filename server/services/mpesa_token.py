@@ -0,0 +1,177 @@
+# services/mpesa_token.py
+"""
+Shared M-Pesa OAuth access token for every payment worker.
+
+Safaricom access tokens are valid for an hour, so fetching one before each
+STK push or disbursement doubles the outbound latency of every payment and
+spends API rate limit. The token is cached in Redis, and per process, until
+REFRESH_MARGIN seconds before it expires. When it is missing one worker
+refreshes it under a Redis lock while the others wait for its result. Redis
+hits, waits and refreshes are counted in the `mpesa:token:metrics` hash.
+"""
+
+import base64
+import logging
+import os
+import time
+import uuid
+
+from flask import current_app
+
+from services.payment_gateway import mpesa as mpesa_gateway, CONNECT_TIMEOUT, GatewayError
+
+logger = logging.getLogger(__name__)
+
+AUTH_PATH = "/oauth/v1/generate"
+
+TOKEN_KEY = "mpesa:token"
+LOCK_KEY = "mpesa:token:lock"
+METRICS_KEY = "mpesa:token:metrics"
+
+REFRESH_MARGIN = 120  # seconds before expiry a token stops being handed out
+DEFAULT_EXPIRES_IN = 3599
+LOCK_TIMEOUT = 15  # seconds; bounds how long a crashed refresher blocks others
+WAIT_TIMEOUT = 10.0
+POLL_INTERVAL = 0.1
+
+# Compare-and-delete so a refresher never releases a lock it no longer owns
+_RELEASE_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def fetch_access_token():
+    """Request a new token from Safaricom; returns (token, expires_in) or (None, None)."""
+    consumer_key = os.getenv("MPESA_CONSUMER_KEY")
+    consumer_secret = os.getenv("MPESA_CONSUMER_SECRET")
+    auth = base64.b64encode(f"{consumer_key}:{consumer_secret}".encode("utf-8")).decode("utf-8")
+    try:
+        response = mpesa_gateway.get(AUTH_PATH, params={"grant_type": "client_credentials"},
+                                     headers={"Authorization": f"Basic {auth}"}, timeout=(CONNECT_TIMEOUT, 10))
+        if response.status_code == 200:
+            data = response.json()
+            return data.get("access_token"), int(data.get("expires_in") or DEFAULT_EXPIRES_IN)
+        logger.error(f"Failed to get auth token, status code: {response.status_code}, response: {response.text}")
+    except GatewayError as e:
+        logger.error(f"Failed to get auth token: {e}")
+    except Exception as e:
+        logger.exception(f"Exception while fetching auth token: {e}")
+    return None, None
+
+
+class MpesaTokenManager:
+    """Redis-cached OAuth token with a single refresher; falls back to direct fetches without Redis."""
+
+    def __init__(self, redis_client=None, fetch=fetch_access_token):
+        self._redis_client = redis_client
+        self._fetch = fetch
+        self._local = None  # (token, expires_at) for this process
+
+    def _redis(self):
+        return self._redis_client or getattr(current_app, "redis", None)
+
+    def get_token(self):
+        """A valid access token, or None when Safaricom can't issue one."""
+        if self._local and self._local[1] > time.time():
+            return self._local[0]
+
+        client = self._redis()
+        if client is None:
+            return self._refresh(None)
+        try:
+            token = self._read(client)
+            if token:
+                self._count("hits")
+                return token
+
+            lock = uuid.uuid4().hex
+            if client.set(LOCK_KEY, lock, nx=True, ex=LOCK_TIMEOUT):
+                try:
+                    return self._refresh(client)
+                finally:
+                    client.eval(_RELEASE_LUA, 1, LOCK_KEY, lock)
+
+            # Someone else is refreshing: wait for their token
+            self._count("waits")
+            deadline = time.monotonic() + WAIT_TIMEOUT
+            while time.monotonic() < deadline:
+                time.sleep(POLL_INTERVAL)
+                token = self._read(client)
+                if token:
+                    return token
+                if not client.exists(LOCK_KEY):
+                    break  # refresher failed or died
+        except Exception as e:
+            logger.warning(f"M-Pesa token cache unavailable: {e}")
+            return self._refresh(None)
+        return self._refresh(client)
+
+    def invalidate(self):
+        """Drop the cached token, e.g. after Safaricom rejected it with a 401."""
+        self._local = None
+        client = self._redis()
+        if client is None:
+            return
+        try:
+            client.delete(TOKEN_KEY)
+        except Exception as e:
+            logger.warning(f"M-Pesa token invalidation failed: {e}")
+
+    def metrics(self):
+        """Counters plus the cached token's remaining lifetime in seconds."""
+        client = self._redis()
+        if client is None:
+            return {}
+        try:
+            pipe = client.pipeline(transaction=False)
+            pipe.hgetall(METRICS_KEY)
+            pipe.ttl(TOKEN_KEY)
+            counters, ttl = pipe.execute()
+        except Exception as e:
+            logger.warning(f"M-Pesa token metrics read failed: {e}")
+            return {}
+        metrics = {name: float(value) if "." in value else int(value) for name, value in counters.items()}
+        metrics["token_ttl"] = max(ttl, 0)
+        return metrics
+
+    def _read(self, client):
+        pipe = client.pipeline(transaction=False)
+        pipe.get(TOKEN_KEY)
+        pipe.ttl(TOKEN_KEY)
+        token, ttl = pipe.execute()
+        if token and ttl > 0:
+            self._local = (token, time.time() + ttl)
+            return token
+        return None
+
+    def _refresh(self, client):
+        started = time.monotonic()
+        token, expires_in = self._fetch()
+        if not token:
+            self._count("refresh_failures")
+            return None
+        ttl = max(expires_in - REFRESH_MARGIN, 1)
+        self._local = (token, time.time() + ttl)
+        if client is not None:
+            client.set(TOKEN_KEY, token, ex=ttl)
+        self._count("refreshes", last_refresh_ms=round((time.monotonic() - started) * 1000, 1))
+        return token
+
+    def _count(self, counter, **fields):
+        client = self._redis()
+        if client is None:
+            return
+        try:
+            pipe = client.pipeline(transaction=False)
+            pipe.hincrby(METRICS_KEY, counter, 1)
+            if fields:
+                pipe.hset(METRICS_KEY, mapping=fields)
+            pipe.execute()
+        except Exception:
+            pass
+
+
+token_manager = MpesaTokenManager()
@@ -0,0 +1,193 @@
+# services/payment_gateway.py
+"""
+Shared HTTP clients for the payment gateways (Safaricom M-Pesa, Paytrack).
+
+Each gateway gets one pooled keep-alive `requests.Session` per process,
+so workers reuse TLS connections instead of opening one per call, and
+every request has explicit connect/read timeouts so a slow gateway can't
+pin a worker. Failed calls are retried with full-jitter backoff where that
+is safe: connection failures (the request never reached the gateway)
+always, gateway 5xx/timeouts only for GETs, because retrying a POST that
+may have been processed could send a second STK prompt or payout.
+
+A circuit breaker shared through Redis fails fast with GatewayUnavailable
+once a gateway keeps failing, for BREAKER_COOLDOWN seconds, so workers are
+free for other tasks during a brownout instead of queueing on timeouts.
+
+Base URLs come from MPESA_API_BASE / PAYTRACK_API_BASE, which lets local
+runs point at payment_gateway_stub.py.
+"""
+
+import logging
+import os
+import random
+import time
+
+import requests
+import urllib3
+from flask import current_app, has_app_context
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 20
+MAX_RETRIES = 2
+BACKOFF_BASE = 0.25  # seconds; attempt n sleeps up to BACKOFF_BASE * 2**n
+BACKOFF_CAP = 4.0
+POOL_SIZE = 20
+
+BREAKER_THRESHOLD = 5  # failures within BREAKER_WINDOW open the circuit
+BREAKER_WINDOW = 30
+BREAKER_COOLDOWN = 30
+
+RETRY_STATUSES = {502, 503, 504}
+
+
+class GatewayError(Exception):
+    """A gateway call failed after retries (network error, timeout or 5xx)."""
+
+
+class GatewayUnavailable(GatewayError):
+    """The gateway's circuit is open; the call was not attempted."""
+
+
+class CircuitBreaker:
+    """
+    Failure counter per gateway in Redis (`circuit:<name>:failures`); reaching
+    the threshold within the window sets `circuit:<name>:open` for the
+    cooldown. Breaker errors never block calls: without Redis it stays closed.
+    """
+
+    def __init__(self, name, threshold=BREAKER_THRESHOLD, window=BREAKER_WINDOW, cooldown=BREAKER_COOLDOWN):
+        self.name = name
+        self.threshold = threshold
+        self.window = window
+        self.cooldown = cooldown
+        self.failures_key = f"circuit:{name}:failures"
+        self.open_key = f"circuit:{name}:open"
+
+    @staticmethod
+    def _redis():
+        return getattr(current_app, "redis", None) if has_app_context() else None
+
+    def allow(self):
+        client = self._redis()
+        if client is None:
+            return True
+        try:
+            return not client.exists(self.open_key)
+        except Exception:
+            return True
+
+    def record_success(self):
+        client = self._redis()
+        if client is None:
+            return
+        try:
+            client.delete(self.failures_key)
+        except Exception:
+            pass
+
+    def record_failure(self):
+        client = self._redis()
+        if client is None:
+            return
+        try:
+            pipe = client.pipeline(transaction=True)
+            pipe.incr(self.failures_key)
+            pipe.expire(self.failures_key, self.window, nx=True)
+            failures = pipe.execute()[0]
+            if failures >= self.threshold:
+                client.set(self.open_key, int(time.time()), ex=self.cooldown)
+                client.delete(self.failures_key)
+                logger.error(f"Circuit for {self.name} opened after {failures} failures; failing fast for {self.cooldown}s")
+        except Exception as e:
+            logger.warning(f"Circuit breaker update failed for {self.name}: {e}")
+
+    def state(self):
+        client = self._redis()
+        if client is None:
+            return {"open": False}
+        try:
+            pipe = client.pipeline(transaction=False)
+            pipe.ttl(self.open_key)
+            pipe.get(self.failures_key)
+            open_ttl, failures = pipe.execute()
+        except Exception:
+            return {"open": False}
+        return {"open": open_ttl > 0, "reopens_in": max(open_ttl, 0), "recent_failures": int(failures or 0)}
+
+
+class GatewayClient:
+    """Pooled, timed, retried and circuit-broken HTTP calls to one gateway."""
+
+    def __init__(self, name, base_url, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), max_retries=MAX_RETRIES,
+                 breaker=None, pool_size=POOL_SIZE):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker(name)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def request(self, method, path, timeout=None, **kwargs):
+        """
+        Send a request and return the response for any status below 500
+        (callers interpret 4xx). Raises GatewayUnavailable when the circuit is
+        open and GatewayError when retries are exhausted.
+        """
+        if not self.breaker.allow():
+            raise GatewayUnavailable(f"{self.name} circuit is open")
+
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        idempotent = method in ("GET", "HEAD")
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+                if response.status_code < 500:
+                    self.breaker.record_success()
+                    return response
+                error = GatewayError(f"{self.name} returned {response.status_code} for {method} {path}")
+                retryable = idempotent and response.status_code in RETRY_STATUSES
+            except requests.exceptions.ConnectionError as e:
+                error = GatewayError(f"{self.name} unreachable for {method} {path}: {e}")
+                retryable = idempotent or _never_sent(e)
+            except requests.exceptions.Timeout as e:
+                error = GatewayError(f"{self.name} timed out for {method} {path}: {e}")
+                retryable = idempotent
+
+            self.breaker.record_failure()
+            if not retryable or attempt >= self.max_retries or not self.breaker.allow():
+                raise error
+            delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+            logger.warning(f"{error}; retrying in {delay:.2f}s")
+            time.sleep(delay)
+            attempt += 1
+
+
+def _never_sent(error):
+    """True when the connection failed before the request went out (safe to resend a POST)."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, (urllib3.exceptions.NewConnectionError, urllib3.exceptions.ConnectTimeoutError))
+
+
+mpesa = GatewayClient("mpesa", os.getenv("MPESA_API_BASE", "https://api.safaricom.co.ke"))
+paytrack = GatewayClient("paytrack", os.getenv("PAYTRACK_API_BASE", "https://pay.geninworld.com"))
+
+
+def gateway_health():
+    """Circuit state per gateway, for /health."""
+    return {client.name: client.breaker.state() for client in (mpesa, paytrack)}
@@ -0,0 +1,199 @@
+# tests/conftest.py
+"""
+Fixtures for the payment and inventory tests.
+
+They depend on Postgres (row locks, SKIP LOCKED, ON CONFLICT, RETURNING)
+and Redis, so they run against real servers given as TEST_DATABASE_URL
+and TEST_REDIS_URL and are skipped without them. The tables are created
+once per run and emptied, with the Redis database, after every test.
+Celery tasks queued by the code under test go to an in-memory broker.
+
+    TEST_DATABASE_URL=postgresql://... TEST_REDIS_URL=redis://localhost:6379/15 python -m pytest tests
+"""
+
+import os
+import uuid
+from datetime import date, time, timedelta
+from decimal import Decimal
+
+import pytest
+import redis
+from flask import Flask
+from flask_caching import Cache
+from sqlalchemy import text
+
+from celery_app import celery
+from models import db, User, Experience, Slot, ApiCollection, CollectionStatus
+from utils.experience_summary import register_summary_listeners
+from utils.inventory import place_hold
+from workers import callback_inbox
+
+# As created by the migrations, for the search and geo indexes
+EXTENSIONS = ("pg_trgm", "cube", "earthdistance")
+
+
+@pytest.fixture(scope="session")
+def app():
+    database_url = os.getenv("TEST_DATABASE_URL")
+    redis_url = os.getenv("TEST_REDIS_URL")
+    if not database_url or not redis_url:
+        pytest.skip("TEST_DATABASE_URL and TEST_REDIS_URL are required for the database tests")
+
+    app = Flask(__name__)
+    app.config.update(TESTING=True, SQLALCHEMY_DATABASE_URI=database_url, CACHE_TYPE="SimpleCache")
+    db.init_app(app)
+    register_summary_listeners()
+    app.cache = Cache(app)
+    app.redis = redis.Redis.from_url(redis_url, decode_responses=True)
+    # Follow-up tasks are queued in memory and never run
+    celery.conf.update(broker_url="memory://", result_backend="cache+memory://")
+
+    with app.app_context():
+        with db.engine.begin() as connection:
+            for extension in EXTENSIONS:
+                connection.execute(text(f"CREATE EXTENSION IF NOT EXISTS {extension}"))
+        db.drop_all()
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def session(app):
+    yield db.session
+    db.session.rollback()
+    tables = ", ".join(table.name for table in db.metadata.sorted_tables)
+    db.session.execute(text(f"TRUNCATE {tables} CASCADE"))
+    db.session.commit()
+    db.session.remove()
+    app.redis.flushdb()
+
+
+@pytest.fixture
+def make_slot(session):
+    """
+    make_slot(price, capacity, booked, **experience_columns): the only slot,
+    a week from now, of a new published experience. Experiences share one
+    provider.
+    """
+    provider = User(name="Provider", email=f"provider-{uuid.uuid4().hex}@example.com", role="provider")
+    session.add(provider)
+    session.flush()
+
+    def make(price="1000.00", capacity=5, booked=0, **experience_columns):
+        experience = Experience(**{
+            "id": uuid.uuid4(),
+            "provider_id": provider.id,
+            "title": "Hell's Gate hike",
+            "description": "A day in the gorge",
+            "destinations": ["Naivasha"],
+            "activities": ["hiking"],
+            "inclusions": [],
+            "exclusions": [],
+            "poster_image_url": "https://example.com/poster.jpg",
+            "start_date": date.today() + timedelta(days=7),
+            "status": "published",
+            "meeting_point": {"name": "Main gate"},
+            **experience_columns
+        })
+        session.add(experience)
+        session.flush()
+        slot = Slot(
+            experience_id=experience.id,
+            name="Morning",
+            capacity=capacity,
+            booked=booked,
+            price=Decimal(price),
+            date=date.today() + timedelta(days=7),
+            start_time=time(8, 0),
+            end_time=time(16, 0),
+        )
+        session.add(slot)
+        session.commit()
+        return slot
+    return make
+
+
+@pytest.fixture
+def slot(make_slot):
+    """A published experience's slot with 5 places, none booked."""
+    return make_slot()
+
+
+@pytest.fixture
+def customer(session):
+    user = User(name="Customer", email=f"customer-{uuid.uuid4().hex}@example.com")
+    session.add(user)
+    session.commit()
+    return user
+
+
+@pytest.fixture
+def make_collection(session, slot, customer):
+    """
+    make_collection(quantity, held=True, status=PENDING, **columns): a
+    collection for `slot`, holding its places unless held=False.
+    """
+    def make(quantity=1, held=True, status=CollectionStatus.PENDING, **columns):
+        api_collection = ApiCollection(
+            slot_id=slot.id,
+            experience_id=slot.experience_id,
+            user_id=customer.id,
+            quantity=quantity,
+            amount=slot.price * quantity,
+            status=status,
+            mpesa_number="254712345678",
+            **columns
+        )
+        session.add(api_collection)
+        session.flush()
+        if held:
+            assert place_hold(session, api_collection)
+        session.commit()
+        return api_collection
+    return make
+
+
+
+class _Task:
+    """
+    Stands in for a Celery task, recording the calls queued after commit;
+    raises `error` instead while it is set.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = []
+        self.error = None
+
+    def delay(self, *args, **kwargs):
+        if self.error:
+            raise self.error
+        self.calls.append(kwargs)
+
+
+@pytest.fixture
+def logg_wallet(monkeypatch):
+    """The logg_wallet calls made by the callback inbox."""
+    task = _Task(callback_inbox.logg_wallet.name)
+    monkeypatch.setattr(callback_inbox, "logg_wallet", task)
+    return task
+
+
+@pytest.fixture
+def stk_callback():
+    """stk_callback(checkout_request_id, receipt, amount): a successful STK callback body."""
+    def build(checkout_request_id, receipt="RCPT0001", amount=1000):
+        return {"Body": {"stkCallback": {
+            "MerchantRequestID": "29115-34620561-1",
+            "CheckoutRequestID": checkout_request_id,
+            "ResultCode": 0,
+            "ResultDesc": "The service request is processed successfully.",
+            "CallbackMetadata": {"Item": [
+                {"Name": "Amount", "Value": amount},
+                {"Name": "MpesaReceiptNumber", "Value": receipt},
+                {"Name": "PhoneNumber", "Value": 254712345678},
+            ]},
+        }}}
+    return build
@@ -0,0 +1,71 @@
+from sqlalchemy import func
+
+from models import CallbackInbox, CollectionStatus
+from utils.inventory import CONFIRMED
+from workers.callback_inbox import (
+    record_callback, process_inbox, MPESA_STK, DISPATCHING, PROCESSED, REDRIVE_AFTER,
+)
+
+
+def test_record_callback_stores_a_redelivered_callback_once(session, make_collection, stk_callback, logg_wallet):
+    api_collection = make_collection(mpesa_checkout_request_id="ws_CO_1")
+    payload = stk_callback("ws_CO_1")
+
+    assert record_callback(MPESA_STK, payload, target_id=api_collection.id)
+    assert not record_callback(MPESA_STK, payload, target_id=api_collection.id)
+
+    assert session.query(CallbackInbox).count() == 1
+
+
+def test_process_inbox_applies_a_callback_once(session, make_collection, stk_callback, logg_wallet):
+    api_collection = make_collection(quantity=2, mpesa_checkout_request_id="ws_CO_1")
+    payload = stk_callback("ws_CO_1", amount=2000)
+    record_callback(MPESA_STK, payload, target_id=api_collection.id)
+
+    assert process_inbox(session)[PROCESSED] == 1
+    session.refresh(api_collection)
+    assert api_collection.status == CollectionStatus.COMPLETED
+    assert api_collection.transaction_reference == "RCPT0001"
+    assert api_collection.hold_status == CONFIRMED
+    assert [call["transaction_ref"] for call in logg_wallet.calls] == ["RCPT0001"]
+
+    # The gateway retries after the entry was applied
+    assert not record_callback(MPESA_STK, payload, target_id=api_collection.id)
+    assert process_inbox(session)[PROCESSED] == 0
+    assert len(logg_wallet.calls) == 1
+
+
+def test_process_inbox_settles_a_collection_once_across_callbacks(session, make_collection, stk_callback,
+                                                                   logg_wallet):
+    api_collection = make_collection(mpesa_checkout_request_id="ws_CO_1")
+    record_callback(MPESA_STK, stk_callback("ws_CO_1"), target_id=api_collection.id)
+    # A different body, stored under its own key
+    record_callback(MPESA_STK, stk_callback(None, receipt="RCPT0002"), target_id=api_collection.id)
+
+    assert process_inbox(session)[PROCESSED] == 2
+
+    session.refresh(api_collection)
+    assert api_collection.transaction_reference == "RCPT0001"
+    assert len(logg_wallet.calls) == 1
+
+
+def test_follow_up_tasks_not_queued_are_sent_by_a_later_run(session, make_collection, stk_callback, logg_wallet):
+    api_collection = make_collection(mpesa_checkout_request_id="ws_CO_1")
+    record_callback(MPESA_STK, stk_callback("ws_CO_1"), target_id=api_collection.id)
+    logg_wallet.error = ConnectionError("broker unavailable")
+
+    assert process_inbox(session)[PROCESSED] == 1
+    entry = session.query(CallbackInbox).one()
+    assert (entry.status, api_collection.status) == (DISPATCHING, CollectionStatus.COMPLETED)
+
+    logg_wallet.error = None
+    # Too recent: the run that applied it may still be sending
+    assert process_inbox(session)["redriven"] == 0
+    entry.processed_at = func.now() - REDRIVE_AFTER
+    session.commit()
+
+    assert process_inbox(session)["redriven"] == 1
+    session.refresh(entry)
+    assert entry.status == PROCESSED
+    assert [call["transaction_ref"] for call in logg_wallet.calls] == ["RCPT0001"]
+    assert process_inbox(session)["redriven"] == 0
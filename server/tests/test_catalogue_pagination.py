@@ -0,0 +1,77 @@
+import json
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+from resources.experiences_public import PublicExperienceList, CursorPagination, filter_schema
+
+# Few distinct values, so every sort key has ties that only the id breaks
+CREATED = (datetime(2026, 1, 5, 9, 30, 0, 123456, tzinfo=timezone.utc),
+           datetime(2026, 2, 1, 17, 0, 0, 654321, tzinfo=timezone.utc))
+STARTS = (date.today() + timedelta(days=7), date.today() + timedelta(days=14))
+PRICES = ("1000.00", "2000.00", "500.00")
+POINTS = ((-0.9052, 36.3143), (-0.9120, 36.3301))
+MAX_PAGES = 20
+
+
+def _meeting_point(index):
+    latitude, longitude = POINTS[index % len(POINTS)]
+    return {"name": "Main gate", "coordinates": {"latitude": latitude, "longitude": longitude}}
+
+
+@pytest.fixture
+def catalogue(make_slot):
+    """Eight listed experiences; returns their ids."""
+    slots = [
+        make_slot(price=PRICES[index % 3], booked=index % 2, created_at=CREATED[index % 2],
+                  start_date=STARTS[index // 4], meeting_point=_meeting_point(index))
+        for index in range(8)
+    ]
+    return {str(slot.experience_id) for slot in slots}
+
+
+def page_through(limit, **params):
+    """Ids of every page of a listing, following next_cursor from the first page."""
+    resource = PublicExperienceList()
+    filters = filter_schema.load({**params, "limit": limit})
+    ids, cursor_data, page = [], {}, 1
+    while True:
+        body, _ = resource.render_page(filters, cursor_data, page)
+        result = json.loads(body)
+        ids += [experience["id"] for experience in result["experiences"]]
+        filters["cursor"] = result["pagination"]["next_cursor"]
+        if not filters["cursor"]:
+            return ids
+        cursor_data = CursorPagination.decode_cursor(filters["cursor"])
+        page = cursor_data["p"]
+        assert page <= MAX_PAGES, "pagination doesn't terminate"
+
+
+@pytest.mark.parametrize("sort_by", ["created_at", "start_date", "price_asc", "price_desc", "popularity",
+                                     "availability"])
+@pytest.mark.parametrize("limit", [2, 3])
+def test_pages_cover_a_sort_without_duplicates_or_gaps(session, catalogue, sort_by, limit):
+    paged = page_through(limit, sort_by=sort_by)
+
+    assert sorted(paged) == sorted(catalogue)
+    assert paged == page_through(100, sort_by=sort_by)
+
+
+@pytest.mark.parametrize("limit", [2, 3])
+def test_pages_cover_a_proximity_search_without_duplicates_or_gaps(session, catalogue, limit):
+    paged = page_through(limit, near="-0.9000,36.3000", radius=10)
+
+    assert sorted(paged) == sorted(catalogue)
+    assert paged == page_through(100, near="-0.9000,36.3000", radius=10)
+
+
+@pytest.mark.parametrize("limit", [2, 3])
+def test_pages_cover_a_search_with_tied_scores_without_duplicates_or_gaps(session, catalogue, make_slot, limit):
+    # The catalogue's eight share one score; these rank differently
+    catalogue |= {str(make_slot(title=title).experience_id)
+                  for title in ("Gorge walk", "Hell's Gate gorge hike and picnic")}
+
+    paged = page_through(limit, search="gorge hike")
+
+    assert sorted(paged) == sorted(catalogue)
+    assert paged == page_through(100, search="gorge hike")
@@ -0,0 +1,122 @@
+from datetime import timedelta
+
+from sqlalchemy import func
+
+from models import CollectionStatus, ReservationRefund, Reservation
+from utils.inventory import (
+    confirm_hold, release_hold, release_expired_holds, book_places, HELD, CONFIRMED, RELEASED,
+)
+from workers import wallet_logger
+
+
+def _booked(session, slot):
+    session.refresh(slot)
+    return slot.booked
+
+
+def _expire(session, api_collection):
+    api_collection.hold_expires_at = func.now() - timedelta(minutes=1)
+    session.commit()
+
+
+def test_place_hold_takes_places_until_the_slot_is_full(session, slot, make_collection):
+    make_collection(quantity=4)
+    assert _booked(session, slot) == 4
+    assert not book_places(session, slot.id, 2)
+    assert _booked(session, slot) == 4
+
+
+def test_confirm_hold_keeps_the_held_places(session, slot, make_collection):
+    api_collection = make_collection(quantity=2)
+
+    assert confirm_hold(session, api_collection)
+    session.commit()
+
+    assert api_collection.hold_status == CONFIRMED
+    assert _booked(session, slot) == 2
+    # A repeated callback neither books again nor fails
+    assert confirm_hold(session, api_collection)
+    assert _booked(session, slot) == 2
+
+
+def test_confirm_hold_rebooks_an_expired_hold_when_places_remain(session, slot, make_collection):
+    api_collection = make_collection(quantity=2)
+    assert release_hold(session, api_collection)
+    session.commit()
+    assert _booked(session, slot) == 0
+
+    assert confirm_hold(session, api_collection)
+    session.commit()
+
+    assert api_collection.hold_status == CONFIRMED
+    assert _booked(session, slot) == 2
+
+
+def test_confirm_hold_fails_when_an_expired_hold_was_resold(session, slot, make_collection):
+    late = make_collection(quantity=2)
+    release_hold(session, late)
+    session.commit()
+    make_collection(quantity=4)  # the released places are taken by someone else
+
+    assert not confirm_hold(session, late)
+    session.commit()
+
+    assert late.hold_status == RELEASED
+    assert _booked(session, slot) == 4
+
+
+def test_release_expired_holds_expires_unpaid_collections(session, slot, make_collection):
+    expired = make_collection(quantity=2)
+    live = make_collection(quantity=1)
+    _expire(session, expired)
+
+    assert release_expired_holds(session) == 1
+
+    session.refresh(expired)
+    session.refresh(live)
+    assert (expired.hold_status, expired.status) == (RELEASED, CollectionStatus.EXPIRED)
+    assert (live.hold_status, live.status) == (HELD, CollectionStatus.PENDING)
+    assert _booked(session, slot) == 1
+    # Already released: nothing left to do
+    assert release_expired_holds(session) == 0
+
+
+def test_release_expired_holds_leaves_a_settled_hold_alone(session, slot, make_collection):
+    api_collection = make_collection(quantity=2)
+    confirm_hold(session, api_collection)
+    api_collection.status = CollectionStatus.COMPLETED
+    session.commit()
+    _expire(session, api_collection)
+
+    assert release_expired_holds(session) == 0
+    assert _booked(session, slot) == 2
+
+
+def test_logg_wallet_refunds_a_payment_for_sold_out_places(session, slot, customer, monkeypatch):
+    followups = []
+    for task in ("create_ledger", "send_reservation_email_async"):
+        monkeypatch.setattr(wallet_logger, task, type("Task", (), {"delay": staticmethod(
+            lambda *args, **kwargs: followups.append(kwargs))}))
+    book_places(session, slot.id, slot.capacity)
+    session.commit()
+
+    wallet_logger.logg_wallet.run(slot_id=slot.id, user_id=customer.id, quantity=1, amount_paid=1000,
+                                  status="completed", transaction_ref="RCPT0001", mpesa_number="254712345678")
+
+    reservation = session.query(Reservation).one()
+    refund = session.query(ReservationRefund).one()
+    assert reservation.status == "cancelled"
+    assert (refund.reservation_id, refund.status, refund.requested_amount) == (reservation.id, "pending", 1000)
+    assert _booked(session, slot) == slot.capacity
+
+
+def test_logg_wallet_ignores_a_repeated_payment(session, slot, customer, monkeypatch):
+    for task in ("create_ledger", "send_reservation_email_async"):
+        monkeypatch.setattr(wallet_logger, task, type("Task", (), {"delay": staticmethod(lambda *args, **kwargs: None)}))
+
+    for _ in range(2):
+        wallet_logger.logg_wallet.run(slot_id=slot.id, user_id=customer.id, quantity=2, amount_paid=2000,
+                                      status="completed", transaction_ref="RCPT0001", mpesa_number="254712345678")
+
+    assert session.query(Reservation).count() == 1
+    assert _booked(session, slot) == 2
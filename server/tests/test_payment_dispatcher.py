@@ -0,0 +1,53 @@
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import func
+
+from models import CollectionStatus
+from services.mpesa_token import token_manager
+from utils.inventory import RELEASED
+from workers.payment_dispatcher import PaymentDispatcher, DEFERRED_KEY, MPESA, EXPIRED, DEFERRED
+
+
+@pytest.fixture
+def dispatcher(app):
+    return PaymentDispatcher(app)
+
+
+def _entry(api_collection):
+    return f"{MPESA}:{api_collection.id}"
+
+
+def test_prepare_expires_a_collection_whose_hold_is_about_to_lapse(session, slot, make_collection, dispatcher,
+                                                                   monkeypatch):
+    monkeypatch.setattr(token_manager, "get_token", lambda: "token")
+    lapsing = make_collection(quantity=2)
+    lapsing.hold_expires_at = func.now() + timedelta(seconds=30)
+    session.commit()
+    fresh = make_collection(quantity=1)
+
+    gateways, calls, results = dispatcher._prepare([_entry(lapsing), _entry(fresh)])
+
+    assert results == [(str(lapsing.id), EXPIRED, "Payment window expired")]
+    assert [call[0] for call in calls] == [str(fresh.id)]
+
+    assert dispatcher._apply(gateways, results)[EXPIRED] == 1
+    session.refresh(lapsing)
+    session.refresh(slot)
+    assert (lapsing.status, lapsing.hold_status) == (CollectionStatus.EXPIRED, RELEASED)
+    assert slot.booked == 1
+
+
+def test_unsent_requests_are_deferred_while_the_hold_lasts(app, session, make_collection, dispatcher,
+                                                           monkeypatch):
+    monkeypatch.setattr(token_manager, "get_token", lambda: None)
+    api_collection = make_collection()
+
+    gateways, calls, results = dispatcher._prepare([_entry(api_collection)])
+    assert not calls
+    assert [outcome for _, outcome, _ in results] == [DEFERRED]
+
+    dispatcher._apply(gateways, results)
+    session.refresh(api_collection)
+    assert api_collection.status == CollectionStatus.PENDING
+    assert app.redis.zrange(DEFERRED_KEY, 0, -1) == [_entry(api_collection)]
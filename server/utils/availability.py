@@ -0,0 +1,132 @@
+# utils/availability.py
+"""
+Live slot availability counters in Redis.
+
+`avail:slot:<slot_id>` holds capacity - booked for one slot and
+`avail:exp:<experience_id>` the sum over the experience's slots. Counters
+are seeded from Postgres with SET NX on first read and moved by committed
+booking/refund/capacity changes (tracked by the ORM listeners in
+utils.experience_summary) with a guarded INCRBY that only applies to
+counters that exist, so a missing counter is simply reseeded. New or
+deleted slots drop the experience counter instead of adjusting it.
+
+Cached list/detail payloads keep the availability they were rendered with;
+read paths overlay the live values with one MGET, so bookings no longer
+have to evict the payloads. Counters expire after AVAILABILITY_TTL, which
+bounds drift from writes that bypass the ORM (admin SQL) or from a
+booking racing a seed.
+"""
+
+import logging
+
+from flask import current_app
+
+from models import db, Slot
+from utils.cache_tags import experience_tag
+from utils.etags import bump_versions
+
+logger = logging.getLogger(__name__)
+
+SLOT_KEY_PREFIX = "avail:slot:"
+EXPERIENCE_KEY_PREFIX = "avail:exp:"
+AVAILABILITY_TTL = 600
+
+# KEYS = slot counter, experience counter; ARGV = delta
+_APPLY_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    -- The experience total can't be adjusted without its slot; reseed both
+    redis.call('DEL', KEYS[2])
+    return 0
+end
+redis.call('INCRBY', KEYS[1], ARGV[1])
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    redis.call('INCRBY', KEYS[2], ARGV[1])
+end
+return 1
+"""
+
+
+def slot_key(slot_id):
+    return f"{SLOT_KEY_PREFIX}{slot_id}"
+
+
+def experience_key(experience_id):
+    return f"{EXPERIENCE_KEY_PREFIX}{experience_id}"
+
+
+def seed_experiences(experience_ids):
+    """
+    Load availability for the given experiences from the slots table and
+    seed their counters (SET NX). Returns {experience_id: (total, {slot_id: available})}.
+    """
+    ids = list(dict.fromkeys(str(experience_id) for experience_id in experience_ids if experience_id))
+    if not ids:
+        return {}
+    seeded = {experience_id: (0, {}) for experience_id in ids}
+    rows = (db.session.query(Slot.experience_id, Slot.id, (Slot.capacity - Slot.booked).label('available'))
+            .filter(Slot.experience_id.in_(ids))
+            .all())
+    for row in rows:
+        total, slots = seeded[str(row.experience_id)]
+        slots[str(row.id)] = row.available
+        seeded[str(row.experience_id)] = (total + row.available, slots)
+
+    pipe = current_app.redis.pipeline(transaction=False)
+    for experience_id, (total, slots) in seeded.items():
+        for slot_id, available in slots.items():
+            pipe.set(slot_key(slot_id), available, ex=AVAILABILITY_TTL, nx=True)
+        pipe.set(experience_key(experience_id), total, ex=AVAILABILITY_TTL, nx=True)
+    pipe.execute()
+    return seeded
+
+
+def experience_availability(experience_ids):
+    """Live available places per experience ({experience_id: int}), seeding misses."""
+    ids = list(dict.fromkeys(str(experience_id) for experience_id in experience_ids))
+    if not ids:
+        return {}
+    values = current_app.redis.mget([experience_key(experience_id) for experience_id in ids])
+    availability = {experience_id: int(value) for experience_id, value in zip(ids, values) if value is not None}
+    missing = [experience_id for experience_id in ids if experience_id not in availability]
+    if missing:
+        availability.update({experience_id: total for experience_id, (total, _) in seed_experiences(missing).items()})
+    return availability
+
+
+def slot_availability(experience_id, slot_ids):
+    """Live (experience total, {slot_id: available}) for one experience, seeding misses."""
+    experience_id = str(experience_id)
+    slot_ids = [str(slot_id) for slot_id in slot_ids]
+    values = current_app.redis.mget([experience_key(experience_id), *(slot_key(slot_id) for slot_id in slot_ids)])
+    if all(value is not None for value in values):
+        return int(values[0]), {slot_id: int(value) for slot_id, value in zip(slot_ids, values[1:])}
+    total, slots = seed_experiences([experience_id])[experience_id]
+    # Counters that already existed stay authoritative over the fresh read
+    if values[0] is not None:
+        total = int(values[0])
+    for slot_id, value in zip(slot_ids, values[1:]):
+        if value is not None:
+            slots[slot_id] = int(value)
+    return total, slots
+
+
+def apply_availability_changes(deltas, reset_experience_ids=()):
+    """
+    Apply committed changes: `deltas` maps (slot_id, experience_id) to the
+    change in available places, `reset_experience_ids` are experiences whose
+    slot set changed. Bumps the experiences' ETag versions so clients
+    revalidate and see the new counts.
+    """
+    client = current_app.redis
+    script = client.register_script(_APPLY_LUA)
+    touched = set(str(experience_id) for experience_id in reset_experience_ids)
+    pipe = client.pipeline(transaction=False)
+    for (slot_id, experience_id), delta in deltas.items():
+        touched.add(str(experience_id))
+        if delta:
+            script(keys=[slot_key(slot_id), experience_key(experience_id)], args=[int(delta)], client=pipe)
+    for experience_id in reset_experience_ids:
+        pipe.delete(experience_key(experience_id))
+    bump_versions(pipe, [experience_tag(experience_id) for experience_id in touched])
+    pipe.execute()
+    return len(touched)
@@ -0,0 +1,128 @@
+# utils/cache_tags.py
+"""
+Tag-based invalidation for Flask-Caching entries.
+
+Every cached entry that depends on an experience, a provider or the
+catalogue as a whole is registered, by its logical cache key, in a Redis
+set per tag (`cachetag:<tag>`). A mutation invalidates its tags, which
+deletes exactly the registered entries - no SCAN over the keyspace - so
+entry TTLs can be long without serving stale data.
+"""
+
+import logging
+from flask import current_app
+
+from utils.etags import bump_versions
+
+logger = logging.getLogger(__name__)
+
+TAG_SET_PREFIX = "cachetag:"
+# Tag sets must outlive every entry registered in them
+TAG_SET_TTL = 24 * 3600
+
+CATALOGUE_TAG = "catalogue"
+
+
+def experience_tag(experience_id):
+    return f"experience:{experience_id}"
+
+
+def provider_tag(provider_id):
+    return f"provider:{provider_id}"
+
+
+def _tag_set_key(tag):
+    return f"{TAG_SET_PREFIX}{tag}"
+
+
+def _redis():
+    return getattr(current_app, "redis", None)
+
+
+def tag_cache_key(cache_key, tags):
+    """Register an already cached key under the given tags."""
+    tag_cache_keys({cache_key: tags})
+
+
+def tag_cache_keys(tags_by_key):
+    """Register several cached keys ({key: tags}) in one pipelined round trip."""
+    client = _redis()
+    members = {}
+    for cache_key, tags in tags_by_key.items():
+        for tag in tags:
+            if tag:
+                members.setdefault(tag, set()).add(cache_key)
+    if client is None or not members:
+        return
+    try:
+        pipe = client.pipeline(transaction=False)
+        for tag, keys in members.items():
+            pipe.sadd(_tag_set_key(tag), *keys)
+            pipe.expire(_tag_set_key(tag), TAG_SET_TTL)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Cache tagging failed for {sorted(tags_by_key)}: {e}")
+
+
+def cache_set_tagged(cache_key, value, timeout, tags, cache=None):
+    """cache.set() plus tag registration."""
+    cache = cache or current_app.cache
+    cache.set(cache_key, value, timeout=min(timeout, TAG_SET_TTL))
+    tag_cache_key(cache_key, tags)
+
+
+def cache_set_many_tagged(mapping, timeout, tags_by_key, cache=None):
+    """cache.set_many() (one pipelined SET ... EX) plus batched tag registration."""
+    if not mapping:
+        return
+    cache = cache or current_app.cache
+    cache.set_many(mapping, timeout=min(timeout, TAG_SET_TTL))
+    tag_cache_keys({key: tags_by_key.get(key, ()) for key in mapping})
+
+
+def invalidate_tags(*tags, cache=None):
+    """
+    Delete every entry registered under any of the tags, drop the tag sets
+    and bump their ETag versions. Returns the number of cache keys deleted.
+    """
+    client = _redis()
+    tags = {tag for tag in tags if tag}
+    if client is None or not tags:
+        return 0
+
+    cache = cache or current_app.cache
+    try:
+        # Read and drop the tag sets atomically so entries tagged concurrently
+        # land in a fresh set instead of being lost; ETag versions move with them
+        pipe = client.pipeline(transaction=True)
+        for tag in tags:
+            pipe.smembers(_tag_set_key(tag))
+        for tag in tags:
+            pipe.delete(_tag_set_key(tag))
+        bump_versions(pipe, tags)
+        results = pipe.execute()[:len(tags)]
+
+        keys = set().union(*results)
+        if keys:
+            cache.delete_many(*keys)
+            # Per-worker copies (utils.local_cache) are evicted on every worker
+            tiered = getattr(current_app, "tiered_cache", None)
+            if tiered is not None:
+                tiered.evict_local(*keys)
+        return len(keys)
+    except Exception as e:
+        logger.warning(f"Cache invalidation failed for tags {sorted(tags)}: {e}")
+        return 0
+
+
+def invalidate_experience(experience_id, provider_id=None, catalogue=True):
+    """
+    Invalidate everything derived from one experience. `catalogue` also drops
+    list/trending pages, for changes that can alter list membership or order.
+    """
+    tags = [experience_tag(experience_id)]
+    if provider_id:
+        tags.append(provider_tag(provider_id))
+    if catalogue:
+        tags.append(CATALOGUE_TAG)
+    return invalidate_tags(*tags)
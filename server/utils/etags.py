@@ -0,0 +1,95 @@
+# utils/etags.py
+"""
+Version-derived ETags for public read endpoints.
+
+Every cache tag (utils.cache_tags) has a Redis version counter `ver:<tag>`
+that is bumped, in the same transaction, whenever the tag is invalidated.
+Any invalidation also bumps `ver:catalogue`, since list and trending pages
+may show the changed experience. An endpoint derives its ETag from the
+versions of the tags its response depends on plus the request variant,
+so If-None-Match can be answered with a 304 after a single MGET, before
+touching the database or the cached payload.
+"""
+
+import hashlib
+import logging
+import time
+
+from flask import current_app, request, Response
+
+logger = logging.getLogger(__name__)
+
+VERSION_PREFIX = "ver:"
+CATALOGUE_VERSION_TAG = "catalogue"
+
+
+def version_key(tag):
+    return f"{VERSION_PREFIX}{tag}"
+
+
+def _redis():
+    return getattr(current_app, "redis", None)
+
+
+def bump_versions(pipe, tags):
+    """Queue version bumps for the invalidated tags (and the catalogue) on a pipeline."""
+    for tag in {*tags, CATALOGUE_VERSION_TAG}:
+        pipe.incr(version_key(tag))
+
+
+def ensure_versions(tags):
+    """
+    Initialise missing counters. Called from cache fills of entities that
+    exist, so unknown ids never create keys. Counters start at the current
+    time so a Redis flush can't make an old ETag match again.
+    """
+    client = _redis()
+    if client is None:
+        return
+    try:
+        seed = time.time_ns() // 1000
+        pipe = client.pipeline(transaction=False)
+        for tag in tags:
+            pipe.set(version_key(tag), seed, nx=True)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Version init failed for {tags}: {e}")
+
+
+def make_etag(tags, variant=""):
+    """
+    ETag value for a response depending on `tags`, or None when a version is
+    unknown (not yet initialised, or Redis unavailable). Read versions before
+    reading the payload: a write racing the request then yields an ETag
+    older than the body, which only costs the client one extra refetch.
+    """
+    client = _redis()
+    if client is None:
+        return None
+    tags = list(tags)
+    try:
+        versions = client.mget([version_key(tag) for tag in tags])
+    except Exception as e:
+        logger.warning(f"Version lookup failed for {tags}: {e}")
+        return None
+    if any(version is None for version in versions):
+        return None
+    material = "|".join([variant, *(f"{tag}={version}" for tag, version in zip(tags, versions))])
+    return hashlib.md5(material.encode()).hexdigest()
+
+
+def not_modified_response(etag):
+    """304 response when the request's If-None-Match matches `etag`, else None."""
+    if etag and request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+    return None
+
+
+def etag_headers(etag):
+    """Headers advertising `etag` on a full response (clients must revalidate)."""
+    if not etag:
+        return {}
+    return {"ETag": f'W/"{etag}"', "Cache-Control": "no-cache"}
@@ -0,0 +1,355 @@
+# utils/experience_summary.py
+"""
+Maintenance of the experience_summaries read model.
+
+Every flush that touches an Experience, Slot, Review or a provider's
+name/avatar recomputes the summary rows of the affected experiences inside
+the same transaction, so the public catalogue can read pre-aggregated
+prices, capacity and ratings without scanning slots. Experiences whose
+searchable fields, prices or dates changed are also queued, after commit,
+for the Redis typeahead and facet indexes (`workers.reindex_catalogue`),
+and slot booking/capacity changes are applied to the live availability
+counters (utils.availability). Both wait for the outermost commit; what
+was tracked inside a SAVEPOINT that rolls back is dropped with it.
+"""
+
+import copy
+import logging
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session
+
+from models import Experience, Slot, Review, User
+from utils.availability import apply_availability_changes
+
+logger = logging.getLogger(__name__)
+
+_REINDEX_KEY = "catalogue_reindex_ids"
+# Slot columns the search indexes depend on (price buckets, upcoming dates)
+_INDEXED_SLOT_ATTRS = ("price", "date", "experience_id")
+_AVAILABILITY_DELTAS_KEY = "availability_deltas"
+_AVAILABILITY_RESET_KEY = "availability_reset_ids"
+# What the keys above held when each open SAVEPOINT began
+_SAVEPOINTS_KEY = "summary_savepoints"
+_PENDING_KEYS = (_REINDEX_KEY, _AVAILABILITY_DELTAS_KEY, _AVAILABILITY_RESET_KEY)
+
+# A JSON list (or lone string) column as a text[] of its trimmed, non-empty entries
+JSON_TEXT_ARRAY_SQL = (
+    "CASE json_typeof({column}) "
+    "WHEN 'array' THEN ARRAY(SELECT btrim(item) FROM json_array_elements_text({column}) item WHERE btrim(item) <> '') "
+    "WHEN 'string' THEN array_remove(ARRAY[btrim({column} #>> '{{}}')], '') "
+    "ELSE '{{}}'::text[] END"
+)
+
+# One upsert per batch of experiences; the LATERAL aggregate only reads the
+# slots of the experiences being refreshed (idx_slots_experience_date).
+UPSERT_SUMMARIES_SQL = text("""
+    INSERT INTO experience_summaries (
+        experience_id, provider_id, status, provider_name, provider_avatar,
+        min_price, max_price, total_capacity, total_booked, available_slots,
+        slot_count, last_slot_date, avg_rating, reviews_count, created_at,
+        destinations, activities, latitude, longitude, search_document, search_vector, refreshed_at
+    )
+    SELECT
+        e.id,
+        e.provider_id,
+        e.status,
+        u.name,
+        u.avatar_url,
+        COALESCE(s.min_price, 0),
+        COALESCE(s.max_price, 0),
+        COALESCE(s.total_capacity, 0),
+        COALESCE(s.total_booked, 0),
+        COALESCE(s.total_capacity - s.total_booked, 0),
+        COALESCE(s.slot_count, 0),
+        s.last_slot_date,
+        COALESCE(e.avg_rating, 0),
+        COALESCE(e.reviews_count, 0),
+        e.created_at,
+        d.destinations,
+        d.activities,
+        g.latitude,
+        g.longitude,
+        lower(concat_ws(' ', e.title, e.meeting_point->>'name', e.meeting_point->>'address', d.places)),
+        setweight(to_tsvector('english', coalesce(e.title, '')), 'A')
+            || setweight(to_tsvector('english', concat_ws(' ', e.meeting_point->>'name', e.meeting_point->>'address', d.places)), 'B')
+            || setweight(to_tsvector('english', coalesce(e.description, '')), 'D'),
+        NOW()
+    FROM experiences e
+    LEFT JOIN users u ON u.id = e.provider_id
+    LEFT JOIN LATERAL (
+        SELECT
+            MIN(price) FILTER (WHERE price > 0) AS min_price,
+            MAX(price) FILTER (WHERE price > 0) AS max_price,
+            SUM(capacity) AS total_capacity,
+            SUM(booked) AS total_booked,
+            COUNT(*) AS slot_count,
+            MAX(date) AS last_slot_date
+        FROM slots
+        WHERE slots.experience_id = e.id
+    ) s ON TRUE
+    CROSS JOIN LATERAL (
+        -- JSON lists flattened to words without assuming their shape
+        SELECT
+            translate(concat_ws(' ', e.destinations::text, e.activities::text), '[]{}",:', '        ') AS places,
+            """ + JSON_TEXT_ARRAY_SQL.format(column="e.destinations") + """ AS destinations,
+            """ + JSON_TEXT_ARRAY_SQL.format(column="e.activities") + """ AS activities
+    ) d
+    LEFT JOIN LATERAL (
+        -- Only well-formed, in-range coordinates are indexed
+        SELECT (c->>'latitude')::float8 AS latitude, (c->>'longitude')::float8 AS longitude
+        FROM (SELECT e.meeting_point->'coordinates' AS c) p
+        WHERE json_typeof(c->'latitude') = 'number' AND json_typeof(c->'longitude') = 'number'
+          AND abs((c->>'latitude')::float8) <= 90 AND abs((c->>'longitude')::float8) <= 180
+    ) g ON TRUE
+    WHERE e.id = ANY(CAST(:experience_ids AS uuid[]))
+    ON CONFLICT (experience_id) DO UPDATE SET
+        provider_id = EXCLUDED.provider_id,
+        status = EXCLUDED.status,
+        provider_name = EXCLUDED.provider_name,
+        provider_avatar = EXCLUDED.provider_avatar,
+        min_price = EXCLUDED.min_price,
+        max_price = EXCLUDED.max_price,
+        total_capacity = EXCLUDED.total_capacity,
+        total_booked = EXCLUDED.total_booked,
+        available_slots = EXCLUDED.available_slots,
+        slot_count = EXCLUDED.slot_count,
+        last_slot_date = EXCLUDED.last_slot_date,
+        avg_rating = EXCLUDED.avg_rating,
+        reviews_count = EXCLUDED.reviews_count,
+        created_at = EXCLUDED.created_at,
+        destinations = EXCLUDED.destinations,
+        activities = EXCLUDED.activities,
+        latitude = EXCLUDED.latitude,
+        longitude = EXCLUDED.longitude,
+        search_document = EXCLUDED.search_document,
+        search_vector = EXCLUDED.search_vector,
+        refreshed_at = EXCLUDED.refreshed_at
+""")
+
+UPDATE_PROVIDER_SQL = text("""
+    UPDATE experience_summaries
+    SET provider_name = :name, provider_avatar = :avatar_url, refreshed_at = NOW()
+    WHERE provider_id = :provider_id
+""")
+
+REBUILD_BATCH_SQL = text("""
+    SELECT id FROM experiences
+    WHERE (CAST(:after_id AS uuid) IS NULL OR id > CAST(:after_id AS uuid))
+    ORDER BY id
+    LIMIT :batch_size
+""")
+
+
+def refresh_experience_summaries(connection, experience_ids):
+    """Recompute the summary rows for the given experiences."""
+    ids = sorted({str(experience_id) for experience_id in experience_ids if experience_id})
+    if not ids:
+        return 0
+    connection.execute(UPSERT_SUMMARIES_SQL, {"experience_ids": ids})
+    return len(ids)
+
+
+def refresh_provider_details(connection, provider_id, name, avatar_url):
+    """Propagate a provider's display name/avatar to all of their summaries."""
+    connection.execute(UPDATE_PROVIDER_SQL, {
+        "provider_id": str(provider_id),
+        "name": name,
+        "avatar_url": avatar_url,
+    })
+
+
+def rebuild_all_summaries(db, batch_size=500):
+    """
+    Backfill / reconcile every summary row in keyset batches.
+    Safe to run while the app is serving traffic.
+    """
+    refreshed = 0
+    after_id = None
+    while True:
+        rows = db.session.execute(REBUILD_BATCH_SQL, {
+            "after_id": after_id,
+            "batch_size": batch_size,
+        }).fetchall()
+        if not rows:
+            break
+        ids = [row.id for row in rows]
+        refreshed += refresh_experience_summaries(db.session.connection(), ids)
+        db.session.commit()
+        after_id = str(ids[-1])
+    logger.info(f"Rebuilt {refreshed} experience summaries")
+    return refreshed
+
+
+def track_slot_booking(session, slot_id, experience_id, booked_delta):
+    """
+    Account for an `UPDATE slots SET booked = ...` issued outside the ORM
+    unit of work (utils.inventory): refresh the experience's summary in the
+    current transaction and move its live availability counters on commit.
+    """
+    refresh_experience_summaries(session.connection(), [experience_id])
+    pending = session.info.setdefault(_AVAILABILITY_DELTAS_KEY, {})
+    key = (slot_id, experience_id)
+    pending[key] = pending.get(key, 0) - booked_delta
+
+
+def _collect_changes(session):
+    """Return (experience_ids, providers, reindex_ids) touched by the current flush."""
+    experience_ids = set()
+    providers = {}
+    reindex_ids = set()
+
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Experience):
+            if obj in session.dirty and not session.is_modified(obj):
+                continue
+            reindex_ids.add(obj.id)
+            if obj in session.deleted:
+                continue  # the summary row goes with the FK cascade
+            experience_ids.add(obj.id)
+        elif isinstance(obj, (Slot, Review)):
+            if obj in session.dirty and not session.is_modified(obj):
+                continue
+            experience_ids.add(obj.experience_id)
+            if isinstance(obj, Slot) and (obj not in session.dirty or _slot_index_fields_changed(obj)):
+                reindex_ids.add(obj.experience_id)
+        elif isinstance(obj, User) and obj in session.dirty:
+            if session.is_modified(obj) and _provider_details_changed(obj):
+                providers[obj.id] = (obj.name, obj.avatar_url)
+
+    experience_ids.discard(None)
+    reindex_ids.discard(None)
+    return experience_ids, providers, reindex_ids
+
+
+def _collect_availability_changes(session):
+    """
+    Return ({(slot_id, experience_id): delta}, reset_experience_ids) for the
+    slots in the current flush. Deltas come from the booked/capacity history;
+    new, deleted or moved slots (or changes without a loaded old value)
+    reset the experience's counters instead.
+    """
+    deltas = {}
+    resets = set()
+    for obj in session.new:
+        if isinstance(obj, Slot):
+            resets.add(obj.experience_id)
+    for obj in session.deleted:
+        if isinstance(obj, Slot):
+            resets.add(obj.experience_id)
+    for obj in session.dirty:
+        if not isinstance(obj, Slot) or not session.is_modified(obj):
+            continue
+        state = inspect(obj)
+        moved = state.attrs.experience_id.history
+        if moved.has_changes():
+            resets.update([obj.experience_id, *moved.deleted])
+            continue
+        delta = 0
+        for attr, sign in (("capacity", 1), ("booked", -1)):
+            history = state.attrs[attr].history
+            if not history.has_changes():
+                continue
+            if not history.deleted or history.deleted[0] is None:
+                resets.add(obj.experience_id)
+                break
+            delta += sign * (getattr(obj, attr) - history.deleted[0])
+        else:
+            if delta:
+                deltas[(obj.id, obj.experience_id)] = delta
+    resets.discard(None)
+    return deltas, resets
+
+
+def _slot_index_fields_changed(slot):
+    state = inspect(slot)
+    return any(state.attrs[attr].history.has_changes() for attr in _INDEXED_SLOT_ATTRS)
+
+
+def _provider_details_changed(user):
+    state = inspect(user)
+    return any(state.attrs[attr].history.has_changes() for attr in ("name", "avatar_url"))
+
+
+def _after_flush(session, flush_context):
+    experience_ids, providers, reindex_ids = _collect_changes(session)
+    if reindex_ids:
+        session.info.setdefault(_REINDEX_KEY, set()).update(str(experience_id) for experience_id in reindex_ids)
+    deltas, resets = _collect_availability_changes(session)
+    if deltas:
+        pending = session.info.setdefault(_AVAILABILITY_DELTAS_KEY, {})
+        for key, delta in deltas.items():
+            pending[key] = pending.get(key, 0) + delta
+    if resets:
+        session.info.setdefault(_AVAILABILITY_RESET_KEY, set()).update(resets)
+    if not experience_ids and not providers:
+        return
+
+    connection = session.connection()
+    try:
+        refresh_experience_summaries(connection, experience_ids)
+        for provider_id, (name, avatar_url) in providers.items():
+            refresh_provider_details(connection, provider_id, name, avatar_url)
+    except Exception as e:
+        # Let the surrounding transaction fail rather than commit a stale read model
+        logger.error(f"Experience summary refresh failed: {e}")
+        raise
+
+
+def _after_commit(session):
+    if session.in_nested_transaction():
+        return  # a released SAVEPOINT; its changes apply with the enclosing commit
+    session.info.pop(_SAVEPOINTS_KEY, None)
+    _apply_availability(session)
+    ids = session.info.pop(_REINDEX_KEY, None)
+    if not ids:
+        return
+    try:
+        from workers.catalogue_index import reindex_catalogue
+        reindex_catalogue.delay(sorted(ids))
+    except Exception as e:
+        # The periodic rebuilds reconcile anything missed here
+        logger.warning(f"Could not enqueue catalogue reindex for {len(ids)} experiences: {e}")
+
+
+def _apply_availability(session):
+    deltas = session.info.pop(_AVAILABILITY_DELTAS_KEY, None)
+    resets = session.info.pop(_AVAILABILITY_RESET_KEY, None)
+    if not deltas and not resets:
+        return
+    try:
+        apply_availability_changes(deltas or {}, resets or ())
+    except Exception as e:
+        # Counters expire (AVAILABILITY_TTL), which bounds the drift from a missed update
+        logger.warning(f"Availability counter update failed: {e}")
+
+
+def _after_transaction_create(session, transaction):
+    if transaction.nested:
+        snapshot = {key: copy.copy(session.info[key]) for key in _PENDING_KEYS if key in session.info}
+        session.info.setdefault(_SAVEPOINTS_KEY, {})[transaction] = snapshot
+
+
+def _after_soft_rollback(session, previous_transaction):
+    """
+    A rolled-back SAVEPOINT discards only what was tracked inside it; the
+    enclosing transaction's changes still apply when it commits.
+    """
+    if previous_transaction.nested:
+        snapshot = session.info.get(_SAVEPOINTS_KEY, {}).pop(previous_transaction, None)
+        if snapshot is not None:
+            for key in _PENDING_KEYS:
+                session.info.pop(key, None)
+            session.info.update(snapshot)
+        return
+    session.info.pop(_SAVEPOINTS_KEY, None)
+    for key in _PENDING_KEYS:
+        session.info.pop(key, None)
+
+
+def register_summary_listeners():
+    """Hook summary maintenance into every ORM flush, and index refreshes into commits (idempotent)."""
+    for name, listener in (("after_flush", _after_flush), ("after_commit", _after_commit),
+                           ("after_transaction_create", _after_transaction_create),
+                           ("after_soft_rollback", _after_soft_rollback)):
+        if not event.contains(Session, name, listener):
+            event.listen(Session, name, listener)
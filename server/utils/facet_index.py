@@ -0,0 +1,265 @@
+# utils/facet_index.py
+"""
+Inverted index in Redis for catalogue filter facets.
+
+Every listable experience (published, with an upcoming slot) is a member of
+one set per facet value it carries: `facet:dest:<destination>`,
+`facet:act:<activity>` and `facet:price:<bucket>` for each price bucket its
+[min_price, max_price] range overlaps, plus `facet:all`. Counts for a filter
+selection are SINTERCARDs of those sets, so serving facets never scans
+Postgres. `facet:values:<dim>` ranks the known values of a dimension by how
+many experiences carry them, and `facet:exp:<id>` remembers what one
+experience contributed so reindexing it is a diff. `facet:expiry` holds each
+member's last slot date; experiences whose last slot has passed are dropped
+lazily at read time. Reindexing runs after commit via `workers.reindex_catalogue`.
+"""
+
+import logging
+import uuid
+from datetime import date
+
+from flask import current_app
+
+from models import Experience, ExperienceSummary
+
+logger = logging.getLogger(__name__)
+
+ALL_KEY = "facet:all"
+EXPIRY_KEY = "facet:expiry"
+EXPERIENCE_FACETS_PREFIX = "facet:exp:"
+SEPARATOR = "\x1f"
+
+DESTINATION = "dest"
+ACTIVITY = "act"
+PRICE = "price"
+
+# (label, lower bound, upper bound) in KES; the last bucket is open-ended
+PRICE_BUCKETS = (
+    ("0-1000", 0, 1000),
+    ("1000-2500", 1000, 2500),
+    ("2500-5000", 2500, 5000),
+    ("5000-10000", 5000, 10000),
+    ("10000-25000", 10000, 25000),
+    ("25000+", 25000, None),
+)
+
+MAX_VALUES = 50
+
+# Replace one experience's facet memberships atomically.
+# KEYS = exp facets set, all set, expiry zset
+# ARGV = experience id, expiry score ("" when not listable), members "<dim>\x1f<value>"
+# Value set keys are derived in the script, which is fine on the single
+# (non-cluster) Redis the app uses.
+_REINDEX_LUA = """
+local id = ARGV[1]
+local new = {}
+local members = {}
+for i = 3, #ARGV do
+    new[ARGV[i]] = true
+    members[#members + 1] = ARGV[i]
+end
+local old = {}
+for _, member in ipairs(redis.call('SMEMBERS', KEYS[1])) do
+    old[member] = true
+    if not new[member] then
+        local sep = string.find(member, '\\31', 1, true)
+        local dim = string.sub(member, 1, sep - 1)
+        local value = string.sub(member, sep + 1)
+        redis.call('SREM', 'facet:' .. dim .. ':' .. value, id)
+        if tonumber(redis.call('ZINCRBY', 'facet:values:' .. dim, -1, value)) <= 0 then
+            redis.call('ZREM', 'facet:values:' .. dim, value)
+        end
+    end
+end
+for _, member in ipairs(members) do
+    if not old[member] then
+        local sep = string.find(member, '\\31', 1, true)
+        local dim = string.sub(member, 1, sep - 1)
+        local value = string.sub(member, sep + 1)
+        redis.call('SADD', 'facet:' .. dim .. ':' .. value, id)
+        redis.call('ZINCRBY', 'facet:values:' .. dim, 1, value)
+    end
+end
+redis.call('DEL', KEYS[1])
+if ARGV[2] ~= '' then
+    redis.call('SADD', KEYS[2], id)
+    redis.call('ZADD', KEYS[3], tonumber(ARGV[2]), id)
+    if #members > 0 then
+        redis.call('SADD', KEYS[1], unpack(members))
+    end
+else
+    redis.call('SREM', KEYS[2], id)
+    redis.call('ZREM', KEYS[3], id)
+end
+return #members
+"""
+
+
+def facet_key(dimension, value):
+    return f"facet:{dimension}:{value}"
+
+
+def values_key(dimension):
+    return f"facet:values:{dimension}"
+
+
+def price_buckets_for_range(min_price, max_price):
+    """Labels of the buckets overlapping [min_price, max_price]; either bound may be None."""
+    labels = []
+    for label, lower, upper in PRICE_BUCKETS:
+        if max_price is not None and float(max_price) < lower:
+            continue
+        if min_price is not None and upper is not None and float(min_price) >= upper:
+            continue
+        labels.append(label)
+    return labels
+
+
+def _summary_members(row):
+    # Same trimmed text[] values the list endpoint filters on
+    members = {f"{DESTINATION}{SEPARATOR}{item}" for item in row.destinations or []}
+    members |= {f"{ACTIVITY}{SEPARATOR}{item}" for item in row.activities or []}
+    if row.max_price and row.max_price > 0:
+        members |= {f"{PRICE}{SEPARATOR}{label}" for label in price_buckets_for_range(row.min_price, row.max_price)}
+    return sorted(members)
+
+
+def reindex_facets(experience_ids):
+    """Bring the facet sets in line with the current rows of the given experiences."""
+    client = current_app.redis
+    ids = list({str(experience_id) for experience_id in experience_ids if experience_id})
+    if not ids:
+        return 0
+    rows = {
+        str(row.id): row
+        for row in (ExperienceSummary.query
+                    .with_entities(ExperienceSummary.experience_id.label('id'),
+                                   ExperienceSummary.destinations, ExperienceSummary.activities,
+                                   ExperienceSummary.status, ExperienceSummary.min_price,
+                                   ExperienceSummary.max_price, ExperienceSummary.last_slot_date)
+                    .filter(ExperienceSummary.experience_id.in_(ids))
+                    .all())
+    }
+    today = date.today()
+    script = client.register_script(_REINDEX_LUA)
+    for experience_id in ids:
+        row = rows.get(experience_id)  # deleted (summary cascades) -> dropped from every set
+        listable = (row is not None and row.status == "published"
+                    and row.last_slot_date is not None and row.last_slot_date >= today)
+        if listable:
+            args = [experience_id, row.last_slot_date.toordinal(), *_summary_members(row)]
+        else:
+            args = [experience_id, ""]
+        script(keys=[f"{EXPERIENCE_FACETS_PREFIX}{experience_id}", ALL_KEY, EXPIRY_KEY], args=args)
+    return len(ids)
+
+
+def rebuild_facet_index(batch_size=500):
+    """Reindex every experience in keyset batches (backfill / reconciliation)."""
+    reindexed = 0
+    after_id = None
+    while True:
+        query = Experience.query.with_entities(Experience.id).order_by(Experience.id)
+        if after_id is not None:
+            query = query.filter(Experience.id > after_id)
+        ids = [row.id for row in query.limit(batch_size).all()]
+        if not ids:
+            break
+        reindexed += reindex_facets(ids)
+        after_id = ids[-1]
+    logger.info(f"Rebuilt facet index for {reindexed} experiences")
+    return reindexed
+
+
+def expire_past_experiences(client=None):
+    """Drop experiences whose last slot date has passed (Redis only)."""
+    client = client or current_app.redis
+    expired = client.zrangebyscore(EXPIRY_KEY, "-inf", date.today().toordinal() - 1, start=0, num=500)
+    if not expired:
+        return 0
+    script = client.register_script(_REINDEX_LUA)
+    for experience_id in expired:
+        script(keys=[f"{EXPERIENCE_FACETS_PREFIX}{experience_id}", ALL_KEY, EXPIRY_KEY], args=[experience_id, ""])
+    return len(expired)
+
+
+def facet_counts(destinations=(), activities=(), min_price=None, max_price=None, limit=20):
+    """
+    Counts per destination, activity and price bucket for a filter selection.
+
+    Values are OR-ed within a dimension and AND-ed across dimensions, like the
+    list endpoint. Each dimension is counted against the selection of the
+    *other* dimensions, so the chips show what picking another value would
+    return. A price range selects the buckets it overlaps, so it is resolved
+    at bucket granularity. Two round trips: store the per-dimension unions, then count.
+    """
+    client = current_app.redis
+    expire_past_experiences(client)
+    limit = max(1, min(limit, MAX_VALUES))
+
+    selected = {
+        DESTINATION: [facet_key(DESTINATION, value) for value in destinations],
+        ACTIVITY: [facet_key(ACTIVITY, value) for value in activities],
+        PRICE: [],
+    }
+    if min_price is not None or max_price is not None:
+        selected[PRICE] = [facet_key(PRICE, label) for label in price_buckets_for_range(min_price, max_price)]
+        if not selected[PRICE]:
+            selected[PRICE] = [facet_key(PRICE, "none")]  # no bucket overlaps -> empty selection
+
+    token = uuid.uuid4().hex
+    union_keys = {}
+    pipe = client.pipeline(transaction=False)
+    for dimension, keys in selected.items():
+        if keys:
+            union_keys[dimension] = f"facet:tmp:{token}:{dimension}"
+            pipe.sunionstore(union_keys[dimension], keys)
+            pipe.expire(union_keys[dimension], 30)
+    pipe.zrevrange(values_key(DESTINATION), 0, limit - 1)
+    pipe.zrevrange(values_key(ACTIVITY), 0, limit - 1)
+    results = pipe.execute()
+    top_destinations, top_activities = results[-2], results[-1]
+
+    values = {
+        DESTINATION: _with_selected(top_destinations, destinations),
+        ACTIVITY: _with_selected(top_activities, activities),
+        PRICE: [label for label, _, _ in PRICE_BUCKETS],
+    }
+
+    pipe = client.pipeline(transaction=False)
+    pipe.sintercard(1 + len(union_keys), [ALL_KEY, *union_keys.values()])
+    for dimension, dimension_values in values.items():
+        base = [ALL_KEY, *(key for other, key in union_keys.items() if other != dimension)]
+        for value in dimension_values:
+            keys = [*base, facet_key(dimension, value)]
+            pipe.sintercard(len(keys), keys)
+    if union_keys:
+        pipe.delete(*union_keys.values())
+    counts = iter(pipe.execute())
+
+    total = next(counts)
+    facets = {}
+    for dimension, dimension_values in values.items():
+        facets[dimension] = [(value, next(counts)) for value in dimension_values]
+
+    return {
+        "total": total,
+        "destinations": _ranked(facets[DESTINATION]),
+        "activities": _ranked(facets[ACTIVITY]),
+        "price": [
+            {"bucket": label, "min": lower, "max": upper, "count": count}
+            for (label, lower, upper), (_, count) in zip(PRICE_BUCKETS, facets[PRICE])
+        ],
+    }
+
+
+def _with_selected(top_values, selected):
+    """Top values plus any selected value outside the top, so active chips always get a count."""
+    return list(dict.fromkeys([*top_values, *selected]))
+
+
+def _ranked(pairs):
+    return [
+        {"value": value, "count": count}
+        for value, count in sorted(pairs, key=lambda item: (-item[1], item[0]))
+    ]
@@ -0,0 +1,60 @@
+# utils/fast_json.py
+"""
+JSON encoding shared by the app and the cached catalogue responses.
+
+Catalogue entries are cached as ready-to-send JSON bytes, so a cache hit
+is served without unpickling a dict tree and re-encoding it. orjson is
+used when installed, with the stdlib encoder as a fallback.
+"""
+
+import json
+from decimal import Decimal
+
+from flask import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+
+class DecimalEncoder(json.JSONEncoder):
+    """stdlib encoder that renders Decimal (Numeric columns) as float"""
+
+    def default(self, obj):
+        if isinstance(obj, Decimal):
+            return float(obj)
+        return super().default(obj)
+
+
+def _orjson_default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps_bytes(obj) -> bytes:
+    """Serialize to compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, cls=DecimalEncoder, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def loads(body):
+    """Parse JSON bytes/str (the inverse of dumps_bytes)."""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def json_response(body: bytes, status: int = 200, cached: bool = False, headers=None) -> Response:
+    """
+    Response for a pre-serialized JSON object body. `cached` splices a
+    top-level "cached": true into the object without decoding it.
+    """
+    if cached and body.endswith(b"}"):
+        body = body[:-1] + (b',"cached":true}' if body != b"{}" else b'"cached":true}')
+    response = Response(body, status=status, mimetype="application/json")
+    if headers:
+        response.headers.extend(headers)
+    return response
@@ -0,0 +1,102 @@
+# utils/invalidation_listener.py
+"""
+Database-driven cache invalidation.
+
+The `notify_cache_invalidation` triggers (migration 7a2f5c9e1d04) send the
+cache tag of every committed change to experiences, slots, reviews and
+provider profiles on the `cache_invalidate` channel. This listener holds one
+dedicated connection with LISTEN on that channel, collects payloads for a
+short window and invalidates the distinct tags in one `invalidate_tags`
+call. That covers writes made outside the Flask resources (Celery workers,
+admin SQL, migrations), which don't go through the resources' explicit
+invalidation.
+
+Notifications are not queued while the listener is disconnected, so after
+every (re)connect the catalogue tag is invalidated to cover the gap; detail
+entries missed in that window are bounded by their TTL.
+"""
+
+import logging
+import select
+import time
+
+import psycopg2
+import psycopg2.extensions
+from sqlalchemy.engine import make_url
+
+from utils.cache_tags import CATALOGUE_TAG, invalidate_tags
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "cache_invalidate"
+
+
+class InvalidationListener:
+    """LISTEN loop that batches trigger notifications into tag invalidations."""
+
+    def __init__(self, app, batch_window=0.2, max_batch=500, max_backoff=30):
+        self.app = app
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.max_backoff = max_backoff
+        self.running = False
+
+    def _dsn(self):
+        # Same database as the app; psycopg2 takes a plain libpq URL
+        url = make_url(self.app.config["SQLALCHEMY_DATABASE_URI"]).set(drivername="postgresql")
+        return url.render_as_string(hide_password=False)
+
+    def _connect(self):
+        conn = psycopg2.connect(self._dsn())
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {CHANNEL}")
+        return conn
+
+    def _collect(self, conn, timeout):
+        """Wait up to `timeout` for a notification, then drain for one batch window."""
+        tags = set()
+        if select.select([conn], [], [], timeout) == ([], [], []):
+            return tags
+        deadline = time.monotonic() + self.batch_window
+        while len(tags) < self.max_batch:
+            conn.poll()
+            while conn.notifies and len(tags) < self.max_batch:
+                tags.add(conn.notifies.pop(0).payload)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or select.select([conn], [], [], remaining) == ([], [], []):
+                break
+        return tags
+
+    def flush(self, tags):
+        if not tags:
+            return 0
+        with self.app.app_context():
+            deleted = invalidate_tags(*tags)
+        logger.debug(f"Invalidated {len(tags)} tags ({deleted} cache keys)")
+        return deleted
+
+    def run(self, idle_timeout=5.0):
+        """Listen until stop() is called, reconnecting with backoff on errors."""
+        self.running = True
+        backoff = 1
+        while self.running:
+            conn = None
+            try:
+                conn = self._connect()
+                logger.info(f"Listening for cache invalidations on '{CHANNEL}'")
+                # Anything committed while we were not listening was missed
+                self.flush({CATALOGUE_TAG})
+                backoff = 1
+                while self.running:
+                    self.flush(self._collect(conn, idle_timeout))
+            except (psycopg2.Error, OSError) as e:
+                logger.error(f"Invalidation listener connection lost: {e}; retrying in {backoff}s")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def stop(self):
+        self.running = False
@@ -0,0 +1,141 @@
+# utils/inventory.py
+"""
+Slot inventory holds for pending payments.
+
+A reservation request takes its places up front with one conditional
+`UPDATE slots SET booked = booked + n WHERE capacity - booked >= n`, so
+concurrent requests for the last places can't all pass a read-then-write
+check and pay for places that don't exist; the row is locked only for that
+statement's transaction. The hold is recorded on the ApiCollection
+(`hold_status`, `hold_expires_at`) and then either confirmed by the
+payment callback, which tells `logg_wallet` not to book the places again,
+released by a failed payment, or released by `workers.release_expired_holds`
+once it expires without a callback; that also moves the collection to
+`expired`, so no payment is started against the released places. Payments
+without a hold book through the same conditional update (`book_places`).
+
+Transitions lock the collection row, so a callback racing the expiry job
+settles the hold exactly once.
+"""
+
+import logging
+from datetime import timedelta
+
+from sqlalchemy import func, select, update
+
+from models import ApiCollection, Slot, CollectionStatus
+from utils.experience_summary import track_slot_booking
+from utils.payment_state import transition, publish_status
+
+logger = logging.getLogger(__name__)
+
+HELD = "held"
+CONFIRMED = "confirmed"
+RELEASED = "released"
+
+# STK prompts time out in about a minute; leave room for late callbacks
+HOLD_TTL = timedelta(minutes=10)
+
+
+def book_places(session, slot_id, quantity):
+    """
+    Add `quantity` to the slot's bookings if that many places are still free
+    (negative quantities return places). Returns False when the slot is full.
+    """
+    condition = [Slot.id == slot_id]
+    if quantity > 0:
+        condition.append(Slot.capacity - Slot.booked >= quantity)
+    experience_id = session.execute(
+        update(Slot)
+        .where(*condition)
+        .values(booked=Slot.booked + quantity)
+        .returning(Slot.experience_id)
+        .execution_options(synchronize_session=False)
+    ).scalar_one_or_none()
+    if experience_id is None:
+        return False
+    track_slot_booking(session, slot_id, experience_id, quantity)
+    return True
+
+
+def _lock_hold_status(session, api_collection):
+    """Lock the collection row and return its current hold status."""
+    status = session.execute(
+        select(ApiCollection.hold_status)
+        .where(ApiCollection.id == api_collection.id)
+        .with_for_update()
+    ).scalar_one_or_none()
+    api_collection.hold_status = status
+    return status
+
+
+def place_hold(session, api_collection):
+    """
+    Take the collection's places on its slot. Returns False when not enough
+    places remain. The caller commits (together with the collection).
+    """
+    if not book_places(session, api_collection.slot_id, int(api_collection.quantity)):
+        return False
+    api_collection.hold_status = HELD
+    api_collection.hold_expires_at = func.now() + HOLD_TTL
+    return True
+
+
+def confirm_hold(session, api_collection):
+    """
+    Settle the hold of a paid collection. Returns True when the places are
+    booked by the hold (so the booking must not add them again); False for
+    collections without a hold (installments) or when an expired hold's
+    places were taken in the meantime.
+    """
+    status = _lock_hold_status(session, api_collection)
+    if status is None:
+        return False
+    if status == CONFIRMED:
+        return True  # repeated callback
+    if status == RELEASED and not book_places(session, api_collection.slot_id, int(api_collection.quantity)):
+        logger.error(f"Payment for collection {api_collection.id} arrived after its hold expired "
+                     f"and slot {api_collection.slot_id} is full")
+        return False
+    api_collection.hold_status = CONFIRMED
+    return True
+
+
+def release_hold(session, api_collection):
+    """Return a held collection's places to the slot. Returns True if a hold was released."""
+    if _lock_hold_status(session, api_collection) != HELD:
+        return False
+    book_places(session, api_collection.slot_id, -int(api_collection.quantity))
+    api_collection.hold_status = RELEASED
+    return True
+
+
+def release_expired_holds(session, batch_size=200):
+    """
+    Release holds past their expiry in batches, skipping rows a callback is
+    settling right now, and expire their unpaid collections. Returns the
+    number of holds released.
+    """
+    released = 0
+    while True:
+        collections = (session.query(ApiCollection)
+                       .filter(ApiCollection.hold_status == HELD,
+                               ApiCollection.hold_expires_at < func.now())
+                       .order_by(ApiCollection.hold_expires_at)
+                       .limit(batch_size)
+                       .with_for_update(skip_locked=True)
+                       .all())
+        if not collections:
+            break
+        expired = []
+        for api_collection in collections:
+            if release_hold(session, api_collection):
+                released += 1
+                if transition(api_collection, CollectionStatus.EXPIRED):
+                    expired.append(api_collection)
+        session.commit()
+        for api_collection in expired:
+            publish_status(api_collection, error="Payment window expired")
+        if len(collections) < batch_size:
+            break
+    return released
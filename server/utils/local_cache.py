@@ -0,0 +1,220 @@
+# utils/local_cache.py
+"""
+Two-tier cache for hot public read paths.
+
+A bounded in-process LRU (per gunicorn worker, short TTL) sits in front of
+the shared Flask-Caching Redis backend. Deletes go to Redis, drop the local
+copy and are broadcast on a Redis pub/sub channel so every other worker
+evicts its local copy too. Values served from the local tier are shared
+between requests and must be treated as read-only.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "cache:local-invalidate"
+_CLEAR_ALL = "*"
+_MISSING = object()
+
+
+class LocalLRUCache:
+    """Thread-safe LRU with per-entry expiry."""
+
+    def __init__(self, maxsize=1024, ttl=30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete_many(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            size = len(self._data)
+        lookups = self.hits + self.misses
+        return {
+            "size": size,
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class TieredCache:
+    """
+    get/set/delete facade over LocalLRUCache + Flask-Caching.
+    Only use it for keys whose writers also go through it (or through
+    utils.cache_tags, which evicts the local tier on invalidation).
+    """
+
+    def __init__(self, remote, redis_client=None, maxsize=1024, ttl=30, channel=INVALIDATION_CHANNEL):
+        self.remote = remote
+        self.local = LocalLRUCache(maxsize=maxsize, ttl=ttl)
+        self.redis = redis_client
+        self.channel = channel
+        self.remote_hits = 0
+        self.remote_misses = 0
+        self._listener_pid = None
+        self._listener_lock = threading.Lock()
+
+    # --- reads / writes ---
+
+    def get(self, key):
+        self._ensure_listener()
+        value = self.local.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        value = self.remote.get(key)
+        if value is None:
+            self.remote_misses += 1
+            return None
+        self.remote_hits += 1
+        self.local.set(key, value)
+        return value
+
+    def get_many(self, *keys):
+        """Values in key order (None for misses); one remote MGET for local misses."""
+        self._ensure_listener()
+        values = [self.local.get(key, _MISSING) for key in keys]
+        missing = [key for key, value in zip(keys, values) if value is _MISSING]
+        if missing:
+            fetched = dict(zip(missing, self.remote.get_many(*missing)))
+            for key, value in fetched.items():
+                if value is None:
+                    self.remote_misses += 1
+                else:
+                    self.remote_hits += 1
+                    self.local.set(key, value)
+            values = [fetched[key] if value is _MISSING else value for key, value in zip(keys, values)]
+        return values
+
+    def set(self, key, value, timeout=None):
+        self.remote.set(key, value, timeout=timeout)
+        self.local.set(key, value, ttl=timeout or None)
+
+    def set_many(self, mapping, timeout=None):
+        self.remote.set_many(mapping, timeout=timeout)
+        for key, value in mapping.items():
+            self.local.set(key, value, ttl=timeout or None)
+
+    def delete(self, key):
+        return self.delete_many(key)
+
+    def delete_many(self, *keys):
+        if not keys:
+            return
+        self.remote.delete_many(*keys)
+        self.evict_local(*keys)
+
+    def evict_local(self, *keys):
+        """Drop keys from this worker's tier and tell the other workers to do the same."""
+        if not keys:
+            return
+        self.local.delete_many(*keys)
+        self._publish(list(keys))
+
+    def clear_local(self):
+        self.local.clear()
+        self._publish(_CLEAR_ALL)
+
+    def stats(self):
+        lookups = self.remote_hits + self.remote_misses
+        return {
+            "local": self.local.stats(),
+            "remote": {
+                "hits": self.remote_hits,
+                "misses": self.remote_misses,
+                "hit_rate": round(self.remote_hits / lookups, 4) if lookups else 0.0,
+            },
+            "invalidation_listener": self._listener_pid == os.getpid(),
+        }
+
+    # --- cross-worker invalidation ---
+
+    def _publish(self, payload):
+        if self.redis is None:
+            return
+        try:
+            self.redis.publish(self.channel, json.dumps(payload))
+        except Exception as e:
+            logger.warning(f"Local cache invalidation broadcast failed: {e}")
+
+    def _ensure_listener(self):
+        """Start the pub/sub listener once per worker process (after fork)."""
+        if self.redis is None or self._listener_pid == os.getpid():
+            return
+        with self._listener_lock:
+            if self._listener_pid == os.getpid():
+                return
+            # Anything inherited from the parent process may already be stale
+            self.local.clear()
+            thread = threading.Thread(target=self._listen, name="local-cache-invalidation", daemon=True)
+            thread.start()
+            self._listener_pid = os.getpid()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    self._apply(message.get("data"))
+            except Exception as e:
+                # Messages may have been missed while disconnected
+                logger.warning(f"Local cache invalidation listener error: {e}")
+                self.local.clear()
+                time.sleep(1)
+
+    def _apply(self, data):
+        try:
+            payload = json.loads(data)
+        except (TypeError, ValueError):
+            return
+        if payload == _CLEAR_ALL:
+            self.local.clear()
+        elif isinstance(payload, list):
+            self.local.delete_many(*payload)
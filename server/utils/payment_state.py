@@ -0,0 +1,72 @@
+# utils/payment_state.py
+"""
+State machine for reservation payments (ApiCollection.status).
+
+    PENDING --> initiated --> completed
+       |            |              ^
+       +------------+--> expired --+
+       |            |       |
+       +------------+-------+--> failed
+
+A reservation request only persists the collection and queues the payment;
+the client follows it on its event stream (utils.subscribe_manager), where
+every transition is published, or polls the collection's status endpoint.
+PENDING may go straight to completed/failed because a gateway callback can
+arrive before the initiating worker has recorded `initiated`. A collection
+whose inventory hold lapsed is `expired` (utils.inventory); nothing new is
+sent for it, but a payment already made still settles it. completed and
+failed are terminal, so a repeated callback is recognised and ignored.
+"""
+
+import logging
+
+from models import CollectionStatus
+from utils.subscribe_manager import push_to_queue
+
+logger = logging.getLogger(__name__)
+
+TRANSITIONS = {
+    CollectionStatus.PENDING: {CollectionStatus.INITIATED, CollectionStatus.COMPLETED, CollectionStatus.FAILED,
+                               CollectionStatus.EXPIRED},
+    CollectionStatus.INITIATED: {CollectionStatus.COMPLETED, CollectionStatus.FAILED, CollectionStatus.EXPIRED},
+    CollectionStatus.EXPIRED: {CollectionStatus.COMPLETED, CollectionStatus.FAILED},
+}
+
+# Event `state` names the clients already understand
+EVENT_STATES = {
+    CollectionStatus.PENDING: "request_received",
+    CollectionStatus.INITIATED: "pending_confirmation",
+    CollectionStatus.COMPLETED: "success",
+    CollectionStatus.FAILED: "failed",
+    CollectionStatus.EXPIRED: "expired",
+}
+
+EVENT_TYPE = "reservation_request"
+
+
+def transition(api_collection, status):
+    """
+    Move the collection to `status` if that is a valid next state. Returns
+    False, leaving it unchanged, otherwise. The caller commits and then
+    publishes.
+    """
+    current = api_collection.status
+    if status not in TRANSITIONS.get(current, ()):
+        logger.info(f"Ignoring {current} -> {status} for collection {api_collection.id}")
+        return False
+    api_collection.status = status
+    return True
+
+
+def publish_status(api_collection, **data):
+    """Push the collection's current state to its user's event stream (after commit)."""
+    payload = {
+        "state": EVENT_STATES.get(api_collection.status, api_collection.status),
+        "collection_id": str(api_collection.id),
+        **data,
+    }
+    try:
+        push_to_queue(api_collection.user_id, payload, event_type=EVENT_TYPE)
+    except Exception as e:
+        # Clients can still poll the status endpoint
+        logger.warning(f"Could not publish status of collection {api_collection.id}: {e}")
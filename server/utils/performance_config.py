@@ -1,19 +1,28 @@
 # performance_config.py
 """
 Performance optimizations for the experience API
-Includes database indexes, cache configuration, and monitoring
+Includes database indexes, cache configuration, cache warming and monitoring.
+
+Periodic work (read-model reconciliation, cache warming) runs as Celery beat
+tasks in workers/scheduled.py, which call into CacheWarmer and QueryOptimizer
+here and report their durations through record_job_run.
 """
 
-from flask import Flask
+import json
+import time
+
+from flask import Flask, current_app
 from flask_caching import Cache
 from sqlalchemy import Index, text
 import redis
 import logging
 
-# Configure logging for performance monitoring
-logging.basicConfig(level=logging.INFO)
+# Performance monitoring logger (handlers/levels are the entrypoint's business;
+# this module is imported by the app and the workers)
 perf_logger = logging.getLogger('performance')
 
+JOB_STATS_KEY = "jobs:last_run"
+
 # --- Cache Configuration ---
 class CacheConfig:
     """Optimized cache configuration for different environments"""
@@ -73,17 +82,8 @@ class DatabaseOptimizer:
                     "ON experiences (status, start_date, created_at DESC) "
                     "WHERE status = 'published'",
                     
-                    # Search optimization
-                    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_experience_search "
-                    "ON experiences USING gin(to_tsvector('english', title || ' ' || COALESCE(description, '')))",
-                    
-                    # Destination filtering
-                    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_experience_destinations "
-                    "ON experiences USING gin(destinations)",
-                    
-                    # Activity filtering
-                    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_experience_activities "
-                    "ON experiences USING gin(activities)",
+                    # Search and destination/activity filtering are served by the
+                    # experience_summaries indexes created in migrations
                     
                     # Provider lookup
                     "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_experience_provider_status "
@@ -179,266 +179,65 @@ class DatabaseOptimizer:
                 
         except Exception as e:
             perf_logger.warning(f"PostgreSQL optimization failed: {str(e)}")
-    
-    @staticmethod
-    def create_database_functions(db):
-        """Create custom database functions for better performance"""
-        try:
-            with db.engine.connect() as conn:
-                # Function to calculate experience popularity score
-                conn.execute(text("""
-                    CREATE OR REPLACE FUNCTION calculate_popularity_score(experience_id UUID)
-                    RETURNS DECIMAL AS $
-                    DECLARE
-                        score DECIMAL := 0;
-                        total_bookings INTEGER := 0;
-                        recent_bookings INTEGER := 0;
-                        days_since_created INTEGER := 0;
-                    BEGIN
-                        -- Get total bookings
-                        SELECT COALESCE(SUM(booked), 0) INTO total_bookings
-                        FROM slots WHERE slots.experience_id = $1;
-                        
-                        -- Get recent bookings (last 30 days)
-                        SELECT COALESCE(SUM(booked), 0) INTO recent_bookings
-                        FROM slots s
-                        JOIN experiences e ON s.experience_id = e.id
-                        WHERE s.experience_id = $1 
-                        AND e.created_at > NOW() - INTERVAL '30 days';
-                        
-                        -- Get days since creation
-                        SELECT EXTRACT(days FROM NOW() - created_at) INTO days_since_created
-                        FROM experiences WHERE id = $1;
-                        
-                        -- Calculate score: recent bookings weighted by recency
-                        score := recent_bookings * (1.0 - LEAST(days_since_created / 30.0, 1.0)) + 
-                                total_bookings * 0.1;
-                        
-                        RETURN score;
-                    END;
-                    $ LANGUAGE plpgsql;
-                """))
-                
-                # Function to get available slots count efficiently
-                conn.execute(text("""
-                    CREATE OR REPLACE FUNCTION get_available_slots(experience_id UUID)
-                    RETURNS INTEGER AS $
-                    BEGIN
-                        RETURN COALESCE(
-                            (SELECT SUM(capacity - booked) 
-                             FROM slots 
-                             WHERE slots.experience_id = $1 
-                             AND date >= CURRENT_DATE), 
-                            0
-                        );
-                    END;
-                    $ LANGUAGE plpgsql;
-                """))
-                
-                conn.commit()
-                perf_logger.info("Created custom database functions")
-                
-        except Exception as e:
-            perf_logger.error(f"Database function creation failed: {str(e)}")
-    
-    @staticmethod
-    def create_triggers_for_cache_invalidation(db):
-        """Create triggers to automatically invalidate cache"""
-        try:
-            with db.engine.connect() as conn:
-                # Trigger function to notify cache invalidation
-                conn.execute(text("""
-                    CREATE OR REPLACE FUNCTION notify_cache_invalidation()
-                    RETURNS TRIGGER AS $
-                    BEGIN
-                        -- Notify cache invalidation with experience ID
-                        IF TG_OP = 'UPDATE' OR TG_OP = 'INSERT' THEN
-                            PERFORM pg_notify('cache_invalidate', 
-                                'experience:' || COALESCE(NEW.id::text, NEW.experience_id::text));
-                            RETURN NEW;
-                        ELSIF TG_OP = 'DELETE' THEN
-                            PERFORM pg_notify('cache_invalidate', 
-                                'experience:' || COALESCE(OLD.id::text, OLD.experience_id::text));
-                            RETURN OLD;
-                        END IF;
-                        RETURN NULL;
-                    END;
-                    $ LANGUAGE plpgsql;
-                """))
-                
-                # Create triggers on experiences table
-                conn.execute(text("""
-                    DROP TRIGGER IF EXISTS experience_cache_invalidate ON experiences;
-                    CREATE TRIGGER experience_cache_invalidate
-                    AFTER INSERT OR UPDATE OR DELETE ON experiences
-                    FOR EACH ROW EXECUTE FUNCTION notify_cache_invalidation();
-                """))
-                
-                # Create triggers on slots table
-                conn.execute(text("""
-                    DROP TRIGGER IF EXISTS slot_cache_invalidate ON slots;
-                    CREATE TRIGGER slot_cache_invalidate
-                    AFTER INSERT OR UPDATE OR DELETE ON slots
-                    FOR EACH ROW EXECUTE FUNCTION notify_cache_invalidation();
-                """))
-                
-                conn.commit()
-                perf_logger.info("Created cache invalidation triggers")
-                
-        except Exception as e:
-            perf_logger.error(f"Trigger creation failed: {str(e)}")
 
 # --- Cache Warming ---
 class CacheWarmer:
-    """Cache warming utilities for better performance"""
-    
-    def __init__(self, app: Flask, cache: Cache, db):
-        self.app = app
-        self.cache = cache
-        self.db = db
+    """
+    Refreshes the hottest public catalogue entries ahead of expiry, through
+    the same cache keys, tags and single-flight locks the resources use, so
+    deploys and TTL expiry don't send every cold request to the database at once.
+    """
     
-    def warm_popular_experiences(self):
-        """Pre-populate cache with popular experiences"""
-        with self.app.app_context():
-            from models import Experience, Slot
-            from sqlalchemy import func, desc
-            
-            try:
-                # Get most popular experiences based on bookings
-                popular_experiences = (
-                    self.db.session.query(Experience)
-                    .join(Slot)
-                    .filter(Experience.status == 'published')
-                    .group_by(Experience.id)
-                    .order_by(desc(func.sum(Slot.booked)))
-                    .limit(50)
-                    .all()
-                )
-                
-                # Cache individual experience details
-                from resources.experiences_public import CachedExperience
-                from dataclasses import asdict
-                
-                for exp in popular_experiences:
-                    cached_exp = CachedExperience.from_experience(exp)
-                    cache_key = f"exp:detail:{exp.id}"
-                    self.cache.set(cache_key, asdict(cached_exp), timeout=600)
-                
-                perf_logger.info(f"Warmed cache with {len(popular_experiences)} popular experiences")
-                
-            except Exception as e:
-                perf_logger.error(f"Cache warming failed: {str(e)}")
+    # Default-filter first pages clients open most
+    LIST_SORTS = ("created_at", "popularity", "price_asc", "start_date")
+    DETAIL_COUNT = 20
     
     def warm_trending_data(self):
-        """Pre-populate trending experiences cache"""
-        with self.app.app_context():
-            try:
-                from resources.experiences_public import TrendingExperiences
-                trending_resource = TrendingExperiences()
-                trending_resource.get()  # This will populate the cache
-                perf_logger.info("Warmed trending experiences cache")
-            except Exception as e:
-                perf_logger.error(f"Trending cache warming failed: {str(e)}")
+        """Recompute the trending body; returns whether it was refreshed"""
+        from resources.experiences_public import TrendingExperiences
+        
+        resource = TrendingExperiences()
+        return resource.cache_util.refresh_hot_experiences(resource._load_trending)
     
-    def warm_filter_options(self):
-        """Pre-populate filter options cache"""
-        with self.app.app_context():
-            try:
-                from models import Experience, Slot
-                from sqlalchemy import func, distinct
-                
-                # Pre-calculate filter options
-                destinations = (self.db.session.query(func.unnest(Experience.destinations).label('destination'))
-                              .filter(Experience.status == 'published')
-                              .distinct()
-                              .limit(100)
-                              .all())
-                
-                activities = (self.db.session.query(func.unnest(Experience.activities).label('activity'))
-                            .filter(Experience.status == 'published')
-                            .distinct()
-                            .limit(100)
-                            .all())
-                
-                price_range = (self.db.session.query(func.min(Slot.price), func.max(Slot.price))
-                              .join(Experience)
-                              .filter(Experience.status == 'published')
-                              .first())
-                
-                filter_data = {
-                    "destinations": [row.destination for row in destinations if row.destination],
-                    "activities": [row.activity for row in activities if row.activity],
-                    "price_range": {
-                        "min": float(price_range[0]) if price_range[0] else 0,
-                        "max": float(price_range[1]) if price_range[1] else 1000
-                    }
-                }
-                
-                self.cache.set("filter_options", filter_data, timeout=3600)
-                perf_logger.info("Warmed filter options cache")
-                
-            except Exception as e:
-                perf_logger.error(f"Filter options cache warming failed: {str(e)}")
+    def warm_list_pages(self):
+        """Recompute the first list page of each common sort; returns the number refreshed"""
+        from resources.experiences_public import PublicExperienceList, filter_schema
+        
+        resource = PublicExperienceList()
+        warmed = 0
+        for sort_by in self.LIST_SORTS:
+            filters = filter_schema.load({"sort_by": sort_by})
+            body, tags = resource.render_page(filters)
+            resource.cache_util.set_experience_list(body, tags=tags, **filters)
+            warmed += 1
+        return warmed
     
-    def warm_search_suggestions(self):
-        """Pre-populate common search suggestions"""
-        with self.app.app_context():
+    def warm_popular_experiences(self):
+        """Recompute detail bodies of the top trending experiences; returns the number refreshed"""
+        from resources.experiences_public import PublicExperienceDetail
+        from utils.trending import top_experience_ids
+        
+        resource = PublicExperienceDetail()
+        warmed = 0
+        for experience_id in top_experience_ids(self.DETAIL_COUNT):
+            if resource.cache_util.refresh_experience_detail(
+                experience_id, lambda experience_id=experience_id: resource._load_detail(experience_id)
+            ):
+                warmed += 1
+        return warmed
+    
+    def warm_all(self):
+        """Run every warmer, isolating failures; returns per-warmer results"""
+        results = {}
+        for name, warm in (("trending", self.warm_trending_data),
+                           ("list_pages", self.warm_list_pages),
+                           ("details", self.warm_popular_experiences)):
             try:
-                from models import Experience
-                from collections import Counter
-                
-                # Get most common words from titles and activities
-                experiences = (self.db.session.query(Experience.title, Experience.activities)
-                              .filter(Experience.status == 'published')
-                              .all())
-                
-                word_count = Counter()
-                for title, activities in experiences:
-                    # Extract words from title
-                    words = title.lower().split()
-                    word_count.update(word for word in words if len(word) > 3)
-                    
-                    # Extract from activities
-                    if activities:
-                        word_count.update(activity.lower() for activity in activities)
-                
-                # Cache top suggestions
-                top_suggestions = [word for word, count in word_count.most_common(50)]
-                self.cache.set("search_suggestions:popular", top_suggestions, timeout=1800)
-                
-                perf_logger.info("Warmed search suggestions cache")
-                
+                results[name] = warm()
             except Exception as e:
-                perf_logger.error(f"Search suggestions cache warming failed: {str(e)}")
-    
-    def schedule_cache_warming(self):
-        """Schedule periodic cache warming (integrate with Celery/APScheduler)"""
-        try:
-            # This would typically use Celery beat or APScheduler
-            import schedule
-            import time
-            import threading
-            
-            def run_scheduled_warming():
-                schedule.every(10).minutes.do(self.warm_trending_data)
-                schedule.every(30).minutes.do(self.warm_popular_experiences)
-                schedule.every(1).hours.do(self.warm_filter_options)
-                schedule.every(2).hours.do(self.warm_search_suggestions)
-                
-                while True:
-                    schedule.run_pending()
-                    time.sleep(60)  # Check every minute
-            
-            # Run in background thread
-            warming_thread = threading.Thread(target=run_scheduled_warming, daemon=True)
-            warming_thread.start()
-            
-            perf_logger.info("Scheduled cache warming started")
-            
-        except ImportError:
-            perf_logger.warning("Schedule library not installed, skipping automatic cache warming")
-        except Exception as e:
-            perf_logger.error(f"Cache warming scheduling failed: {str(e)}")
+                perf_logger.error(f"Cache warming ({name}) failed: {str(e)}")
+                results[name] = "failed"
+        return results
 
 # --- Performance Monitoring ---
 class PerformanceMonitor:
@@ -552,6 +351,35 @@ class PerformanceMonitor:
         
         return []
 
+
+# --- Job Metrics ---
+def record_job_run(name: str, duration: float, ok: bool = True, result=None):
+    """Log a periodic job's duration and keep its last run in Redis for /health"""
+    perf_logger.info(f"Job: {name} | Duration: {duration:.3f}s | OK: {ok} | Result: {result}")
+    client = getattr(current_app, "redis", None)
+    if client is None:
+        return
+    try:
+        client.hset(JOB_STATS_KEY, name, json.dumps({
+            "duration_ms": round(duration * 1000, 1),
+            "ok": ok,
+            "result": result if isinstance(result, (int, float, str, dict, type(None))) else str(result),
+            "finished_at": int(time.time()),
+        }))
+    except Exception as e:
+        perf_logger.warning(f"Job stats write failed for {name}: {str(e)}")
+
+def job_stats():
+    """Last run of every periodic job, by name"""
+    client = getattr(current_app, "redis", None)
+    if client is None:
+        return {}
+    try:
+        return {name: json.loads(value) for name, value in client.hgetall(JOB_STATS_KEY).items()}
+    except Exception as e:
+        perf_logger.warning(f"Job stats read failed: {str(e)}")
+        return {}
+
 # --- Advanced Cache Strategies ---
 class AdvancedCacheStrategy:
     """Advanced caching strategies for optimal performance"""
@@ -622,38 +450,16 @@ class AdvancedCacheStrategy:
 
 # --- Configuration Setup ---
 def setup_performance_optimizations(app: Flask, db, cache: Cache):
-    """Setup all performance optimizations"""
-    
-    # Apply database optimizations
-    with app.app_context():
-        optimizer = DatabaseOptimizer()
-        optimizer.create_performance_indexes(db)
-        optimizer.analyze_tables(db)
-        optimizer.optimize_postgresql_settings(db)
-        optimizer.create_database_functions(db)
-        optimizer.create_triggers_for_cache_invalidation(db)
-    
-    # Setup cache warming
-    warmer = CacheWarmer(app, cache, db)
+    """
+    Register the performance endpoints. Indexes come from migrations and
+    warming from the beat schedule, so nothing heavy runs at startup.
+    """
     
-    # Setup monitoring
+    optimizer = DatabaseOptimizer()
+    warmer = CacheWarmer()
     monitor = PerformanceMonitor(cache)
-    
-    # Setup advanced caching
     cache_strategy = AdvancedCacheStrategy(cache)
     
-    # Schedule initial cache warming
-    @app.before_first_request
-    def warm_caches():
-        try:
-            warmer.warm_trending_data()
-            warmer.warm_popular_experiences()
-            warmer.warm_filter_options()
-            warmer.warm_search_suggestions()
-            warmer.schedule_cache_warming()
-        except Exception as e:
-            perf_logger.error(f"Initial cache warming failed: {str(e)}")
-    
     # Add performance monitoring endpoint
     @app.route('/api/performance/stats')
     def performance_stats():
@@ -662,19 +468,16 @@ def setup_performance_optimizations(app: Flask, db, cache: Cache):
             'performance_summary': monitor.get_performance_summary(),
             'top_cached_keys': monitor.get_top_cached_keys(),
             'slow_cache_ops': monitor.get_slow_cache_operations(),
-            'database_stats': optimizer.get_query_stats(db)
+            'database_stats': optimizer.get_query_stats(db),
+            'jobs': job_stats(),
         }
     
     # Add cache management endpoints
     @app.route('/api/performance/cache/warm', methods=['POST'])
     def warm_cache():
-        try:
-            warmer.warm_trending_data()
-            warmer.warm_popular_experiences()
-            warmer.warm_filter_options()
-            return {"message": "Cache warming completed", "status": "success"}, 200
-        except Exception as e:
-            return {"error": str(e), "status": "failed"}, 500
+        from workers.scheduled import warm_catalogue_caches
+        warm_catalogue_caches.delay()
+        return {"message": "Cache warming queued", "status": "success"}, 202
     
     @app.route('/api/performance/cache/clear', methods=['POST'])
     def clear_cache():
@@ -725,154 +528,27 @@ def setup_cache_backend(app: Flask, environment='production'):
     
     return cache
 
-# --- Advanced Optimizations ---
+# --- Read Model Refresh ---
 class QueryOptimizer:
-    """Advanced query optimization techniques"""
+    """
+    Refresh of the precomputed read models. The experience_summaries table
+    replaces the materialized views this module used to define: it is kept
+    current on every flush, and the periodic refresh only reconciles it (in
+    keyset batches, safe while serving) along with the Redis search indexes.
+    """
     
     @staticmethod
-    def optimize_experience_queries(db):
-        """Create materialized views for common queries"""
+    def refresh_read_models(db):
+        """Reconcile summaries, then the typeahead and facet indexes; returns row counts"""
+        from utils.experience_summary import rebuild_all_summaries
+        from utils.search_suggest import rebuild_suggestion_index
+        from utils.facet_index import rebuild_facet_index
         
-        materialized_views = [
-            # Experience summary view with pre-calculated slot data
-            """
-            CREATE MATERIALIZED VIEW IF NOT EXISTS experience_summary AS
-            SELECT 
-                e.id,
-                e.title,
-                e.description,
-                e.destinations,
-                e.activities,
-                e.poster_image_url,
-                e.start_date,
-                e.end_date,
-                e.status,
-                e.meeting_point,
-                e.provider_id,
-                e.created_at,
-                e.updated_at,
-                u.name as provider_name,
-                u.avatar_url as provider_avatar,
-                COALESCE(s.min_price, 0) as min_price,
-                COALESCE(s.max_price, 0) as max_price,
-                COALESCE(s.total_capacity, 0) as total_slots,
-                COALESCE(s.total_capacity - s.total_booked, 0) as available_slots,
-                COALESCE(s.total_booked, 0) as total_bookings,
-                calculate_popularity_score(e.id) as popularity_score
-            FROM experiences e
-            LEFT JOIN users u ON e.provider_id = u.id
-            LEFT JOIN (
-                SELECT 
-                    experience_id,
-                    MIN(price) as min_price,
-                    MAX(price) as max_price,
-                    SUM(capacity) as total_capacity,
-                    SUM(booked) as total_booked
-                FROM slots 
-                WHERE date >= CURRENT_DATE
-                GROUP BY experience_id
-            ) s ON e.id = s.experience_id
-            WHERE e.status = 'published'
-            """,
-            
-            # Trending experiences view with time-based scoring
-            """
-            CREATE MATERIALIZED VIEW IF NOT EXISTS trending_experiences AS
-            SELECT 
-                es.*,
-                CASE 
-                    WHEN es.created_at > NOW() - INTERVAL '7 days' THEN es.popularity_score * 2.0
-                    WHEN es.created_at > NOW() - INTERVAL '30 days' THEN es.popularity_score * 1.5
-                    ELSE es.popularity_score
-                END as trending_score
-            FROM experience_summary es
-            WHERE es.start_date >= CURRENT_DATE
-            ORDER BY trending_score DESC, es.created_at DESC
-            LIMIT 100
-            """,
-            
-            # Popular destinations view
-            """
-            CREATE MATERIALIZED VIEW IF NOT EXISTS popular_destinations AS
-            SELECT 
-                destination,
-                COUNT(*) as experience_count,
-                AVG(min_price) as avg_min_price,
-                AVG(max_price) as avg_max_price,
-                SUM(total_bookings) as total_bookings
-            FROM experience_summary,
-            unnest(destinations) as destination
-            GROUP BY destination
-            ORDER BY experience_count DESC, total_bookings DESC
-            LIMIT 50
-            """
-        ]
-        
-        try:
-            with db.engine.connect() as conn:
-                for view_sql in materialized_views:
-                    conn.execute(text(view_sql))
-                    conn.commit()
-                
-                # Create indexes on materialized views
-                index_sqls = [
-                    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_experience_summary_status_date "
-                    "ON experience_summary (status, start_date, created_at DESC)",
-                    
-                    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_experience_summary_popularity "
-                    "ON experience_summary (popularity_score DESC, created_at DESC)",
-                    
-                    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_trending_score "
-                    "ON trending_experiences (trending_score DESC, created_at DESC)",
-                    
-                    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_popular_destinations_count "
-                    "ON popular_destinations (experience_count DESC, total_bookings DESC)"
-                ]
-                
-                for index_sql in index_sqls:
-                    conn.execute(text(index_sql))
-                    conn.commit()
-                
-                perf_logger.info("Materialized views and indexes created successfully")
-                
-        except Exception as e:
-            perf_logger.error(f"Materialized view creation failed: {str(e)}")
-    
-    @staticmethod
-    def refresh_materialized_views(db):
-        """Refresh materialized views (should be scheduled)"""
-        try:
-            with db.engine.connect() as conn:
-                views = ['experience_summary', 'trending_experiences', 'popular_destinations']
-                for view in views:
-                    conn.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}"))
-                    conn.commit()
-                    perf_logger.info(f"Refreshed materialized view: {view}")
-        except Exception as e:
-            perf_logger.error(f"Materialized view refresh failed: {str(e)}")
-    
-    @staticmethod
-    def setup_view_refresh_schedule(db):
-        """Setup automated materialized view refresh"""
-        try:
-            with db.engine.connect() as conn:
-                # Create a function to refresh all views
-                conn.execute(text("""
-                    CREATE OR REPLACE FUNCTION refresh_all_materialized_views()
-                    RETURNS void AS $
-                    BEGIN
-                        REFRESH MATERIALIZED VIEW CONCURRENTLY experience_summary;
-                        REFRESH MATERIALIZED VIEW CONCURRENTLY trending_experiences;
-                        REFRESH MATERIALIZED VIEW CONCURRENTLY popular_destinations;
-                    END;
-                    $ LANGUAGE plpgsql;
-                """))
-                
-                conn.commit()
-                perf_logger.info("Created materialized view refresh function")
-                
-        except Exception as e:
-            perf_logger.error(f"View refresh schedule setup failed: {str(e)}")
+        return {
+            "summaries": rebuild_all_summaries(db),
+            "suggestions": rebuild_suggestion_index(),
+            "facets": rebuild_facet_index(),
+        }
 
 # --- Connection Pooling Optimization ---
 def setup_database_pool(app: Flask):
@@ -899,337 +575,3 @@ def setup_database_pool(app: Flask):
     perf_logger.info("Database connection pool optimized")
     
     return engine_config
-
-# --- Memory Optimization ---
-class MemoryOptimizer:
-    """Memory usage optimization utilities"""
-    
-    @staticmethod
-    def optimize_sqlalchemy_sessions():
-        """Configure SQLAlchemy session for memory efficiency"""
-        from sqlalchemy.orm import sessionmaker
-        from sqlalchemy import event
-        
-        # Configure session to expire objects after commit
-        @event.listens_for(sessionmaker, 'after_commit')
-        def expire_all(session):
-            session.expire_all()
-    
-    @staticmethod
-    def setup_garbage_(interval=300):
-        """Setup periodic garbage collection"""
-        import gc
-        import threading
-        import time
-        
-        def run_gc():
-            while True:
-                time.sleep(interval)
-                gc.collect()
-                perf_logger.info("Garbage collection executed")
-        
-        gc_thread = threading.Thread(target=run_gc, daemon=True)
-        gc_thread.start()
-        perf_logger.info("Garbage collection thread started")
-
-# --- Cache Warming ---
-class CacheWarmer:
-    """Cache warming utilities for better performance"""
-    
-    def __init__(self, app: Flask, cache: Cache, db):
-        self.app = app
-        self.cache = cache
-        self.db = db
-    
-    def warm_popular_experiences(self):
-        """Pre-populate cache with popular experiences"""
-        with self.app.app_context():
-            from models import Experience, Slot
-            from sqlalchemy import func, desc
-            
-            try:
-                # Get most popular experiences
-                popular_experiences = (
-                    self.db.session.query(Experience)
-                    .join(Slot)
-                    .filter(Experience.status == 'published')
-                    .group_by(Experience.id)
-                    .order_by(desc(func.sum(Slot.booked)))
-                    .limit(50)
-                    .all()
-                )
-                
-                # Cache individual experience details
-                from experiences_public import CachedExperience
-                from dataclasses import asdict
-                
-                for exp in popular_experiences:
-                    cached_exp = CachedExperience.from_experience(exp)
-                    cache_key = f"exp:detail:{exp.id}"
-                    self.cache.set(cache_key, asdict(cached_exp), timeout=600)
-                
-                perf_logger.info(f"Warmed cache with {len(popular_experiences)} popular experiences")
-                
-            except Exception as e:
-                perf_logger.error(f"Cache warming failed: {str(e)}")
-    
-    def warm_trending_data(self):
-        """Pre-populate trending experiences cache"""
-        with self.app.app_context():
-            try:
-                from experiences_public import TrendingExperiences
-                trending_resource = TrendingExperiences()
-                trending_resource.get()  # This will populate the cache
-                perf_logger.info("Warmed trending experiences cache")
-            except Exception as e:
-                perf_logger.error(f"Trending cache warming failed: {str(e)}")
-    
-    def schedule_cache_warming(self):
-        """Schedule periodic cache warming"""
-        # This would integrate with Celery or APScheduler
-        pass
-
-# --- Performance Monitoring ---
-class PerformanceMonitor:
-    """Monitor API performance metrics"""
-    
-    def __init__(self, cache: Cache):
-        self.cache = cache
-    
-    def get_cache_stats(self):
-        """Get cache hit/miss statistics"""
-        try:
-            if hasattr(self.cache.cache, 'info'):
-                # Redis stats
-                info = self.cache.cache.info()
-                return {
-                    'cache_hits': info.get('keyspace_hits', 0),
-                    'cache_misses': info.get('keyspace_misses', 0),
-                    'hit_rate': info.get('keyspace_hits', 0) / max(
-                        info.get('keyspace_hits', 0) + info.get('keyspace_misses', 0), 1
-                    ) * 100,
-                    'memory_usage': info.get('used_memory_human', '0B'),
-                    'connected_clients': info.get('connected_clients', 0)
-                }
-        except Exception as e:
-            perf_logger.error(f"Cache stats retrieval failed: {str(e)}")
-        
-        return {}
-    
-    def log_query_performance(self, query_type: str, duration: float, cache_hit: bool = False):
-        """Log query performance metrics"""
-        perf_logger.info(
-            f"Query: {query_type} | Duration: {duration:.3f}s | Cached: {cache_hit}"
-        )
-    
-    def get_top_cached_keys(self):
-        """Get most frequently accessed cache keys"""
-        try:
-            if hasattr(self.cache.cache, 'scan_iter'):
-                keys = list(self.cache.cache.scan_iter(match="exp:*", count=100))
-                return keys[:20]  # Top 20
-        except Exception:
-            pass
-        return []
-
-# --- Configuration Setup ---
-def setup_performance_optimizations(app: Flask, db, cache: Cache):
-    """Setup all performance optimizations"""
-    
-    # Apply database optimizations
-    with app.app_context():
-        optimizer = DatabaseOptimizer()
-        optimizer.create_performance_indexes(db)
-        optimizer.analyze_tables(db)
-    
-    # Setup cache warming
-    warmer = CacheWarmer(app, cache, db)
-    
-    # Schedule initial cache warming
-    @app.before_first_request
-    def warm_caches():
-        try:
-            warmer.warm_trending_data()
-            warmer.warm_popular_experiences()
-        except Exception as e:
-            perf_logger.error(f"Initial cache warming failed: {str(e)}")
-    
-    # Setup monitoring
-    monitor = PerformanceMonitor(cache)
-    
-    # Add performance monitoring endpoint
-    @app.route('/api/performance/stats')
-    def performance_stats():
-        return {
-            'cache_stats': monitor.get_cache_stats(),
-            'top_cached_keys': monitor.get_top_cached_keys(),
-            'database_stats': optimizer.get_query_stats(db)
-        }
-    
-    return {
-        'optimizer': optimizer,
-        'warmer': warmer,
-        'monitor': monitor
-    }
-
-# --- Utility Functions ---
-def get_optimal_cache_config(environment='production'):
-    """Get optimal cache configuration for environment"""
-    configs = {
-        'production': CacheConfig.REDIS_CONFIG,
-        'staging': CacheConfig.REDIS_CONFIG,
-        'development': CacheConfig.SIMPLE_CONFIG,
-        'testing': CacheConfig.SIMPLE_CONFIG
-    }
-    return configs.get(environment, CacheConfig.SIMPLE_CONFIG)
-
-def setup_cache_backend(app: Flask, environment='production'):
-    """Setup optimized cache backend"""
-    cache_config = get_optimal_cache_config(environment)
-    
-    # Apply configuration
-    for key, value in cache_config.items():
-        app.config[key] = value
-    
-    # Initialize cache
-    cache = Cache(app)
-    
-    # Test cache connection
-    try:
-        cache.set('health_check', 'ok', timeout=10)
-        if cache.get('health_check') == 'ok':
-            perf_logger.info(f"Cache backend ({cache_config['CACHE_TYPE']}) initialized successfully")
-        else:
-            perf_logger.warning("Cache backend test failed")
-    except Exception as e:
-        perf_logger.error(f"Cache backend initialization failed: {str(e)}")
-    
-    return cache
-
-# --- Advanced Optimizations ---
-class QueryOptimizer:
-    """Advanced query optimization techniques"""
-    
-    @staticmethod
-    def optimize_experience_queries(db):
-        """Create materialized views for common queries"""
-        
-        materialized_views = [
-            # Experience summary view with pre-calculated slot data
-            """
-            CREATE MATERIALIZED VIEW IF NOT EXISTS experience_summary AS
-            SELECT 
-                e.id,
-                e.title,
-                e.description,
-                e.destinations,
-                e.activities,
-                e.poster_image_url,
-                e.start_date,
-                e.end_date,
-                e.status,
-                e.meeting_point,
-                e.provider_id,
-                e.created_at,
-                e.updated_at,
-                u.name as provider_name,
-                u.avatar_url as provider_avatar,
-                COALESCE(s.min_price, 0) as min_price,
-                COALESCE(s.max_price, 0) as max_price,
-                COALESCE(s.total_capacity, 0) as total_slots,
-                COALESCE(s.total_capacity - s.total_booked, 0) as available_slots,
-                COALESCE(s.total_booked, 0) as total_bookings
-            FROM experiences e
-            LEFT JOIN users u ON e.provider_id = u.id
-            LEFT JOIN (
-                SELECT 
-                    experience_id,
-                    MIN(price) as min_price,
-                    MAX(price) as max_price,
-                    SUM(capacity) as total_capacity,
-                    SUM(booked) as total_booked
-                FROM slots 
-                GROUP BY experience_id
-            ) s ON e.id = s.experience_id
-            WHERE e.status = 'published'
-            """,
-            
-            # Trending experiences view
-            """
-            CREATE MATERIALIZED VIEW IF NOT EXISTS trending_experiences AS
-            SELECT 
-                e.*,
-                COALESCE(recent_bookings.booking_score, 0) as popularity_score
-            FROM experience_summary e
-            LEFT JOIN (
-                SELECT 
-                    s.experience_id,
-                    SUM(s.booked) * (1.0 - EXTRACT(days FROM NOW() - e.created_at) / 30.0) as booking_score
-                FROM slots s
-                JOIN experiences e ON s.experience_id = e.id
-                WHERE e.created_at > NOW() - INTERVAL '30 days'
-                GROUP BY s.experience_id, e.created_at
-            ) recent_bookings ON e.id = recent_bookings.experience_id
-            ORDER BY popularity_score DESC, e.created_at DESC
-            """
-        ]
-        
-        try:
-            with db.engine.connect() as conn:
-                for view_sql in materialized_views:
-                    conn.execute(text(view_sql))
-                    conn.commit()
-                
-                # Create indexes on materialized views
-                index_sqls = [
-                    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_experience_summary_status_date "
-                    "ON experience_summary (status, start_date, created_at DESC)",
-                    
-                    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_trending_score "
-                    "ON trending_experiences (popularity_score DESC, created_at DESC)"
-                ]
-                
-                for index_sql in index_sqls:
-                    conn.execute(text(index_sql))
-                    conn.commit()
-                
-                perf_logger.info("Materialized views and indexes created successfully")
-                
-        except Exception as e:
-            perf_logger.error(f"Materialized view creation failed: {str(e)}")
-    
-    @staticmethod
-    def refresh_materialized_views(db):
-        """Refresh materialized views (should be scheduled)"""
-        try:
-            with db.engine.connect() as conn:
-                views = ['experience_summary', 'trending_experiences']
-                for view in views:
-                    conn.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}"))
-                    conn.commit()
-                    perf_logger.info(f"Refreshed materialized view: {view}")
-        except Exception as e:
-            perf_logger.error(f"Materialized view refresh failed: {str(e)}")
-
-# --- Connection Pooling Optimization ---
-def setup_database_pool(app: Flask):
-    """Optimize database connection pooling"""
-    
-    # SQLAlchemy engine optimization
-    engine_config = {
-        'pool_size': 20,           # Base connection pool size
-        'max_overflow': 30,        # Additional connections when pool exhausted
-        'pool_pre_ping': True,     # Validate connections before use
-        'pool_recycle': 3600,      # Recycle connections every hour
-        'echo': False,             # Disable SQL logging in production
-        'connect_args': {
-            # PostgreSQL specific optimizations
-            'options': '-c statement_timeout=30000'  # 30 second statement timeout
-        }
-    }
-    
-    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_config
-    
-    perf_logger.info("Database connection pool optimized")
-    
-    return engine_config
\ No newline at end of file
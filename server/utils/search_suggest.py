@@ -0,0 +1,152 @@
+# utils/search_suggest.py
+"""
+Typeahead prefix index in Redis.
+
+Suggestion terms (titles, destinations, activities, meeting-point names of
+published experiences) live as members of one sorted set with score 0, so a
+prefix lookup is a single ZRANGEBYLEX. Members are "<normalized>\\x1f<type>\\x1f<display>".
+A hash keeps how many experiences contribute each member (used for ranking
+and for removing terms nobody references any more), and a set per experience
+remembers what it contributed so reindexing one experience is a diff.
+Reindexing runs after commit via the `workers.reindex_catalogue` task.
+"""
+
+import logging
+import unicodedata
+
+from flask import current_app
+
+from models import Experience
+
+logger = logging.getLogger(__name__)
+
+LEX_KEY = "suggest:lex"
+REFS_KEY = "suggest:refs"
+EXPERIENCE_TERMS_PREFIX = "suggest:exp:"
+SEPARATOR = "\x1f"
+# Highest code point: every member starting with the prefix sorts below prefix + this
+LEX_MAX = "\U0010ffff"
+CANDIDATES = 50
+
+# Replace one experience's contribution atomically:
+# KEYS = exp terms set, lex zset, refs hash; ARGV = new members
+_REINDEX_LUA = """
+local new = {}
+for i = 1, #ARGV do new[ARGV[i]] = true end
+local old = {}
+for _, member in ipairs(redis.call('SMEMBERS', KEYS[1])) do
+    old[member] = true
+    if not new[member] then
+        if redis.call('HINCRBY', KEYS[3], member, -1) <= 0 then
+            redis.call('HDEL', KEYS[3], member)
+            redis.call('ZREM', KEYS[2], member)
+        end
+    end
+end
+for member, _ in pairs(new) do
+    if not old[member] then
+        redis.call('HINCRBY', KEYS[3], member, 1)
+        redis.call('ZADD', KEYS[2], 0, member)
+    end
+end
+redis.call('DEL', KEYS[1])
+if #ARGV > 0 then
+    redis.call('SADD', KEYS[1], unpack(ARGV))
+end
+return #ARGV
+"""
+
+
+def normalize_term(value):
+    """Lower-case, accent-stripped, whitespace-collapsed form used for prefix matching."""
+    value = unicodedata.normalize("NFKD", str(value or ""))
+    value = "".join(ch for ch in value if not unicodedata.combining(ch))
+    return " ".join(value.lower().replace(SEPARATOR, " ").split())
+
+
+def _member(term_type, display):
+    display = " ".join(str(display or "").split())
+    normalized = normalize_term(display)
+    if not normalized:
+        return None
+    return f"{normalized}{SEPARATOR}{term_type}{SEPARATOR}{display}"
+
+
+def _as_list(value):
+    if isinstance(value, list):
+        return value
+    return [value] if value else []
+
+
+def experience_members(experience):
+    """Index members contributed by one experience (none unless published)."""
+    if experience is None or experience.status != "published":
+        return []
+    members = [_member("title", experience.title)]
+    members += [_member("destination", item) for item in _as_list(experience.destinations) if isinstance(item, str)]
+    members += [_member("activity", item) for item in _as_list(experience.activities) if isinstance(item, str)]
+    meeting_point = experience.meeting_point if isinstance(experience.meeting_point, dict) else {}
+    members.append(_member("place", meeting_point.get("name")))
+    return sorted({member for member in members if member})
+
+
+def reindex_experiences(experience_ids):
+    """Bring the index in line with the current rows of the given experiences."""
+    client = current_app.redis
+    ids = list({str(experience_id) for experience_id in experience_ids if experience_id})
+    if not ids:
+        return 0
+    experiences = {
+        str(experience.id): experience
+        for experience in Experience.query.filter(Experience.id.in_(ids)).all()
+    }
+    script = client.register_script(_REINDEX_LUA)
+    for experience_id in ids:
+        members = experience_members(experiences.get(experience_id))  # deleted -> no members
+        script(keys=[f"{EXPERIENCE_TERMS_PREFIX}{experience_id}", LEX_KEY, REFS_KEY], args=members)
+    return len(ids)
+
+
+def rebuild_suggestion_index(batch_size=500):
+    """Reindex every experience in keyset batches (backfill / reconciliation)."""
+    reindexed = 0
+    after_id = None
+    while True:
+        query = Experience.query.with_entities(Experience.id).order_by(Experience.id)
+        if after_id is not None:
+            query = query.filter(Experience.id > after_id)
+        ids = [row.id for row in query.limit(batch_size).all()]
+        if not ids:
+            break
+        reindexed += reindex_experiences(ids)
+        after_id = ids[-1]
+    logger.info(f"Rebuilt suggestion index for {reindexed} experiences")
+    return reindexed
+
+
+def suggest(prefix, limit=8):
+    """Suggestions for a typed prefix, most referenced first. Redis only."""
+    prefix = normalize_term(prefix)
+    if not prefix:
+        return []
+    client = current_app.redis
+    candidates = client.zrangebylex(LEX_KEY, f"[{prefix}", f"[{prefix}{LEX_MAX}", start=0, num=CANDIDATES)
+    if not candidates:
+        return []
+    refs = client.hmget(REFS_KEY, candidates)
+
+    ranked = sorted(
+        zip(candidates, refs),
+        key=lambda item: (-int(item[1] or 0), len(item[0])),
+    )
+    suggestions = []
+    seen = set()
+    for member, count in ranked:
+        normalized, term_type, display = member.split(SEPARATOR, 2)
+        if (normalized, term_type) in seen:
+            continue
+        seen.add((normalized, term_type))
+        suggestions.append({"text": display, "type": term_type, "count": int(count or 0)})
+        if len(suggestions) >= limit:
+            break
+    return suggestions
@@ -0,0 +1,137 @@
+# utils/single_flight.py
+"""
+Single-flight cache fills with stale-while-revalidate.
+
+Values are stored in an envelope carrying a soft expiry. Until the soft
+expiry the value is served as is. After it, and until the hard (cache) TTL,
+one caller takes a short Redis lock and recomputes while everyone else keeps
+getting the stale value. On a hard miss only the lock holder recomputes;
+other callers wait briefly for its result instead of stampeding the database.
+"""
+
+import logging
+import time
+import uuid
+
+from flask import current_app
+
+from utils.cache_tags import cache_set_tagged
+
+logger = logging.getLogger(__name__)
+
+LOCK_PREFIX = "fill-lock:"
+LOCK_TIMEOUT = 10  # seconds; bounds how long a crashed filler blocks others
+WAIT_TIMEOUT = 2.0  # seconds a waiter polls for the lock holder's result
+POLL_INTERVAL = 0.05
+DEFAULT_STALE_TTL = 60  # seconds a stale value may be served while refreshing
+
+# Compare-and-delete so a filler never releases a lock it no longer owns
+_RELEASE_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def _redis():
+    return getattr(current_app, "redis", None)
+
+
+def _acquire(client, key):
+    if client is None:
+        return "local"
+    token = uuid.uuid4().hex
+    try:
+        if client.set(f"{LOCK_PREFIX}{key}", token, nx=True, ex=LOCK_TIMEOUT):
+            return token
+        return None
+    except Exception as e:
+        # Without Redis locks degrade to "everyone computes", as before
+        logger.warning(f"Fill lock unavailable for {key}: {e}")
+        return "local"
+
+
+def _release(client, key, token):
+    if client is None or token == "local":
+        return
+    try:
+        client.eval(_RELEASE_LUA, 1, f"{LOCK_PREFIX}{key}", token)
+    except Exception as e:
+        logger.warning(f"Fill lock release failed for {key}: {e}")
+
+
+def _lock_held(client, key):
+    try:
+        return bool(client.exists(f"{LOCK_PREFIX}{key}"))
+    except Exception:
+        return False
+
+
+def _unwrap(envelope):
+    if isinstance(envelope, dict) and "v" in envelope and "soft" in envelope:
+        return envelope["v"], envelope["soft"]
+    return None, None
+
+
+def _fill(cache, key, compute, ttl, stale_ttl):
+    value, tags = compute()
+    if value is not None:
+        envelope = {"v": value, "soft": time.time() + ttl}
+        cache_set_tagged(key, envelope, ttl + stale_ttl, tags, cache=cache)
+    return value
+
+
+def get_or_fill(cache, key, compute, ttl, stale_ttl=DEFAULT_STALE_TTL):
+    """
+    Return (value, from_cache). `compute()` returns (value, tags); a None
+    value (e.g. not found) is returned to the caller but never cached.
+    """
+    client = _redis()
+    value, soft_expiry = _unwrap(cache.get(key))
+
+    if soft_expiry is not None:
+        if soft_expiry > time.time():
+            return value, True
+        # Stale: one caller refreshes, the rest keep serving the old value
+        token = _acquire(client, key)
+        if token is None:
+            return value, True
+        try:
+            return _fill(cache, key, compute, ttl, stale_ttl), False
+        finally:
+            _release(client, key, token)
+
+    token = _acquire(client, key)
+    if token is not None:
+        try:
+            return _fill(cache, key, compute, ttl, stale_ttl), False
+        finally:
+            _release(client, key, token)
+
+    # Someone else is filling this key: wait for their result
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        value, soft_expiry = _unwrap(cache.get(key))
+        if soft_expiry is not None:
+            return value, True
+        if not _lock_held(client, key):
+            break  # filler finished without caching (e.g. not found) or died
+
+    return _fill(cache, key, compute, ttl, stale_ttl), False
+
+
+def refresh(cache, key, compute, ttl, stale_ttl=DEFAULT_STALE_TTL):
+    """
+    Recompute `key` ahead of expiry (cache warming). Skipped when another
+    caller is already filling it; returns whether this call filled it.
+    """
+    client = _redis()
+    token = _acquire(client, key)
+    if token is None:
+        return False
+    try:
+        return _fill(cache, key, compute, ttl, stale_ttl) is not None
+    finally:
+        _release(client, key, token)
@@ -0,0 +1,60 @@
+# utils/trending.py
+"""
+Streaming trending scores in Redis.
+
+Each confirmed booking adds `quantity` to its experience's score in one
+sorted set, weighted by forward decay: a booking at time t counts
+2^((t - epoch) / half_life). Older bookings therefore weigh exponentially
+less than new ones without ever rewriting existing scores, so a booking is
+one ZINCRBY and the top N is one ZREVRANGE. When the weights get large the
+set is rescaled in place and the epoch moved forward; ranks are unchanged
+by the rescale.
+"""
+
+import logging
+import time
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+SCORES_KEY = "trending:scores"
+EPOCH_KEY = "trending:epoch"
+HALF_LIFE = 3 * 24 * 3600  # a booking counts half as much after three days
+MAX_MEMBERS = 10000
+
+# KEYS = scores zset, epoch key; ARGV = experience id, quantity, now, half life, max members
+_RECORD_LUA = """
+local now = tonumber(ARGV[3])
+local half_life = tonumber(ARGV[4])
+local epoch = tonumber(redis.call('GET', KEYS[2]))
+if not epoch then
+    epoch = now
+    redis.call('SET', KEYS[2], epoch)
+end
+if (now - epoch) / half_life > 32 then
+    -- Rescale before the weights grow past float precision, drop the long tail
+    redis.call('ZUNIONSTORE', KEYS[1], 1, KEYS[1], 'WEIGHTS', 2 ^ (-(now - epoch) / half_life))
+    redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -(tonumber(ARGV[5]) + 1))
+    epoch = now
+    redis.call('SET', KEYS[2], epoch)
+end
+return redis.call('ZINCRBY', KEYS[1], tonumber(ARGV[2]) * 2 ^ ((now - epoch) / half_life), ARGV[1])
+"""
+
+
+def record_booking(experience_id, quantity=1, now=None):
+    """Count a confirmed booking towards the experience's trending score."""
+    client = current_app.redis
+    script = client.register_script(_RECORD_LUA)
+    return script(
+        keys=[SCORES_KEY, EPOCH_KEY],
+        args=[str(experience_id), max(int(quantity), 1), int(now or time.time()), HALF_LIFE, MAX_MEMBERS],
+    )
+
+
+def top_experience_ids(limit=20):
+    """Experience ids with the highest decayed booking velocity, best first."""
+    client = current_app.redis
+    return client.zrevrange(SCORES_KEY, 0, limit - 1)
+
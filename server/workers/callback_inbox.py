@@ -0,0 +1,405 @@
+# workers/callback_inbox.py
+"""
+Inbox for payment gateway callbacks.
+
+Safaricom and Paytrack retry a callback until it is acknowledged, and used
+to get one only after the webhook had looked up, mutated and committed the
+payment, so a slow database turned into a retry storm and a retried
+callback could book a reservation or settle a payout twice. The webhooks
+now only insert the raw callback into `callback_inbox` with
+ON CONFLICT DO NOTHING on (source, idempotency key): the CheckoutRequestID
+of an STK callback, the ConversationID of a B2C/B2B result, the
+request_id of a Paytrack event, or a hash of the body when the gateway
+sent none. They then acknowledge, whether or not the row was a duplicate.
+
+`workers.process_callback_inbox` applies pending entries in batches.
+Entries are claimed with FOR UPDATE SKIP LOCKED, and each entry's changes
+commit in the same transaction that marks it processed, so every stored
+callback takes effect exactly once. The collection/disbursement row is
+locked too, and a settled payment is left alone, so two different
+callbacks for one payment still settle it once. A failing entry is
+retried by later runs up to MAX_ATTEMPTS times. Inserting a new entry
+queues a run, debounced through Redis, and beat sweeps the inbox as a
+fallback.
+
+Follow-up tasks (logg_wallet, wallet_settlement, refund_settlement, payout
+emails) are an outbox: they are stored on the entry (`tasks`) in that same
+transaction, with the entry left `dispatching`, and sent after the commit;
+the entry is marked processed once they are queued. Entries still
+dispatching after REDRIVE_AFTER (a crash or broker outage after the
+commit) have their tasks sent again by a later run, so the tasks must
+tolerate a repeat; the wallet tasks skip a transaction they already
+logged. User events are only published after the commit, best effort.
+"""
+
+import hashlib
+import json
+import logging
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+from functools import partial
+
+import pytz
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+
+from celery_app import celery
+from models import db, ApiCollection, ApiDisbursement, CallbackInbox, CollectionStatus
+from utils.inventory import confirm_hold, release_hold
+from utils.payment_state import transition, publish_status
+from utils.subscribe_manager import push_to_queue
+from utils.tarrifs import get_b2c_business_charge
+from workers.email_worker import send_payout_confirmation
+from workers.scheduled import timed_job
+from workers.wallet_logger import logg_wallet, wallet_settlement, refund_settlement
+
+logger = logging.getLogger(__name__)
+
+# Sources
+MPESA_STK = "mpesa_stk"
+MPESA_B2C = "mpesa_b2c"
+MPESA_B2B = "mpesa_b2b"
+PAYTRACK = "paytrack"
+
+# Entry status
+PENDING = "pending"
+DISPATCHING = "dispatching"
+PROCESSED = "processed"
+FAILED = "failed"
+
+MAX_ATTEMPTS = 5
+BATCH_SIZE = 100
+SCHEDULED_KEY = "callbacks:inbox:scheduled"
+SCHEDULE_DEBOUNCE = 5  # seconds
+# An entry still dispatching after this was not sent by the run that applied it
+REDRIVE_AFTER = timedelta(minutes=1)
+
+DISBURSEMENT_SETTLED = ("completed", "failed")
+
+
+class UnknownTarget(Exception):
+    """The callback refers to a collection or disbursement that doesn't exist."""
+
+
+def idempotency_key(source, payload):
+    """The gateway's own id for the transaction, else a hash of the body."""
+    if source == MPESA_STK:
+        key = payload.get("Body", {}).get("stkCallback", {}).get("CheckoutRequestID")
+    elif source in (MPESA_B2C, MPESA_B2B):
+        result = payload.get("Result", {})
+        key = result.get("ConversationID") or result.get("OriginatorConversationID")
+    else:
+        key = payload.get("request_id") and f"{payload.get('event_type')}:{payload.get('request_id')}"
+    if not key:
+        body = json.dumps(payload, sort_keys=True, default=str)
+        key = "sha256:" + hashlib.sha256(body.encode("utf-8")).hexdigest()
+    return str(key)
+
+
+def _as_uuid(value):
+    try:
+        return uuid.UUID(str(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def record_callback(source, payload, target_id=None, key=None):
+    """
+    Store a callback unless its key was seen before, and queue processing.
+    Returns True for a new entry. Raises if it could not be stored, so the
+    webhook can ask the gateway to retry.
+    """
+    entry_id = db.session.execute(
+        insert(CallbackInbox)
+        .values(source=source, idempotency_key=key or idempotency_key(source, payload),
+                target_id=_as_uuid(target_id), payload=payload)
+        .on_conflict_do_nothing(constraint="uq_callback_inbox_source_key")
+        .returning(CallbackInbox.id)
+    ).scalar_one_or_none()
+    db.session.commit()
+    if entry_id is None:
+        logger.info(f"Duplicate {source} callback ignored")
+        return False
+    schedule_processing()
+    return True
+
+
+def schedule_processing():
+    """Queue one inbox run per debounce window; the beat sweep covers failures here."""
+    try:
+        if current_app.redis.set(SCHEDULED_KEY, 1, nx=True, ex=SCHEDULE_DEBOUNCE):
+            process_callback_inbox.delay()
+    except Exception as e:
+        logger.warning(f"Could not queue callback processing: {e}")
+
+
+def _follow_up(tasks, task, **kwargs):
+    """Add `task` to the entry's outbox, with its arguments as JSON."""
+    tasks.append({"task": task.name, "kwargs": json.loads(json.dumps(kwargs, default=str))})
+
+
+def _send_tasks(tasks):
+    follow_ups = {task.name: task for task in (logg_wallet, wallet_settlement, refund_settlement,
+                                               send_payout_confirmation)}
+    for task in tasks:
+        follow_ups[task["task"]].delay(**task["kwargs"])
+
+
+def _locked(session, model, target_id):
+    target = session.get(model, target_id, with_for_update=True) if target_id else None
+    if target is None:
+        raise UnknownTarget(f"{model.__name__} {target_id} not found")
+    return target
+
+
+def _complete_collection(session, api_collection, effects, tasks, amount, transaction_ref, checkout_request_id,
+                         mpesa_number=None):
+    if not transaction_ref:
+        # Nothing to book the reservation against (an STK query reports no receipt);
+        # the gateway's own callback or manual settlement completes it
+        logger.error(f"Collection {api_collection.id} reported paid without a receipt; not completed")
+        if api_collection.status != CollectionStatus.COMPLETED:
+            api_collection.description = "Reported paid without a receipt; awaiting confirmation"
+        return
+    if not transition(api_collection, CollectionStatus.COMPLETED):
+        return  # already settled
+    api_collection.mpesa_checkout_request_id = checkout_request_id or api_collection.mpesa_checkout_request_id
+    api_collection.transaction_reference = transaction_ref
+    inventory_held = confirm_hold(session, api_collection)
+    effects.append(partial(publish_status, api_collection, transaction_id=transaction_ref))
+    _follow_up(
+        tasks, logg_wallet,
+        slot_id=api_collection.slot_id,
+        user_id=api_collection.user_id,
+        quantity=api_collection.quantity,
+        amount_paid=float(amount),
+        status="completed",
+        mpesa_number=mpesa_number or api_collection.mpesa_number,
+        transaction_ref=transaction_ref,
+        reservation_id=api_collection.reservation_id,
+        inventory_held=inventory_held
+    )
+
+
+def _fail_collection(session, api_collection, effects, reason):
+    if not transition(api_collection, CollectionStatus.FAILED):
+        return  # already settled
+    api_collection.description = reason
+    release_hold(session, api_collection)
+    effects.append(partial(publish_status, api_collection, error="Transaction declined"))
+
+
+def _complete_disbursement(api_disbursement, effects, tasks, transaction_ref, checkout_id, **settlement):
+    if api_disbursement.status in DISBURSEMENT_SETTLED:
+        return
+    api_disbursement.status = "completed"
+    api_disbursement.transaction_reference = transaction_ref
+    service_fee = get_b2c_business_charge(float(api_disbursement.amount))
+    user_id = api_disbursement.user_id
+    amount = api_disbursement.amount
+
+    if api_disbursement.disbursement_type == "refund":
+        _follow_up(
+            tasks, refund_settlement,
+            user_id=user_id,
+            amount=float(amount),
+            refund_id=api_disbursement.refund_id,
+            transaction_ref=transaction_ref,
+            service_fee=service_fee
+        )
+        return
+
+    timestamp = datetime.now(pytz.timezone("Africa/Nairobi")).isoformat()
+    effects.append(partial(push_to_queue, user_id, {"state": "success", "transaction_id": transaction_ref}))
+    _follow_up(
+        tasks, send_payout_confirmation,
+        user_id=user_id,
+        amount=amount,
+        transaction_id=transaction_ref,
+        timestamp=timestamp
+    )
+    _follow_up(
+        tasks, wallet_settlement,
+        user_id=user_id,
+        amount=float(amount),
+        checkout_id=checkout_id,
+        transaction_ref=transaction_ref,
+        service_fee=service_fee,
+        **settlement
+    )
+
+
+def _fail_disbursement(api_disbursement, effects, reason):
+    if api_disbursement.status in DISBURSEMENT_SETTLED:
+        return
+    api_disbursement.status = "failed"
+    api_disbursement.description = reason
+    effects.append(partial(push_to_queue, api_disbursement.user_id, {"state": "failed", "description": reason}))
+
+
+def _apply_stk(session, entry, effects, tasks):
+    stk = entry.payload.get("Body", {}).get("stkCallback", {})
+    api_collection = _locked(session, ApiCollection, entry.target_id)
+    if stk.get("ResultCode") == 0:
+        metadata = {item["Name"]: item.get("Value") for item in stk.get("CallbackMetadata", {}).get("Item", [])}
+        # Outcomes found by reconciliation (STK query) carry no metadata, so no receipt
+        amount = metadata.get("Amount", api_collection.amount)
+        _complete_collection(session, api_collection, effects, tasks,
+                             amount=Decimal(str(amount)),
+                             transaction_ref=metadata.get("MpesaReceiptNumber"),
+                             checkout_request_id=stk.get("CheckoutRequestID"))
+    else:
+        _fail_collection(session, api_collection, effects, stk.get("ResultDesc"))
+
+
+def _apply_mpesa_disbursement(session, entry, effects, tasks):
+    result = entry.payload.get("Result", {})
+    api_disbursement = _locked(session, ApiDisbursement, entry.target_id)
+    if result.get("ResultCode") == 0:
+        _complete_disbursement(api_disbursement, effects, tasks,
+                               transaction_ref=result.get("TransactionID"),
+                               checkout_id=result.get("ConversationID"))
+    else:
+        _fail_disbursement(api_disbursement, effects, result.get("ResultDesc"))
+
+
+def _apply_paytrack(session, entry, effects, tasks):
+    data = entry.payload
+    succeeded = data.get("status") == "success"
+    if data.get("event_type") == "COLLECTION":
+        api_collection = _locked(session, ApiCollection, entry.target_id)
+        if succeeded:
+            _complete_collection(session, api_collection, effects, tasks,
+                                 amount=Decimal(str(data.get("amount"))),
+                                 transaction_ref=data.get("transaction_ref"),
+                                 checkout_request_id=data.get("request_id"),
+                                 mpesa_number=data.get("mpesa_number"))
+        elif data.get("status") == "failed":
+            _fail_collection(session, api_collection, effects, data.get("remarks"))
+    elif data.get("event_type") == "DISBURSEMENT":
+        api_disbursement = _locked(session, ApiDisbursement, entry.target_id)
+        if succeeded:
+            _complete_disbursement(api_disbursement, effects, tasks,
+                                   transaction_ref=data.get("transaction_ref"),
+                                   checkout_id=data.get("request_id"),
+                                   b2c_account=data.get("b2c_account"),
+                                   mpesa_account_number=data.get("mpesa_account_number"))
+        else:
+            _fail_disbursement(api_disbursement, effects, data.get("remarks"))
+    else:
+        logger.warning(f"Ignoring Paytrack event {data.get('event_type')}")
+
+
+HANDLERS = {
+    MPESA_STK: _apply_stk,
+    MPESA_B2C: _apply_mpesa_disbursement,
+    MPESA_B2B: _apply_mpesa_disbursement,
+    PAYTRACK: _apply_paytrack,
+}
+
+
+def _dispatch(session, outbox):
+    """
+    Send the tasks of committed (entry id, tasks) pairs and mark the sent
+    entries processed. Entries whose tasks could not be queued stay
+    dispatching for a later run. Returns how many were sent.
+    """
+    sent = []
+    for entry_id, tasks in outbox:
+        try:
+            _send_tasks(tasks)
+        except Exception as e:
+            logger.error(f"Follow-up tasks of callback {entry_id} not queued: {e}")
+            continue
+        sent.append(entry_id)
+    if sent:
+        (session.query(CallbackInbox)
+         .filter(CallbackInbox.id.in_(sent), CallbackInbox.status == DISPATCHING)
+         .update({CallbackInbox.status: PROCESSED}, synchronize_session=False))
+    session.commit()
+    return len(sent)
+
+
+def redrive_dispatching(session, batch_size=BATCH_SIZE):
+    """Send again the tasks of entries left dispatching for longer than REDRIVE_AFTER."""
+    outbox = (session.query(CallbackInbox.id, CallbackInbox.tasks)
+              .filter(CallbackInbox.status == DISPATCHING,
+                      CallbackInbox.processed_at < func.now() - REDRIVE_AFTER)
+              .order_by(CallbackInbox.processed_at)
+              .limit(batch_size)
+              .with_for_update(skip_locked=True)
+              .all())
+    if not outbox:
+        session.commit()
+        return 0
+    logger.warning(f"Re-sending follow-up tasks of {len(outbox)} callbacks")
+    return _dispatch(session, outbox)
+
+
+def process_inbox(session, batch_size=BATCH_SIZE):
+    """Apply pending entries batch by batch. Returns counts per outcome."""
+    counts = {PROCESSED: 0, FAILED: 0, "retrying": 0, "redriven": redrive_dispatching(session, batch_size)}
+    while True:
+        entries = (session.query(CallbackInbox)
+                   .filter(CallbackInbox.status == PENDING)
+                   .order_by(CallbackInbox.received_at)
+                   .limit(batch_size)
+                   .with_for_update(skip_locked=True)
+                   .all())
+        if not entries:
+            break
+
+        effects, outbox, retrying = [], [], False
+        for entry in entries:
+            entry_effects, entry_tasks = [], []
+            entry.attempts += 1
+            try:
+                with session.begin_nested():
+                    HANDLERS[entry.source](session, entry, entry_effects, entry_tasks)
+            except Exception as e:
+                logger.exception(f"Callback {entry.id} ({entry.source}) failed: {e}")
+                entry.error = str(e)
+                if isinstance(e, UnknownTarget) or entry.attempts >= MAX_ATTEMPTS:
+                    entry.status = FAILED
+                    counts[FAILED] += 1
+                else:
+                    retrying = True
+                    counts["retrying"] += 1
+                continue
+            entry.processed_at = func.now()
+            if entry_tasks:
+                entry.tasks = entry_tasks
+                entry.status = DISPATCHING
+                outbox.append((entry.id, entry_tasks))
+            else:
+                entry.status = PROCESSED
+            effects.extend(entry_effects)
+            counts[PROCESSED] += 1
+        session.commit()
+
+        for effect in effects:
+            try:
+                effect()
+            except Exception as e:
+                logger.error(f"Callback follow-up failed: {e}")
+        _dispatch(session, outbox)
+        # Entries left pending are retried by the next run, not this one
+        if retrying or len(entries) < batch_size:
+            break
+    return counts
+
+
+@celery.task(name="workers.process_callback_inbox")
+def process_callback_inbox():
+    """Apply stored gateway callbacks exactly once."""
+    with current_app.app_context():
+        try:
+            # Entries stored from now on queue a new run
+            current_app.redis.delete(SCHEDULED_KEY)
+        except Exception:
+            pass
+        with timed_job("process_callback_inbox") as job:
+            job["result"] = process_inbox(db.session)
+    return job["result"]
@@ -0,0 +1,34 @@
+import logging
+from celery_app import celery
+from flask import current_app
+from utils.search_suggest import reindex_experiences, rebuild_suggestion_index
+from utils.facet_index import reindex_facets, rebuild_facet_index
+
+logger = logging.getLogger(__name__)
+
+
+@celery.task(bind=True, name="workers.reindex_catalogue", max_retries=3, default_retry_delay=10)
+def reindex_catalogue(self, experience_ids):
+    """Refresh the typeahead and facet indexes for experiences changed by a committed transaction."""
+    try:
+        with current_app.app_context():
+            count = reindex_experiences(experience_ids)
+            reindex_facets(experience_ids)
+            logger.info(f"Reindexed catalogue search indexes for {count} experiences")
+    except Exception as e:
+        logger.exception(f"Catalogue reindex failed for {experience_ids}")
+        raise self.retry(exc=e)
+
+
+@celery.task(name="workers.rebuild_suggestions")
+def rebuild_suggestions():
+    """Full rebuild of the typeahead prefix index (backfill / reconciliation)."""
+    with current_app.app_context():
+        return rebuild_suggestion_index()
+
+
+@celery.task(name="workers.rebuild_facets")
+def rebuild_facets():
+    """Full rebuild of the facet inverted index (backfill / reconciliation)."""
+    with current_app.app_context():
+        return rebuild_facet_index()
@@ -2,13 +2,18 @@
 
 import logging
 from dotenv import load_dotenv
-from models import ApiCollection, db, ApiDisbursement, PaymentMethod, User
-import requests
+from models import ApiCollection, db, ApiDisbursement, PaymentMethod, User, CollectionStatus, PaymentGateway
 import base64
 import re
 from datetime import datetime
 from flask import current_app
 from utils.subscribe_manager import push_to_queue
+from utils.payment_state import transition, publish_status
+from utils.inventory import release_hold
+from services.mpesa_token import token_manager
+from services.payment_gateway import (
+    mpesa as mpesa_gateway, paytrack as paytrack_gateway, GatewayError, GatewayUnavailable, BREAKER_COOLDOWN,
+)
 import os
 import decimal
 
@@ -16,23 +21,76 @@ from celery_app import celery
 
 # M-Pesa API credentials (loaded from .env file)
 MPESA_SHORTCODE = os.getenv("MPESA_SHORTCODE")
-B2C_URL = "https://api.safaricom.co.ke/mpesa/b2c/v3/paymentrequest"
-B2B_URL = "https://api.safaricom.co.ke/mpesa/b2b/v1/paymentrequest"
 MPESA_PASSKEY = os.getenv("MPESA_PASSKEY")
-MPESA_CONSUMER_KEY = os.getenv("MPESA_CONSUMER_KEY")
-MPESA_CONSUMER_SECRET = os.getenv("MPESA_CONSUMER_SECRET")
 INITIATOR_NAME = os.getenv("INITIATOR_NAME")
 SECURITY_CREDENTIAL = os.getenv("SECURITY_CREDENTIAL")
 API_BASE_URL = os.getenv("API_BASE_URL", "https://rhtr3fc9-5000.uks1.devtunnels.ms")
 
-# URLs
-MPESA_URL = "https://api.safaricom.co.ke/mpesa/stkpush/v1/processrequest"
-MPESA_AUTH_URL = "https://api.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials"
+# Gateway paths (base URLs live in services.payment_gateway)
+STK_PUSH_PATH = "/mpesa/stkpush/v1/processrequest"
+B2C_PATH = "/mpesa/b2c/v3/paymentrequest"
+B2B_PATH = "/mpesa/b2b/v1/paymentrequest"
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
 
+def format_phone_number(number):
+    digits = re.sub(r'\D', '', number)
+    if re.match(r'^254\d{9}$', digits):
+        return digits
+    if re.match(r'^0[17]\d{8}$', digits):
+        return '254' + digits[1:]
+    logger.warning(f"Invalid phone number format: {number}")
+    return None
+
+
+def stk_password():
+    """(Password, Timestamp) pair for STK push and STK query requests."""
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    combined_string = f"{MPESA_SHORTCODE}{MPESA_PASSKEY}{timestamp}"
+    return base64.b64encode(combined_string.encode()).decode(), timestamp
+
+
+def stk_push_payload(api_collection, formatted_number):
+    """Request body for an STK push of the collection's amount to `formatted_number`."""
+    call_back_url = (f"{API_BASE_URL}/payment/mpesa/call_back/"
+                     f"{api_collection.experience_id}/{api_collection.slot_id}/{api_collection.id}")
+    password, timestamp = stk_password()
+
+    return {
+        "BusinessShortCode": MPESA_SHORTCODE,
+        "Password": password,
+        "Timestamp": timestamp,
+        "TransactionType": "CustomerPayBillOnline",
+        "Amount": str(int(api_collection.amount)),
+        "PartyA": formatted_number,
+        "PartyB": MPESA_SHORTCODE,
+        "PhoneNumber": formatted_number,
+        "CallBackURL": call_back_url,
+        "AccountReference": "RYFTY.NET",
+        "TransactionDesc": "Wallet Funding"
+    }
+
+
+def paytrack_collection_payload(api_collection, formatted_number):
+    return {
+        "amount": str(api_collection.amount),
+        "request_ref": str(api_collection.id),
+        "currency": "KES",
+        "mpesa_number": formatted_number
+    }
+
+
+def fail_collection(api_collection, reason):
+    """The payment could not be started: fail the request and give back its held places."""
+    if transition(api_collection, CollectionStatus.FAILED):
+        api_collection.description = reason
+        release_hold(db.session, api_collection)
+        db.session.commit()
+        publish_status(api_collection, error=reason)
+
+
 @celery.task(bind=True, name="workers.initiate_stk", max_retries=3, default_retry_delay=30)
 def initiate_payment(self, api_collection_id):
     logger.info(f"Initiating payment for request {api_collection_id}")
@@ -42,81 +100,81 @@ def initiate_payment(self, api_collection_id):
         if not api_collection:
             logger.error(f"ApiCollection with ID {api_collection_id} not found.")
             return
+        if api_collection.status != CollectionStatus.PENDING:
+            # Settled, failed or expired while this task waited (e.g. between retries)
+            logger.info(f"Not initiating {api_collection.status} collection {api_collection_id}")
+            return
 
         phone_number = api_collection.mpesa_number
         amount = api_collection.amount
-        experience_id = api_collection.experience_id
-        call_back_url = f"{API_BASE_URL}/payment/mpesa/call_back/{experience_id}/{api_collection.slot_id}/{api_collection_id}"
 
         if not phone_number or not amount:
             logger.error(f"Missing phone number or amount for ApiCollection {api_collection_id}.")
             return
 
-        def format_phone_number(number):
-            digits = re.sub(r'\D', '', number)
-            if re.match(r'^254\d{9}$', digits):
-                return digits
-            if re.match(r'^0[17]\d{8}$', digits):
-                return '254' + digits[1:]
-            logger.warning(f"Invalid phone number format: {number}")
-            return None
-
         formatted_number = format_phone_number(phone_number)
         if not formatted_number:
             logger.error(f"Failed to format phone number: {phone_number}")
+            fail_collection(api_collection, "Invalid M-Pesa number")
             return
 
         auth_token = get_mpesa_auth_token()
         if not auth_token:
-            logger.error("Failed to get M-Pesa authorization token.")
-            return
+            # Open circuit or OAuth outage: nothing was sent, so retry until retries run out
+            if self.request.retries >= self.max_retries:
+                logger.error(f"No M-Pesa authorization token for {api_collection_id}; giving up.")
+                fail_collection(api_collection, "Payment service unavailable")
+                return
+            logger.warning(f"Failed to get M-Pesa authorization token; retrying {api_collection_id}.")
+            raise self.retry(countdown=BREAKER_COOLDOWN)
 
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        combined_string = f"{MPESA_SHORTCODE}{MPESA_PASSKEY}{timestamp}"
-        password = base64.b64encode(combined_string.encode()).decode()
-
-        payload = {
-            "BusinessShortCode": MPESA_SHORTCODE,
-            "Password": password,
-            "Timestamp": timestamp,
-            "TransactionType": "CustomerPayBillOnline",
-            "Amount": str(int(amount)),
-            "PartyA": formatted_number,
-            "PartyB": MPESA_SHORTCODE,
-            "PhoneNumber": formatted_number,
-            "CallBackURL": call_back_url,
-            "AccountReference": "RYFTY.NET",
-            "TransactionDesc": "Wallet Funding"
-        }
+        payload = stk_push_payload(api_collection, formatted_number)
 
+        token_rejected = False
+        gateway_down = None
         try:
-            response = requests.post(MPESA_URL, headers={"Authorization": f"Bearer {auth_token}", "Content-Type": "application/json"}, json=payload)
+            response = mpesa_gateway.post(STK_PUSH_PATH, headers={"Authorization": f"Bearer {auth_token}", "Content-Type": "application/json"}, json=payload)
             response_data = response.json()
             if response.status_code == 200:
                 api_collection.mpesa_checkout_request_id = response_data.get("CheckoutRequestID")
-                api_collection.status = "initiated"
-                push_to_queue(api_collection.user_id, {"state": "pending_confirmation"})
-                db.session.commit()
+                api_collection.gateway = PaymentGateway.MPESA
+                if transition(api_collection, CollectionStatus.INITIATED):
+                    db.session.commit()
+                    publish_status(api_collection)
+                else:
+                    db.session.commit()  # the callback already settled it; keep the checkout id
                 logger.info(f"Payment request {api_collection_id} successfully initiated: {response_data}")
+            elif response.status_code == 401:
+                # Token revoked before its expiry: drop it and retry with a fresh one
+                token_manager.invalidate()
+                token_rejected = True
             else:
                 logger.error(f"Failed to initiate payment for {api_collection_id}: {response_data}")
+                fail_collection(api_collection, "Payment request was declined")
+        except GatewayUnavailable as e:
+            gateway_down = e
+        except GatewayError as e:
+            # The prompt may have gone out; resending could prompt twice, so leave it to the callback
+            db.session.rollback()
+            logger.error(f"Payment request {api_collection_id} outcome unknown: {e}")
         except Exception as e:
             db.session.rollback()
             logger.exception(f"Error initiating payment for {api_collection_id}: {e}")
 
+        if token_rejected:
+            raise self.retry(countdown=1)
+        if gateway_down:
+            # Nothing was sent; try again once the circuit closes
+            if self.request.retries >= self.max_retries:
+                logger.error(f"M-Pesa unavailable for {api_collection_id}; giving up: {gateway_down}")
+                fail_collection(api_collection, "Payment service unavailable")
+                return
+            raise self.retry(exc=gateway_down, countdown=BREAKER_COOLDOWN)
+
 
 def get_mpesa_auth_token():
-    auth = base64.b64encode(f"{MPESA_CONSUMER_KEY}:{MPESA_CONSUMER_SECRET}".encode("utf-8")).decode("utf-8")
-    headers = {"Authorization": f"Basic {auth}"}
-    try:
-        response = requests.get(MPESA_AUTH_URL, headers=headers)
-        if response.status_code == 200:
-            return response.json().get("access_token")
-        logger.error(f"Failed to get auth token, status code: {response.status_code}, response: {response.text}")
-        return None
-    except Exception as e:
-        logger.exception(f"Exception while fetching auth token: {e}")
-        return None
+    """Shared, Redis-cached OAuth token (services.mpesa_token)."""
+    return token_manager.get_token()
 
 
 
@@ -167,9 +225,9 @@ def initiate_disbursement(self, api_disbursement_id):
 
         # Determine API URL based on command type
         if command_type == "BusinessPayBill":
-            api_url = B2B_URL
+            api_path = B2B_PATH
         elif command_type == "BusinessPayment":
-            api_url = B2C_URL
+            api_path = B2C_PATH
         else:
             logger.error(f"Invalid command type for ApiDisbursement {api_disbursement_id}.")
             return
@@ -184,20 +242,12 @@ def initiate_disbursement(self, api_disbursement_id):
                 logger.error(f"Missing paybill number, account number, or amount for B2B ApiDisbursement {api_disbursement_id}.")
                 return
 
-        def format_phone_number(number):
-            digits = re.sub(r'\D', '', number)
-            if re.match(r'^254\d{9}$', digits):
-                return digits
-            if re.match(r'^0[17]\d{8}$', digits):
-                return '254' + digits[1:]
-            logger.warning(f"Invalid phone number format: {number}")
-            return None
-
         # Get auth token
         auth_token = get_mpesa_auth_token()
         if not auth_token:
+            # Nothing was sent yet, so a retry can't pay twice
             logger.error("Failed to get M-Pesa authorization token.")
-            return
+            raise self.retry(countdown=BREAKER_COOLDOWN)
 
         headers = {
             "Authorization": f"Bearer {auth_token}",
@@ -246,12 +296,24 @@ def initiate_disbursement(self, api_disbursement_id):
             }
     
         # Make the API request
-        response = requests.post(api_url, headers=headers, json=payload)
+        try:
+            response = mpesa_gateway.post(api_path, headers=headers, json=payload)
+        except GatewayUnavailable as e:
+            raise self.retry(exc=e, countdown=BREAKER_COOLDOWN)
+        except GatewayError as e:
+            # Resending a payout that may have gone through could pay twice
+            logger.error(f"Disbursement {api_disbursement_id} outcome unknown: {e}")
+            return
+        if response.status_code == 401:
+            # Token revoked before its expiry: drop it and retry with a fresh one
+            token_manager.invalidate()
+            raise self.retry(countdown=1)
         try:
             response_data = response.json()
             if response.status_code == 200:
                 # Fix: Update the actual object, not the ID
                 api_disbursement.status = "initiated"
+                api_disbursement.gateway = PaymentGateway.MPESA
                 
                 push_to_queue(api_disbursement.user_id, {"state": "pending_confirmation"})
                 db.session.commit()
@@ -336,7 +398,6 @@ def pay_track_disbursment_initiate(self, api_disbursement_id):
                 return
             
             
-            api_url = os.getenv("PAYTRACK_API_BASE", "https://pay.geninworld.com")
             api_key = os.getenv("PAYTRACK_API_KEY")
 
             headers = {
@@ -344,12 +405,13 @@ def pay_track_disbursment_initiate(self, api_disbursement_id):
                 "Content-Type": "application/json"
             }
         
-            response = requests.post(f"{api_url}/api/disburse_request", headers=headers, json=payload)
+            response = paytrack_gateway.post("/api/disburse_request", headers=headers, json=payload)
             try:
                 response_data = response.json()
                 if response.status_code == 202:
                     # Fix: Update the actual object, not the ID
                     api_disbursement.status = "initiated"
+                    api_disbursement.gateway = PaymentGateway.PAYTRACK
                     
                     push_to_queue(api_disbursement.user_id, {"state": "pending_confirmation"})
                     db.session.commit()
@@ -361,6 +423,11 @@ def pay_track_disbursment_initiate(self, api_disbursement_id):
                 return {"error": "Invalid JSON response", "raw": response.text}
             # (rest of the function remains unchanged)
             # ...
+        except GatewayUnavailable as e:
+            raise self.retry(exc=e, countdown=BREAKER_COOLDOWN)
+        except GatewayError as e:
+            # Resending a payout that may have gone through could pay twice
+            logger.error(f"Disbursement {api_disbursement_id} outcome unknown: {e}")
         except Exception as e:
             logger.exception(f"Error initiating disbursement for {api_disbursement_id}: {e}")
             raise self.retry(exc=e)
@@ -380,51 +447,46 @@ def pay_track_collection_initiate(self, api_collection_id):
                 logger.error(f"Missing phone number or amount for ApiCollection {api_collection_id}.")
                 return
 
-            def format_phone_number(number):
-                digits = re.sub(r'\D', '', number)
-                if re.match(r'^254\d{9}$', digits):
-                    return digits
-                if re.match(r'^0[17]\d{8}$', digits):
-                    return '254' + digits[1:]
-                logger.warning(f"Invalid phone number format: {number}")
-                return None
-
             formatted_number = format_phone_number(phone_number)
             if not formatted_number:
                 logger.error(f"Failed to format phone number: {phone_number}")
+                fail_collection(api_collection, "Invalid M-Pesa number")
                 return
 
-            api_url = os.getenv("PAYTRACK_API_BASE", "https://pay.geninworld.com")
             api_key = os.getenv("PAYTRACK_API_KEY")
 
-            payload = {
-                "amount": str(amount),
-                "request_ref": str(api_collection_id),
-                "currency": "KES",
-                "mpesa_number": formatted_number
-            }
+            payload = paytrack_collection_payload(api_collection, formatted_number)
 
             headers = {
                 "Authorization": f"Bearer {api_key}",
                 "Content-Type": "application/json"
             }
 
-            response = requests.post(f"{api_url}/api/payment_request", headers=headers, json=payload)
+            response = paytrack_gateway.post("/api/payment_request", headers=headers, json=payload)
             try:
                 response_data = response.json()
                 print(response_data)
                 if response.status_code == 202:
                     api_collection.mpesa_checkout_request_id = response_data.get("checkout_request_id")
-                    api_collection.status = "initiated"
-                    push_to_queue(api_collection.user_id, {"state": "pending_confirmation"})
-                    db.session.commit()
+                    api_collection.gateway = PaymentGateway.PAYTRACK
+                    if transition(api_collection, CollectionStatus.INITIATED):
+                        db.session.commit()
+                        publish_status(api_collection)
+                    else:
+                        db.session.commit()  # the callback already settled it; keep the checkout id
                     logger.info(f"Payment request {api_collection_id} successfully initiated: {response_data}")
                 else:
                     logger.error(f"Failed to initiate payment for {api_collection_id}: {response_data}")
+                    fail_collection(api_collection, "Payment request was declined")
             except Exception as e:
                 logger.error(f"Error processing response for {api_collection_id}: {str(e)}")
                 return {"error": "Invalid JSON response", "raw": response.text}
             
+    except GatewayUnavailable as e:
+        raise self.retry(exc=e, countdown=BREAKER_COOLDOWN)
+    except GatewayError as e:
+        # The prompt may have gone out; resending could prompt twice, so leave it to the callback
+        logger.error(f"Payment request {api_collection_id} outcome unknown: {e}")
     except Exception as e:
         logger.exception(f"Error initiating payment for {api_collection_id}: {e}")
         raise self.retry(exc=e)
\ No newline at end of file
@@ -0,0 +1,279 @@
+# workers/payment_dispatcher.py
+"""
+Asyncio dispatcher for reservation payments.
+
+`workers.initiate_stk` ties up a whole prefork Celery process for every STK
+push while it waits on Safaricom, so a flash sale needs dozens of
+processes. With PAYMENT_DISPATCHER=async the reservation endpoints instead
+push `<gateway>:<collection id>` onto the `payments:dispatch` Redis list,
+and this dispatcher (payment_dispatch_worker.py) pops them in batches and
+sends the STK / Paytrack requests concurrently over one aiohttp session,
+with at most `concurrency` requests in flight across all batches.
+
+Each batch is loaded in one query, sent, then written back in one
+transaction that re-reads the rows under FOR UPDATE, so a callback that
+settled a payment in the meantime is never overwritten; events are
+published after the commit. The database, Redis and token calls are
+blocking, so they run in the loop's default executor, each inside its own
+app context (and so its own session); only the HTTP requests run on the
+loop. Requests that never reached the gateway (connection refused, open
+circuit, rejected token) are deferred to `payments:dispatch:deferred` and
+retried after BREAKER_COOLDOWN, until less than STK_WINDOW of the
+collection's hold is left; it is then expired instead of prompted.
+Requests whose outcome is unknown (timeout or 5xx after sending) are not
+resent, since that could prompt the customer twice; their holds expire as
+usual.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from functools import partial
+
+import aiohttp
+
+from models import db, ApiCollection, CollectionStatus, PaymentGateway
+from services.mpesa_token import token_manager
+from services.payment_gateway import (
+    mpesa as mpesa_gateway, paytrack as paytrack_gateway, CONNECT_TIMEOUT, READ_TIMEOUT, BREAKER_COOLDOWN,
+)
+from utils.inventory import release_hold, HOLD_TTL
+from utils.payment_state import transition, publish_status
+from utils.performance_config import record_job_run
+from workers.initiate_mpesa import (
+    format_phone_number, stk_push_payload, paytrack_collection_payload, STK_PUSH_PATH,
+)
+
+logger = logging.getLogger(__name__)
+
+QUEUE_KEY = "payments:dispatch"
+DEFERRED_KEY = "payments:dispatch:deferred"
+
+MPESA = PaymentGateway.MPESA
+PAYTRACK = PaymentGateway.PAYTRACK
+
+# Least hold time left for a prompt to be answered in
+STK_WINDOW = timedelta(minutes=1)
+
+# Outcomes of one request
+INITIATED = "initiated"
+DECLINED = "declined"
+DEFERRED = "deferred"
+UNKNOWN = "unknown"
+EXPIRED = "expired"
+
+
+def enqueue_payment(redis_client, api_collection_id, gateway=MPESA):
+    """Queue a PENDING collection for the dispatcher."""
+    redis_client.rpush(QUEUE_KEY, f"{gateway}:{api_collection_id}")
+
+
+class PaymentDispatcher:
+    """Pops queued collections in batches and initiates their payments concurrently."""
+
+    def __init__(self, app, concurrency=200, batch_size=100, max_batches=4, idle_timeout=1):
+        self.app = app
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.idle_timeout = idle_timeout
+        self.running = False
+
+    def run(self):
+        """Dispatch until stop() is called."""
+        self.running = True
+        asyncio.run(self._run())
+
+    def stop(self):
+        self.running = False
+
+    async def _run(self):
+        self.requests = asyncio.Semaphore(self.concurrency)
+        batches = asyncio.Semaphore(self.max_batches)
+        in_flight = set()
+        connector = aiohttp.TCPConnector(limit=self.concurrency, ttl_dns_cache=300)
+        timeout = aiohttp.ClientTimeout(sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT)
+        logger.info(f"Dispatching payments from '{QUEUE_KEY}' ({self.concurrency} concurrent requests)")
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as http:
+            while self.running:
+                await batches.acquire()
+                try:
+                    entries = await self._next_batch()
+                except Exception as e:
+                    logger.error(f"Payment queue unavailable: {e}")
+                    entries = []
+                    await asyncio.sleep(self.idle_timeout)
+                if not entries:
+                    batches.release()
+                    continue
+                task = asyncio.ensure_future(self._dispatch_batch(http, entries))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+                task.add_done_callback(lambda _: batches.release())
+            if in_flight:
+                await asyncio.wait(in_flight)
+
+    async def _blocking(self, fn, *args):
+        """Run sync database/Redis work in the default executor, inside an app context."""
+        def call():
+            with self.app.app_context():
+                return fn(*args)
+        return await asyncio.get_event_loop().run_in_executor(None, call)
+
+    async def _next_batch(self):
+        return await self._blocking(self._pop_batch)
+
+    def _pop_batch(self):
+        """Up to batch_size entries: due deferred ones first, then the queue (blocking briefly)."""
+        client = self.app.redis
+        now = time.time()
+        entries = client.zrangebyscore(DEFERRED_KEY, 0, now, start=0, num=self.batch_size)
+        if entries:
+            client.zrem(DEFERRED_KEY, *entries)
+        if len(entries) < self.batch_size:
+            entries += client.lpop(QUEUE_KEY, self.batch_size - len(entries)) or []
+        if entries:
+            return entries
+        popped = client.blpop(QUEUE_KEY, timeout=self.idle_timeout)
+        if not popped:
+            return []
+        return [popped[1]] + (client.lpop(QUEUE_KEY, self.batch_size - 1) or [])
+
+    async def _dispatch_batch(self, http, entries):
+        started = time.monotonic()
+        try:
+            # The session is removed with each app context, so none is held across the requests
+            gateways, calls, results = await self._blocking(self._prepare, entries)
+            results += await asyncio.gather(*(self._send(http, *call) for call in calls))
+            counts = await self._blocking(self._apply, gateways, results)
+        except Exception as e:
+            logger.exception(f"Payment batch of {len(entries)} failed: {e}")
+            await self._blocking(partial(record_job_run, "payment_dispatch", time.monotonic() - started, ok=False))
+            return
+        await self._blocking(partial(record_job_run, "payment_dispatch", time.monotonic() - started, result=counts))
+
+    def _prepare(self, entries):
+        """
+        Load the batch's PENDING collections and build their requests. Returns
+        ({collection_id: gateway}, [request args], [results decided without a request]).
+        """
+        gateways = {}
+        for entry in entries:
+            gateway, _, collection_id = entry.partition(":")
+            gateways[collection_id] = gateway
+        collections = (ApiCollection.query
+                       .filter(ApiCollection.id.in_(list(gateways)),
+                               ApiCollection.status == CollectionStatus.PENDING,
+                               ApiCollection.mpesa_checkout_request_id.is_(None))
+                       .all())
+
+        headers = {}
+        if any(gateway == MPESA for gateway in gateways.values()) and mpesa_gateway.breaker.allow():
+            token = token_manager.get_token()
+            if token:
+                headers[MPESA] = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+        if any(gateway == PAYTRACK for gateway in gateways.values()) and paytrack_gateway.breaker.allow():
+            api_key = os.getenv("PAYTRACK_API_KEY")
+            headers[PAYTRACK] = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+
+        calls, results = [], []
+        now = datetime.now(timezone.utc)
+        for api_collection in collections:
+            collection_id = str(api_collection.id)
+            gateway = gateways[collection_id]
+            formatted_number = format_phone_number(api_collection.mpesa_number or "")
+            # Deferred entries stop once the prompt could no longer be answered in time
+            deadline = api_collection.hold_expires_at or api_collection.created_at + HOLD_TTL
+            if deadline - now < STK_WINDOW:
+                results.append((collection_id, EXPIRED, "Payment window expired"))
+            elif not formatted_number or not api_collection.amount:
+                results.append((collection_id, DECLINED, "Invalid M-Pesa number"))
+            elif gateway not in headers:
+                results.append((collection_id, DEFERRED, "gateway unavailable"))
+            elif gateway == MPESA:
+                calls.append((collection_id, gateway, f"{mpesa_gateway.base_url}{STK_PUSH_PATH}", headers[gateway],
+                              stk_push_payload(api_collection, formatted_number)))
+            else:
+                calls.append((collection_id, gateway, f"{paytrack_gateway.base_url}/api/payment_request",
+                              headers[gateway], paytrack_collection_payload(api_collection, formatted_number)))
+        # Don't hold a transaction open while the requests are out
+        db.session.commit()
+        return gateways, calls, results
+
+    async def _send(self, http, collection_id, gateway, url, headers, payload):
+        """Send one request; returns (collection_id, outcome, checkout request id or reason)."""
+        breaker = mpesa_gateway.breaker if gateway == MPESA else paytrack_gateway.breaker
+        async with self.requests:
+            try:
+                async with http.post(url, headers=headers, json=payload) as response:
+                    status = response.status
+                    data = await response.json(content_type=None)
+            except (aiohttp.ClientConnectorError, aiohttp.ConnectionTimeoutError) as e:
+                await self._blocking(breaker.record_failure)
+                logger.warning(f"Payment request {collection_id} not sent: {e}")
+                return collection_id, DEFERRED, str(e)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                await self._blocking(breaker.record_failure)
+                logger.error(f"Payment request {collection_id} outcome unknown: {e!r}")
+                return collection_id, UNKNOWN, str(e)
+
+        if status >= 500:
+            await self._blocking(breaker.record_failure)
+            logger.error(f"Payment request {collection_id} outcome unknown: {gateway} returned {status}")
+            return collection_id, UNKNOWN, f"{gateway} returned {status}"
+        await self._blocking(breaker.record_success)
+        if gateway == MPESA and status == 200:
+            return collection_id, INITIATED, data.get("CheckoutRequestID")
+        if gateway == PAYTRACK and status == 202:
+            return collection_id, INITIATED, data.get("checkout_request_id")
+        if gateway == MPESA and status == 401:
+            # Token revoked before its expiry: drop it and retry with a fresh one
+            await self._blocking(token_manager.invalidate)
+            return collection_id, DEFERRED, "token rejected"
+        logger.error(f"Failed to initiate payment for {collection_id}: {data}")
+        return collection_id, DECLINED, "Payment request was declined"
+
+    def _apply(self, gateways, results):
+        """Write the batch's outcomes in one transaction, then publish them."""
+        counts = {INITIATED: 0, DECLINED: 0, DEFERRED: 0, UNKNOWN: 0, EXPIRED: 0}
+        settled = [result for result in results if result[1] in (INITIATED, DECLINED, EXPIRED)]
+        locked = {}
+        if settled:
+            locked = {str(api_collection.id): api_collection for api_collection in (
+                ApiCollection.query
+                .filter(ApiCollection.id.in_([collection_id for collection_id, _, _ in settled]))
+                .populate_existing()
+                .with_for_update()
+                .all())}
+
+        published, deferred = [], {}
+        for collection_id, outcome, detail in results:
+            counts[outcome] += 1
+            if outcome == DEFERRED:
+                deferred[f"{gateways[collection_id]}:{collection_id}"] = time.time() + BREAKER_COOLDOWN
+                continue
+            api_collection = locked.get(collection_id)
+            if api_collection is None:
+                continue
+            if outcome == INITIATED:
+                api_collection.mpesa_checkout_request_id = detail
+                api_collection.gateway = gateways[collection_id]
+                if transition(api_collection, CollectionStatus.INITIATED):
+                    published.append((api_collection, {}))
+            elif outcome == EXPIRED:
+                if transition(api_collection, CollectionStatus.EXPIRED):
+                    release_hold(db.session, api_collection)
+                    published.append((api_collection, {"error": detail}))
+            elif transition(api_collection, CollectionStatus.FAILED):
+                api_collection.description = detail
+                release_hold(db.session, api_collection)
+                published.append((api_collection, {"error": detail}))
+        db.session.commit()
+
+        if deferred:
+            self.app.redis.zadd(DEFERRED_KEY, deferred)
+        for api_collection, data in published:
+            publish_status(api_collection, **data)
+        return counts
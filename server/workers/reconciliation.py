@@ -0,0 +1,279 @@
+# workers/reconciliation.py
+"""
+Reconciliation of payments whose callback never arrived.
+
+Without a callback an ApiCollection stays PENDING/initiated, so the user's
+event stream never completes. A payout also stays pending. Every few
+minutes `workers.reconcile_payments` walks the unsettled rows older than
+PAYMENT_RECONCILE_AFTER_MINUTES. It reads them in keyset batches on
+(created_at, id), served by the partial `*_unsettled` indexes, and asks
+the gateway the row was sent through (`gateway`) what happened:
+
+* M-Pesa collections with a CheckoutRequestID: STK push query;
+* Paytrack collections and payouts: Paytrack's request status;
+* collections that never got a checkout id (the request was never sent)
+  are failed after UNSENT_FAIL_AFTER;
+* M-Pesa B2C/B2B payouts have no synchronous status API and are only
+  counted, for manual follow-up.
+
+Outcomes go into the callback inbox (workers.callback_inbox). A Paytrack
+status carries the gateway's request_id and receipt, so it is recorded
+under the same idempotency key as Paytrack's own callback and the payment
+settles once whichever arrives first. An STK query result has no receipt,
+so it can't complete a collection: it is recorded under its own
+`reconciled:` key, a failure fails the collection, and a success is left
+for the real callback (which still applies) or manual settlement, and is
+counted as manual. Collections whose hold expired stay in scope, since
+they may have been paid.
+
+Only rows that need a gateway query count against MAX_QUERIES_PER_RUN.
+Each query is recorded on the row (`reconcile_attempts`), and the row is
+not queried again before `next_reconcile_at`, with the wait doubling up
+to MAX_BACKOFF. A row is flagged `needs_review` and left out of later
+runs once it has no automatic outcome: a manual one, a recorded
+`reconciled:` STK entry, or MAX_ATTEMPTS inconclusive queries. Rows that
+never settle therefore can't starve newer ones. The run's aging buckets
+and outcomes are kept with the job stats on /health.
+"""
+
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import tuple_, or_, exists, literal
+
+from celery_app import celery
+from models import db, ApiCollection, ApiDisbursement, CallbackInbox, CollectionStatus, PaymentGateway
+from services.mpesa_token import token_manager
+from services.payment_gateway import mpesa as mpesa_gateway, paytrack as paytrack_gateway, GatewayError
+from workers.callback_inbox import record_callback, MPESA_STK, PAYTRACK
+from workers.initiate_mpesa import stk_password, MPESA_SHORTCODE
+from workers.scheduled import timed_job
+
+logger = logging.getLogger(__name__)
+
+STALE_AFTER = timedelta(minutes=int(os.getenv("PAYMENT_RECONCILE_AFTER_MINUTES", 15)))
+# An STK push that was never confirmed as sent may still have reached the
+# phone; only give up once its callback can no longer come
+UNSENT_FAIL_AFTER = timedelta(hours=1)
+BATCH_SIZE = 100
+MAX_QUERIES_PER_RUN = 200  # older rows are still counted, and queried by the next run
+# Waits between queries of one row: STALE_AFTER, doubling up to MAX_BACKOFF
+MAX_BACKOFF = timedelta(hours=6)
+MAX_ATTEMPTS = 10  # about two days of queries, then manual review
+
+STK_QUERY_PATH = "/mpesa/stkpushquery/v1/query"
+PAYTRACK_STATUS_PATH = "/api/request_status"
+
+UNSETTLED_COLLECTIONS = (CollectionStatus.PENDING, CollectionStatus.INITIATED, CollectionStatus.EXPIRED)
+UNSETTLED_DISBURSEMENTS = ("posted", "pending", "initiated")
+RECONCILED_PREFIX = "reconciled:"
+
+AGE_BUCKETS = ((timedelta(hours=1), "<1h"), (timedelta(hours=6), "1-6h"), (timedelta(hours=24), "6-24h"))
+
+# Outcomes
+RESOLVED = "resolved"
+UNRESOLVED = "unresolved"
+MANUAL = "manual"
+
+
+def _unsettled(session, columns, model, statuses, cutoff, now, conditions=(), batch_size=BATCH_SIZE):
+    """
+    Batches of unsettled rows created before `cutoff` and due for a query at
+    `now`, oldest first, by keyset on (created_at, id).
+    """
+    last = None
+    while True:
+        query = session.query(*columns).filter(
+            model.status.in_(statuses),
+            ~model.needs_review,
+            model.created_at < cutoff,
+            or_(model.next_reconcile_at.is_(None), model.next_reconcile_at <= now),
+            *conditions
+        )
+        if last is not None:
+            query = query.filter(tuple_(model.created_at, model.id) > last)
+        rows = query.order_by(model.created_at, model.id).limit(batch_size).all()
+        if not rows:
+            return
+        yield rows
+        last = (rows[-1].created_at, rows[-1].id)
+        if len(rows) < batch_size:
+            return
+
+
+def query_stk_status(checkout_request_id):
+    """(ResultCode, ResultDesc) of a finished STK push, or None while unknown."""
+    token = token_manager.get_token()
+    if not token:
+        return None
+    password, timestamp = stk_password()
+    try:
+        response = mpesa_gateway.post(STK_QUERY_PATH, headers={"Authorization": f"Bearer {token}"}, json={
+            "BusinessShortCode": MPESA_SHORTCODE,
+            "Password": password,
+            "Timestamp": timestamp,
+            "CheckoutRequestID": checkout_request_id,
+        })
+    except GatewayError as e:
+        # Safaricom also answers 500 while the push is still being processed
+        logger.info(f"STK query for {checkout_request_id} inconclusive: {e}")
+        return None
+    if response.status_code == 401:
+        token_manager.invalidate()
+        return None
+    data = response.json()
+    if response.status_code != 200 or str(data.get("ResponseCode")) != "0" or data.get("ResultCode") is None:
+        return None
+    return int(data["ResultCode"]), data.get("ResultDesc")
+
+
+def query_paytrack_status(request_ref):
+    """Paytrack's view of a request, shaped like its callback events, or None."""
+    try:
+        response = paytrack_gateway.get(PAYTRACK_STATUS_PATH, params={"request_ref": str(request_ref)},
+                                        headers={"Authorization": f"Bearer {os.getenv('PAYTRACK_API_KEY')}"})
+    except GatewayError as e:
+        logger.info(f"Paytrack status for {request_ref} unavailable: {e}")
+        return None
+    if response.status_code != 200:
+        return None
+    return response.json()
+
+
+def reconcile_collection(row, now):
+    if not row.mpesa_checkout_request_id:
+        if now - row.created_at < UNSENT_FAIL_AFTER:
+            return UNRESOLVED
+        payload = {"Body": {"stkCallback": {"ResultCode": 1, "ResultDesc": "Payment was never initiated"}},
+                   "reconciled": True}
+        record_callback(MPESA_STK, payload, target_id=row.id, key=f"unsent:{row.id}")
+        return RESOLVED
+    if row.gateway == PaymentGateway.PAYTRACK:
+        return reconcile_paytrack(row, "COLLECTION")
+
+    status = query_stk_status(row.mpesa_checkout_request_id)
+    if status is None:
+        return UNRESOLVED
+    result_code, result_desc = status
+    payload = {"Body": {"stkCallback": {
+        "CheckoutRequestID": row.mpesa_checkout_request_id,
+        "ResultCode": result_code,
+        "ResultDesc": result_desc,
+    }}, "reconciled": True}
+    # Not the callback's key: that one must stay free for the callback carrying the receipt
+    record_callback(MPESA_STK, payload, target_id=row.id, key=f"{RECONCILED_PREFIX}{row.mpesa_checkout_request_id}")
+    return MANUAL if result_code == 0 else RESOLVED
+
+
+def reconcile_disbursement(row):
+    if row.gateway == PaymentGateway.PAYTRACK:
+        return reconcile_paytrack(row, "DISBURSEMENT")
+    return MANUAL  # M-Pesa B2C/B2B results only arrive on the result URL
+
+
+def reconcile_paytrack(row, event_type):
+    """Record Paytrack's view of a collection or payout (request_ref is the row id)."""
+    data = query_paytrack_status(row.id)
+    if not data or data.get("status") not in ("success", "failed"):
+        return UNRESOLVED
+    payload = {**data, "event_type": event_type, "request_ref": str(row.id), "reconciled": True}
+    key = None if data.get("request_id") else f"{RECONCILED_PREFIX}{row.id}"
+    record_callback(PAYTRACK, payload, target_id=row.id, key=key)
+    return RESOLVED
+
+
+def _record_attempt(session, model, row, outcome, now):
+    """
+    Count a query of `row` and schedule the next one; returns True when the
+    row is flagged for manual review instead.
+    """
+    attempts = row.reconcile_attempts + 1
+    backoff = min(STALE_AFTER * 2 ** (attempts - 1), MAX_BACKOFF)
+    flagged = outcome == MANUAL or attempts >= MAX_ATTEMPTS
+    session.query(model).filter(model.id == row.id).update({
+        model.reconcile_attempts: attempts,
+        model.next_reconcile_at: now + backoff,
+        model.needs_review: flagged,
+    }, synchronize_session=False)
+    session.commit()
+    if flagged:
+        logger.warning(f"{model.__name__} {row.id} needs manual review after {attempts} reconciliation attempts "
+                       f"({outcome})")
+    return flagged
+
+
+def _age_bucket(age):
+    for limit, name in AGE_BUCKETS:
+        if age < limit:
+            return name
+    return ">24h"
+
+
+def reconcile(session, now=None):
+    """Query the gateways for stale unsettled payments. Returns aging and outcome counts per kind."""
+    now = now or datetime.now(timezone.utc)
+    cutoff = now - STALE_AFTER
+    budget = MAX_QUERIES_PER_RUN
+    report = {}
+
+    # An STK result already recorded by reconciliation can't be improved on by querying again
+    stk_reconciled = exists().where(
+        CallbackInbox.source == MPESA_STK,
+        CallbackInbox.idempotency_key == literal(RECONCILED_PREFIX) + ApiCollection.mpesa_checkout_request_id,
+    )
+    kinds = (
+        ("collections", ApiCollection, UNSETTLED_COLLECTIONS, (~stk_reconciled,),
+         (ApiCollection.id, ApiCollection.created_at, ApiCollection.mpesa_checkout_request_id,
+          ApiCollection.gateway, ApiCollection.reconcile_attempts),
+         lambda row: row.mpesa_checkout_request_id is not None,
+         lambda row: reconcile_collection(row, now)),
+        ("disbursements", ApiDisbursement, UNSETTLED_DISBURSEMENTS, (),
+         (ApiDisbursement.id, ApiDisbursement.created_at, ApiDisbursement.gateway,
+          ApiDisbursement.reconcile_attempts),
+         lambda row: row.gateway == PaymentGateway.PAYTRACK,
+         reconcile_disbursement),
+    )
+    for kind, model, statuses, conditions, columns, queries_gateway, reconcile_row in kinds:
+        aging = {name: 0 for _, name in AGE_BUCKETS}
+        aging[">24h"] = 0
+        stats = {"stale": 0, "oldest_minutes": 0, RESOLVED: 0, UNRESOLVED: 0, MANUAL: 0, "skipped": 0,
+                 "flagged": 0, "aging": aging}
+        for rows in _unsettled(session, columns, model, statuses, cutoff, now, conditions):
+            for row in rows:
+                age = now - row.created_at
+                stats["stale"] += 1
+                stats["oldest_minutes"] = max(stats["oldest_minutes"], int(age.total_seconds() // 60))
+                stats["aging"][_age_bucket(age)] += 1
+                queried = queries_gateway(row)
+                if queried:
+                    if budget <= 0:
+                        stats["skipped"] += 1
+                        continue
+                    budget -= 1
+                try:
+                    outcome = reconcile_row(row)
+                except Exception as e:
+                    session.rollback()
+                    outcome = UNRESOLVED
+                    logger.exception(f"Reconciling {kind[:-1]} {row.id} failed: {e}")
+                stats[outcome] += 1
+                if queried or outcome == MANUAL:
+                    stats["flagged"] += _record_attempt(session, model, row, outcome, now)
+        stats["needs_review"] = (session.query(model.id)
+                                 .filter(model.status.in_(statuses), model.needs_review)
+                                 .count())
+        report[kind] = stats
+        if stats["stale"] or stats["needs_review"]:
+            logger.info(f"Reconciled {kind}: {stats}")
+    return report
+
+
+@celery.task(name="workers.reconcile_payments")
+def reconcile_payments():
+    """Settle payments whose gateway callback was lost."""
+    with current_app.app_context():
+        with timed_job("reconcile_payments") as job:
+            job["result"] = reconcile(db.session)
+    return job["result"]
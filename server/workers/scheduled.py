@@ -0,0 +1,62 @@
+import logging
+import time
+from contextlib import contextmanager
+
+from celery.signals import worker_ready
+from celery_app import celery
+from flask import current_app
+from models import db
+from utils.performance_config import CacheWarmer, QueryOptimizer, record_job_run
+from utils.inventory import release_expired_holds as release_holds
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def timed_job(name):
+    """Report the duration and outcome of a periodic job; the body sets job['result']."""
+    job = {"result": None}
+    started = time.monotonic()
+    try:
+        yield job
+    except Exception:
+        record_job_run(name, time.monotonic() - started, ok=False)
+        raise
+    record_job_run(name, time.monotonic() - started, result=job["result"])
+
+
+@celery.task(name="workers.reconcile_catalogue")
+def reconcile_catalogue():
+    """Reconcile the summary read model and Redis search indexes, then re-warm the caches."""
+    with current_app.app_context():
+        with timed_job("reconcile_catalogue") as job:
+            job["result"] = QueryOptimizer.refresh_read_models(db)
+    warm_catalogue_caches.delay()
+    return job["result"]
+
+
+@celery.task(name="workers.warm_catalogue_caches")
+def warm_catalogue_caches():
+    """Refresh trending, first list pages and top detail pages ahead of their expiry."""
+    with current_app.app_context():
+        with timed_job("warm_catalogue_caches") as job:
+            job["result"] = CacheWarmer().warm_all()
+    return job["result"]
+
+
+@celery.task(name="workers.release_expired_holds")
+def release_expired_holds():
+    """Return the places of inventory holds whose payment never called back."""
+    with current_app.app_context():
+        with timed_job("release_expired_holds") as job:
+            job["result"] = release_holds(db.session)
+    return job["result"]
+
+
+@worker_ready.connect
+def warm_after_deploy(sender=None, **kwargs):
+    """A fresh deploy starts with cold local tiers and possibly flushed keys."""
+    try:
+        warm_catalogue_caches.delay()
+    except Exception as e:
+        logger.warning(f"Could not queue startup cache warming: {e}")
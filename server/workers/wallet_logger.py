@@ -7,14 +7,20 @@ from sqlalchemy.exc import SQLAlchemyError
 from typing import Optional
 from workers.email_worker import send_reservation_email_async
 from sqlalchemy import func
+from utils.trending import record_booking
+from utils.inventory import book_places
 # from utils.tarrifs import get_b2c_business_charge, get_b2b_business_charge, get_original_b2b_amount, get_original_b2c_value
 
 logger = logging.getLogger(__name__)
 
 @celery.task(bind=True, name="workers.reservation_create", max_retries=3, default_retry_delay=30)
-def logg_wallet(self, slot_id, user_id, quantity, amount_paid, status, transaction_ref, reservation_id=None, mpesa_number=None):
+def logg_wallet(self, slot_id, user_id, quantity, amount_paid, status, transaction_ref, reservation_id=None, mpesa_number=None, inventory_held=False):
     """
     Celery task to log a wallet transaction using the passed parameters.
+    `inventory_held` means the places were already booked by the collection's
+    hold (utils.inventory), so the slot is not incremented again. Otherwise
+    the places are booked only if still free; a payment for places sold in
+    the meantime is kept as a cancelled reservation with a pending refund.
     """
     try:
         with current_app.app_context():
@@ -24,6 +30,11 @@ def logg_wallet(self, slot_id, user_id, quantity, amount_paid, status, transacti
             except (InvalidOperation, TypeError):
                 raise ValueError(f"Invalid amount_paid: {amount_paid}")
 
+            # Follow-ups may be delivered more than once (workers.callback_inbox)
+            if db.session.query(ReservationTxn.id).filter_by(transaction_reference=transaction_ref).first():
+                logger.info(f"Wallet transaction {transaction_ref} already logged")
+                return
+
             # Fetch slot and experience
             slot = db.session.get(Slot, slot_id)
             if not slot:
@@ -38,6 +49,7 @@ def logg_wallet(self, slot_id, user_id, quantity, amount_paid, status, transacti
             payment_type = "mpesa"  # Assuming payment is always via M-Pesa for this task
 
             platform_fee = amount * Decimal("0.05")
+            sold_out = False
 
             
             if reservation_id:
@@ -65,9 +77,22 @@ def logg_wallet(self, slot_id, user_id, quantity, amount_paid, status, transacti
                 db.session.flush()  # get reservation.id before txn
                 
                 # update the slot availability
-                if slot.capacity < quantity:
-                    raise ValueError(f"Not enough available spots in slot {slot_id}")
-                slot.booked += quantity
+                if not inventory_held and not book_places(db.session, slot_id, quantity):
+                    # Paid after the places were sold (e.g. an expired hold was resold):
+                    # record the payment, but queue a refund instead of overbooking
+                    sold_out = True
+                    reservation.status = "cancelled"
+                    db.session.add(ReservationRefund(
+                        reservation_id=reservation.id,
+                        experience_id=slot.experience_id,
+                        user_id=user_id,
+                        requested_amount=amount,
+                        mpesa_number=mpesa_number or "",
+                        status="pending",
+                        reason="Slot sold out before the payment was confirmed",
+                    ))
+                    logger.error(f"Slot {slot_id} sold out before payment {transaction_ref} was confirmed; "
+                                 f"reservation {reservation.id} queued for refund")
 
             # Log transaction
             reservation_txn = ReservationTxn(
@@ -116,7 +141,15 @@ def logg_wallet(self, slot_id, user_id, quantity, amount_paid, status, transacti
             except Exception:
                 pass
             
-            send_reservation_email_async.delay(reservation.id)
+            # New bookings (not installments on an existing one) feed trending
+            if not reservation_id and not sold_out:
+                try:
+                    record_booking(slot.experience_id, quantity)
+                except Exception as e:
+                    logger.warning(f"Trending score update failed for experience {slot.experience_id}: {e}")
+            
+            if not sold_out:
+                send_reservation_email_async.delay(reservation.id)
             
             
             create_ledger.delay(
@@ -166,6 +199,10 @@ def wallet_settlement(self, user_id, amount, checkout_id, transaction_ref, servi
             except (InvalidOperation, TypeError):
                 raise ValueError(f"Invalid amount or fee: amount={amount}, fee={service_fee}")
 
+            if db.session.query(SettlementTxn.id).filter_by(txn_id=transaction_ref).first():
+                logger.info(f"Settlement {transaction_ref} already logged")
+                return
+
             user = db.session.get(User, user_id)
             if not user:
                 raise ValueError(f"User not found: {user_id}")
@@ -244,6 +281,9 @@ def refund_settlement(self, user_id, refund_id, transaction_ref, service_fee=0,
             refund = db.session.get(ReservationRefund, refund_id)
             if not refund:
                 raise ValueError(f"Refund not found: {refund_id}")
+            if refund.status == "approved":
+                logger.info(f"Refund {refund_id} already settled")
+                return
 
             # Mark refund attempt
             refund.transaction_reference = transaction_ref
@@ -296,7 +336,8 @@ def refund_settlement(self, user_id, refund_id, transaction_ref, service_fee=0,
             refund.status = "approved"
             # refund.processed_at = db
             reservation.revocked = True
-            slot.booked -= reservation.quantity
+            if reservation.status != "cancelled":  # sold-out payments never booked places
+                slot.booked -= reservation.quantity
 
             user_wallet.balance -= amount + Decimal(service_fee)
 